@@ -1,15 +1,38 @@
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, url_for, g
 from flask_pymongo import PyMongo
+from flask_pymongo.helpers import BSONObjectIdConverter, BSONProvider
+import click
 from flask_cors import CORS
 from dotenv import load_dotenv
-import anthropic # Import the anthropic library
 import json # To parse potential JSON in Claude's response
-import requests # Import requests library
 from bson.objectid import ObjectId # Needed for potential future lookups by ID
-from datetime import datetime # Added for timestamp
-import traceback # Import traceback
+from bson.errors import InvalidId
+from datetime import datetime, timedelta # Added for timestamp
+import logging
 from pymongo import errors # Import errors module
+import base64 # Opaque pagination cursors
+import hashlib # Content-addressed cache keys
+import contextlib
+import copy
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED # Run per-angle generation concurrently
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import queue # Hand streamed events from generation workers to the SSE response
+import threading
+import time
+from cache import TTLCache, MongoCache, TieredCache, MISSING
+from search_client import BraveSearchClient, SearchError, BRAVE_SEARCH_URL
+import indexes
+import similarity
+import stylometry
+from ingest import (IngestError, CorpusTooLarge, iter_stream_lines, iter_ndjson_posts, iter_text_posts,
+                    iter_post_chunks, collect_chunks)
+from jobs import JobQueue, job_to_json, JOB_QUEUED, TERMINAL_STATES
+from observability import configure_logging, timed, observe_stage, record_tokens, observe_request, render_metrics
+from rate_limit import AnthropicGovernor, GovernorTimeout, PRIORITY_BATCH, PRIORITY_INTERACTIVE, estimate_input_tokens
+from clients import LazyClient, LazyProxy
+from singleflight import SingleFlight, MongoLease
 
 load_dotenv() # Load environment variables from .env file
 
@@ -18,57 +41,396 @@ CORS(app) # Enable CORS for all routes
 
 # --- Configuration ---
 app.config["MONGO_URI"] = os.getenv("MONGO_URI")
+app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
 app.config["ANTHROPIC_API_KEY"] = os.getenv("ANTHROPIC_API_KEY")
 app.config["BRAVE_SEARCH_API_KEY"] = os.getenv("BRAVE_SEARCH_API_KEY") # Load Brave Key
+# API endpoints, overridable to point at proxies or at the local fakes used by bench/
+app.config["ANTHROPIC_BASE_URL"] = os.getenv("ANTHROPIC_BASE_URL") # None = Anthropic's default
+app.config["BRAVE_SEARCH_URL"] = os.getenv("BRAVE_SEARCH_URL", BRAVE_SEARCH_URL)
+# Max number of angles searched + generated in parallel for a single /api/generate-post request
+app.config["GENERATION_CONCURRENCY"] = int(os.getenv("GENERATION_CONCURRENCY", 3))
+# Angles accepted per generation request (extra ones are ignored), and searches started ahead of
+# need: the angles of the current wave plus this many fallback angles
+app.config["GENERATION_MAX_ANGLES"] = int(os.getenv("GENERATION_MAX_ANGLES", 10))
+app.config["SEARCH_FALLBACK_WINDOW"] = int(os.getenv("SEARCH_FALLBACK_WINDOW", 1))
+# Multi-style fan-out (/api/generate-post/multi): styles per request, Claude calls in flight per request
+app.config["MULTI_STYLE_MAX_STYLES"] = int(os.getenv("MULTI_STYLE_MAX_STYLES", 10))
+app.config["MULTI_STYLE_CONCURRENCY"] = int(os.getenv("MULTI_STYLE_CONCURRENCY", 6))
+# Style analysis cache (in-process LRU in front of a shared Mongo collection with a TTL index)
+app.config["ANALYSIS_CACHE_TTL_SECONDS"] = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+app.config["ANALYSIS_CACHE_MAX_ENTRIES"] = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", 256))
+app.config["ANALYSIS_CACHE_MONGO"] = os.getenv("ANALYSIS_CACHE_MONGO", "true").lower() in ("1", "true", "yes")
+# Local stylometry (see stylometry.py): measured features are sent to Claude as hints, and the
+# posts themselves only up to ANALYSIS_SAMPLE_CHARS (a sample spread over the corpus; 0 = all)
+app.config["ANALYSIS_STYLOMETRY_HINTS"] = os.getenv("ANALYSIS_STYLOMETRY_HINTS", "true").lower() in ("1", "true", "yes")
+app.config["ANALYSIS_SAMPLE_CHARS"] = int(os.getenv("ANALYSIS_SAMPLE_CHARS", 12000))
+# Incremental style refinement (PATCH /api/styles/<id>/posts): posts per request, earlier analyses kept per style
+app.config["STYLE_REFINE_MAX_POSTS"] = int(os.getenv("STYLE_REFINE_MAX_POSTS", 100))
+app.config["STYLE_HISTORY_MAX"] = int(os.getenv("STYLE_HISTORY_MAX", 10))
+# Per-post features stored per style (the newest ones); the stylometry summary covers these posts
+app.config["STYLE_MAX_STORED_POSTS"] = int(os.getenv("STYLE_MAX_STORED_POSTS", 500))
+# Brave Search result cache (in-process LRU, optionally backed by a shared Mongo collection)
+app.config["SEARCH_CACHE_TTL_SECONDS"] = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", 6 * 3600))
+app.config["SEARCH_CACHE_NEGATIVE_TTL_SECONDS"] = int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL_SECONDS", 300))
+app.config["SEARCH_CACHE_MAX_ENTRIES"] = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 1024))
+app.config["SEARCH_CACHE_MONGO"] = os.getenv("SEARCH_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+# Style profile cache (in-process, per style id) for the generation hot path
+app.config["STYLE_CACHE_TTL_SECONDS"] = int(os.getenv("STYLE_CACHE_TTL_SECONDS", 300))
+app.config["STYLE_CACHE_MAX_ENTRIES"] = int(os.getenv("STYLE_CACHE_MAX_ENTRIES", 512))
+# Invalidate cached styles from a MongoDB change stream (needs a replica set; for multi-process deployments)
+app.config["STYLE_CACHE_CHANGE_STREAM"] = os.getenv("STYLE_CACHE_CHANGE_STREAM", "false").lower() in ("1", "true", "yes")
+# Brave Search HTTP client (connection pool, retries on 429/5xx, circuit breaker)
+app.config["SEARCH_TIMEOUT_SECONDS"] = float(os.getenv("SEARCH_TIMEOUT_SECONDS", 10))
+app.config["SEARCH_POOL_MAX_CONNECTIONS"] = int(os.getenv("SEARCH_POOL_MAX_CONNECTIONS", 20))
+app.config["SEARCH_POOL_MAX_KEEPALIVE"] = int(os.getenv("SEARCH_POOL_MAX_KEEPALIVE", 10))
+app.config["SEARCH_MAX_RETRIES"] = int(os.getenv("SEARCH_MAX_RETRIES", 2))
+app.config["SEARCH_CIRCUIT_FAILURE_THRESHOLD"] = int(os.getenv("SEARCH_CIRCUIT_FAILURE_THRESHOLD", 5))
+app.config["SEARCH_CIRCUIT_RESET_SECONDS"] = float(os.getenv("SEARCH_CIRCUIT_RESET_SECONDS", 30))
+# Search/generation pipelining: searches run on a shared pool of SEARCH_WORKERS threads, started as
+# soon as a request (or a prefetch) arrives; an angle waits at most SEARCH_DEADLINE_SECONDS for its
+# snippets before generating without them (0 = wait for the search however long it takes)
+app.config["SEARCH_WORKERS"] = int(os.getenv("SEARCH_WORKERS", 16))
+app.config["SEARCH_DEADLINE_SECONDS"] = float(os.getenv("SEARCH_DEADLINE_SECONDS", 4))
+app.config["SEARCH_PREFETCH_MAX_QUERIES"] = int(os.getenv("SEARCH_PREFETCH_MAX_QUERIES", 5))
+# Batch style analysis (/api/analyze-style/batch)
+app.config["ANALYSIS_BATCH_MAX_ITEMS"] = int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", 50))
+app.config["ANALYSIS_BATCH_CONCURRENCY"] = int(os.getenv("ANALYSIS_BATCH_CONCURRENCY", 4))
+# Streamed corpus ingestion (/api/analyze-style/ingest): chunk size in characters, parallel chunk analyses
+app.config["INGEST_CHUNK_CHARS"] = int(os.getenv("INGEST_CHUNK_CHARS", 12000))
+app.config["INGEST_CONCURRENCY"] = int(os.getenv("INGEST_CONCURRENCY", 3))
+app.config["INGEST_MAX_CHUNKS"] = int(os.getenv("INGEST_MAX_CHUNKS", 40))
+app.config["INGEST_MAX_BYTES"] = int(os.getenv("INGEST_MAX_BYTES", 10 * 1024 * 1024)) # Checked against Content-Length
+# Saved drafts listing (GET /api/drafts)
+app.config["DRAFTS_PAGE_SIZE"] = int(os.getenv("DRAFTS_PAGE_SIZE", 20))
+app.config["DRAFTS_MAX_PAGE_SIZE"] = int(os.getenv("DRAFTS_MAX_PAGE_SIZE", 100))
+app.config["DRAFTS_SEARCH_MAX_RESULTS"] = int(os.getenv("DRAFTS_SEARCH_MAX_RESULTS", 1000)) # Deepest ranked search page offset
+app.config["DRAFTS_BULK_MAX_ITEMS"] = int(os.getenv("DRAFTS_BULK_MAX_ITEMS", 100)) # POST /api/drafts/bulk, DELETE /api/drafts
+# Create missing MongoDB indexes when the server starts (also available as `flask ensure-indexes`)
+app.config["ENSURE_INDEXES_ON_STARTUP"] = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Background job queue (Prefer: respond-async / POST /api/jobs)
+app.config["JOB_WORKERS"] = int(os.getenv("JOB_WORKERS", 4))
+app.config["JOB_LEASE_SECONDS"] = int(os.getenv("JOB_LEASE_SECONDS", 600)) # Running jobs older than this are re-run
+app.config["JOB_EVENTS_POLL_SECONDS"] = float(os.getenv("JOB_EVENTS_POLL_SECONDS", 1))
+app.config["JOB_EVENTS_TIMEOUT_SECONDS"] = float(os.getenv("JOB_EVENTS_TIMEOUT_SECONDS", 600))
+# Anthropic rate limits per process (0 = unlimited); defaults are the Tier 1 limits, adjusted
+# from the API's rate-limit headers once responses come in (see rate_limit.py)
+app.config["ANTHROPIC_REQUESTS_PER_MINUTE"] = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", 50))
+app.config["ANTHROPIC_INPUT_TOKENS_PER_MINUTE"] = int(os.getenv("ANTHROPIC_INPUT_TOKENS_PER_MINUTE", 20000))
+app.config["ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE"] = int(os.getenv("ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE", 8000))
+app.config["ANTHROPIC_RATE_LIMIT_FROM_HEADERS"] = os.getenv("ANTHROPIC_RATE_LIMIT_FROM_HEADERS", "true").lower() in ("1", "true", "yes")
+app.config["ANTHROPIC_MAX_WAIT_SECONDS"] = float(os.getenv("ANTHROPIC_MAX_WAIT_SECONDS", 120)) # Then the call fails with 429
+app.config["ANTHROPIC_RATE_LIMIT_RETRIES"] = int(os.getenv("ANTHROPIC_RATE_LIMIT_RETRIES", 3)) # 429/529 and transient errors
+
+# Near-duplicate drafts (similarity.py): estimated Jaccard similarity of word 3-shingles at or above
+# which two drafts count as duplicates; duplicates within one generation are dropped and replaced
+app.config["DRAFT_DUPLICATE_THRESHOLD"] = float(os.getenv("DRAFT_DUPLICATE_THRESHOLD", 0.5))
+app.config["DRAFT_DEDUP_AT_GENERATION"] = os.getenv("DRAFT_DEDUP_AT_GENERATION", "true").lower() in ("1", "true", "yes")
+app.config["DRAFT_DUPLICATE_MAX_CANDIDATES"] = int(os.getenv("DRAFT_DUPLICATE_MAX_CANDIDATES", 50)) # Saved drafts checked per save
+# Drafts generated to replace near-duplicates dropped in one request (beyond it, duplicates are kept)
+app.config["DRAFT_DUPLICATE_MAX_REGENERATIONS"] = int(os.getenv("DRAFT_DUPLICATE_MAX_REGENERATIONS", 2))
+
+# Single-flight: identical analyses / generations in flight at the same time share one Claude call.
+# With SINGLE_FLIGHT_MONGO the coalescing also spans processes through lease documents.
+app.config["SINGLE_FLIGHT_MONGO"] = os.getenv("SINGLE_FLIGHT_MONGO", "false").lower() in ("1", "true", "yes")
+app.config["SINGLE_FLIGHT_LEASE_SECONDS"] = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", 180)) # Longer than the slowest call
+app.config["SINGLE_FLIGHT_POLL_SECONDS"] = float(os.getenv("SINGLE_FLIGHT_POLL_SECONDS", 0.25))
+
+# Logging: DEBUG also logs prompts and raw search results; LOG_FORMAT=json for one JSON object per line
+app.config["LOG_LEVEL"] = os.getenv("LOG_LEVEL", "INFO")
+app.config["LOG_FORMAT"] = os.getenv("LOG_FORMAT", "text")
+
+configure_logging(app.config["LOG_LEVEL"], app.config["LOG_FORMAT"])
+logger = logging.getLogger(__name__)
+
+# --- Clients (created on first use, see clients.py) ---
+# Importing this module must stay cheap: no connections, no client construction and no
+# `import anthropic` (~1s) until a request needs them. Required settings are checked in create_app().
+REQUIRED_SETTINGS = ("MONGO_URI", "ANTHROPIC_API_KEY") # Brave key is optional, searches are skipped without it
+
+# What PyMongo.init_app installs; done up front so JSON encoding does not change once Mongo is first used
+app.url_map.converters["ObjectId"] = BSONObjectIdConverter
+app.json = BSONProvider(app)
+
+def connect_mongo():
+    # Fail fast (readiness probes, requests) instead of blocking 30s when MongoDB is unreachable
+    return PyMongo(app, serverSelectionTimeoutMS=app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"])
+
+mongo = LazyProxy(connect_mongo) # Use like PyMongo: mongo.db, mongo.cx
+
+def create_anthropic_client():
+    import anthropic # Deferred: the SDK is the single most expensive import of the backend
+    api_key_loaded = app.config.get("ANTHROPIC_API_KEY")
+    if not api_key_loaded:
+        logger.error("ANTHROPIC_API_KEY not found in app config.")
+        return None
+    logger.debug(f"Initializing Anthropic client with key starting with: {api_key_loaded[:5]}...")
+    client = anthropic.Anthropic(
+        api_key=api_key_loaded,
+        base_url=app.config["ANTHROPIC_BASE_URL"],
+        max_retries=0, # The governor retries (after its pauses); SDK retries would bypass and multiply them
+        # Every response feeds its rate-limit headers to the governor
+        http_client=anthropic.DefaultHttpxClient(event_hooks={"response": [anthropic_governor.observe_response]}),
+    )
+    logger.info("Anthropic client initialized successfully.")
+    return client
+
+anthropic_holder = LazyClient(create_anthropic_client)
+
+def create_anthropic_governor():
+    return AnthropicGovernor(
+        requests_per_minute=app.config["ANTHROPIC_REQUESTS_PER_MINUTE"],
+        input_tokens_per_minute=app.config["ANTHROPIC_INPUT_TOKENS_PER_MINUTE"],
+        output_tokens_per_minute=app.config["ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE"],
+        max_wait=app.config["ANTHROPIC_MAX_WAIT_SECONDS"],
+        max_retries=app.config["ANTHROPIC_RATE_LIMIT_RETRIES"],
+        adapt_to_headers=app.config["ANTHROPIC_RATE_LIMIT_FROM_HEADERS"],
+        on_wait=lambda seconds: observe_stage("anthropic_rate_limit_wait", seconds),
+    )
+
+# Shared by every Anthropic call in the process (request threads, job workers, batch fan-outs)
+anthropic_governor = LazyProxy(create_anthropic_governor)
+
+def create_message(stage, priority=PRIORITY_INTERACTIVE, **request_kwargs):
+    """messages.create through the rate-limit governor: waits for capacity (interactive calls
+    first) and retries 429/529 after their retry-after. `stage` times the API call itself."""
+    def send(**kwargs):
+        with timed(stage):
+            return get_anthropic_client().messages.create(**kwargs)
+    return anthropic_governor.call(send, request_kwargs, priority)
+
+def get_anthropic_client():
+    """The shared Anthropic client, created on first use; None if it cannot be initialized."""
+    try:
+        return anthropic_holder.get()
+    except Exception as e:
+        logger.critical(f"Error initializing Anthropic client ({type(e).__name__}): {e.args}", exc_info=True)
+        return None
 
-if not app.config["MONGO_URI"]:
-    raise ValueError("No MONGO_URI set for Flask application")
-if not app.config["ANTHROPIC_API_KEY"]:
-    raise ValueError("No ANTHROPIC_API_KEY set for Flask application")
-# Note: Brave key is optional for now, the function will handle its absence
+def create_brave_client():
+    # Shared for the whole process so connections to Brave are pooled and kept alive
+    return BraveSearchClient(
+        api_key=app.config["BRAVE_SEARCH_API_KEY"],
+        url=app.config["BRAVE_SEARCH_URL"],
+        timeout=app.config["SEARCH_TIMEOUT_SECONDS"],
+        max_connections=app.config["SEARCH_POOL_MAX_CONNECTIONS"],
+        max_keepalive_connections=app.config["SEARCH_POOL_MAX_KEEPALIVE"],
+        max_retries=app.config["SEARCH_MAX_RETRIES"],
+        failure_threshold=app.config["SEARCH_CIRCUIT_FAILURE_THRESHOLD"],
+        reset_timeout=app.config["SEARCH_CIRCUIT_RESET_SECONDS"],
+    )
+
+brave_holder = LazyClient(create_brave_client)
+
+def get_brave_client():
+    return brave_holder.get()
+
+def __getattr__(name):
+    # Module-level access to the lazy clients (app.anthropic_client, app.brave_client) still works
+    if name == "anthropic_client":
+        return get_anthropic_client()
+    if name == "brave_client":
+        return get_brave_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def create_app(config=None, start_services=False):
+    """Application factory for servers and tests: applies `config` on top of the environment
+    settings, checks the required ones and returns the app.
+
+    The backend keeps process-wide state (caches, job queue, clients), so there is one app per
+    process. The objects sized from settings at import are rebuilt in place with the final
+    settings (apply_settings); clients are only created on first use, with the settings by then.
+    start_services=True also runs start_background_services(), for the development server
+    (flask --app 'app:create_app(start_services=True)' run); gunicorn starts them per worker instead.
+    """
+    if config:
+        app.config.update(config)
+    missing = [key for key in REQUIRED_SETTINGS if not app.config.get(key)]
+    if missing:
+        raise ValueError(f"No {', '.join(missing)} set for Flask application")
+    apply_settings()
+    if start_services and serves_requests():
+        start_background_services()
+    return app
+
+# --- Style Analysis Cache ---
+ANALYSIS_MODEL = "claude-3-7-sonnet-20250219" # Use specific Sonnet 3.7 model ID
+# Bump whenever the analysis prompt changes so stale cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = "2"
+# Analysis modes: "full" asks Claude (with local stylometry hints), "fast" is local only
+ANALYSIS_MODE_FULL = "full"
+ANALYSIS_MODE_FAST = "fast"
+ANALYSIS_MODES = (ANALYSIS_MODE_FULL, ANALYSIS_MODE_FAST)
+
+def analysis_cache_tiers():
+    """(memory, mongo) tiers of the analysis cache for the current settings."""
+    return (
+        TTLCache(max_entries=app.config["ANALYSIS_CACHE_MAX_ENTRIES"], ttl=app.config["ANALYSIS_CACHE_TTL_SECONDS"]),
+        MongoCache(lambda: mongo.db.analysis_cache, ttl=app.config["ANALYSIS_CACHE_TTL_SECONDS"])
+        if app.config["ANALYSIS_CACHE_MONGO"] else None,
+    )
+
+analysis_cache = TieredCache("analysis", *analysis_cache_tiers())
+
+def normalize_posts_text(posts_text):
+    """Collapses whitespace differences that do not change the posts (line endings, runs of spaces)."""
+    text = posts_text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def analysis_cache_key(posts_text):
+    """Content-addressed key: hash of the whitespace-normalized posts plus model, prompt version
+    and the settings that shape the prompt (stylometry hints, sample size)."""
+    normalized = normalize_posts_text(posts_text)
+    prompt_settings = f"hints={app.config['ANALYSIS_STYLOMETRY_HINTS']},sample={app.config['ANALYSIS_SAMPLE_CHARS']}"
+    digest = hashlib.sha256(f"{ANALYSIS_MODEL}\n{ANALYSIS_PROMPT_VERSION}\n{prompt_settings}\n{normalized}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# --- Single-Flight Coalescing (see singleflight.py) ---
+def single_flight_lease():
+    """Cross-process lease of the single-flight coalescing, or None (SINGLE_FLIGHT_MONGO)."""
+    if not app.config["SINGLE_FLIGHT_MONGO"]:
+        return None
+    return MongoLease(lambda: mongo.db.single_flight,
+                      lease_seconds=app.config["SINGLE_FLIGHT_LEASE_SECONDS"],
+                      poll_interval=app.config["SINGLE_FLIGHT_POLL_SECONDS"])
+
+single_flight = SingleFlight(single_flight_lease())
+
+def analyze_posts(posts_text, priority=PRIORITY_INTERACTIVE, cache_key=None, features=None):
+    """Cached, coalesced style analysis. Returns (analysis, cached); `cached` is True when this
+    caller made no Claude call (cache hit, or shared the result of an identical call in flight).
+    `features` are the corpus stylometry features, if the caller already computed them."""
+    cache_key = cache_key or analysis_cache_key(posts_text)
+    analysis_result = analysis_cache.get(cache_key)
+    if analysis_result is not MISSING:
+        logger.info(f"Style analysis cache hit for key {cache_key[:12]}...")
+        return analysis_result, True
+
+    def analyze():
+        # An identical call may have finished since our lookup (in-process tier only, not a new lookup)
+        analysis_result = analysis_cache.memory.get(cache_key)
+        if analysis_result is MISSING:
+            analysis_result = run_style_analysis(posts_text, priority=priority, features=features)
+            analysis_cache.set(cache_key, analysis_result)
+        return analysis_result
+
+    analysis_result, shared = single_flight.do(f"analysis:{cache_key}", analyze)
+    return copy.deepcopy(analysis_result), shared # Callers may mutate it, like cached values
+
+# --- Style Profile Cache ---
+# Generation looks up the same few styles over and over; keep them in-process.
+# Every write path calls invalidate_style(); the TTL bounds staleness from writes made by
+# other processes (or, with STYLE_CACHE_CHANGE_STREAM, the change stream invalidates them).
+STYLE_PROFILE_PROJECTION = {"_id": 1, "name": 1, "analysis": 1}
+
+def style_cache_memory():
+    return TTLCache(max_entries=app.config["STYLE_CACHE_MAX_ENTRIES"], ttl=app.config["STYLE_CACHE_TTL_SECONDS"])
+
+style_cache = TieredCache("styles", style_cache_memory())
+
+def get_style_profile(style_id):
+    """Returns the style's {_id, name, analysis} or None. Raises InvalidId for malformed ids."""
+    style_object_id = ObjectId(style_id)
+    key = str(style_object_id)
+    profile = style_cache.get(key)
+    if profile is not MISSING:
+        return profile
+    with timed("mongo_style_lookup"):
+        profile = mongo.db.styles.find_one({"_id": style_object_id}, STYLE_PROFILE_PROJECTION)
+    if profile:
+        style_cache.set(key, profile) # Missing styles are not cached, so a new style is visible at once
+    return profile
+
+def get_style_profiles(style_ids):
+    """Looks up several styles at once: cache hits first, then one $in query for the rest.
+
+    Returns {style id string: profile} (missing styles are absent). Raises InvalidId for malformed ids.
+    """
+    object_ids = [ObjectId(style_id) for style_id in style_ids]
+    profiles, missing = {}, []
+    for object_id in object_ids:
+        profile = style_cache.get(str(object_id))
+        if profile is MISSING:
+            missing.append(object_id)
+        else:
+            profiles[str(object_id)] = profile
+    if missing:
+        with timed("mongo_style_lookup"):
+            found = list(mongo.db.styles.find({"_id": {"$in": missing}}, STYLE_PROFILE_PROJECTION))
+        for profile in found:
+            profiles[str(profile["_id"])] = profile
+            style_cache.set(str(profile["_id"]), profile)
+    return profiles
+
+def invalidate_style(style_id):
+    style_cache.invalidate(str(style_id))
+
+def watch_style_changes(stop_event, retry_seconds=5):
+    """Invalidates cached styles on updates/deletes seen on the styles change stream.
+
+    Runs until stop_event is set. If the stream breaks, events may have been missed, so the
+    whole cache is dropped before resuming.
+    """
+    pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+    while not stop_event.is_set():
+        try:
+            with mongo.db.styles.watch(pipeline, max_await_time_ms=1000) as stream:
+                while not stop_event.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        invalidate_style(change["documentKey"]["_id"])
+        except Exception as e:
+            logger.warning(f"Style change stream failed ({e}); retrying in {retry_seconds}s")
+            style_cache.clear()
+            stop_event.wait(retry_seconds)
 
-mongo = PyMongo(app)
-# Initialize Anthropic Client
-anthropic_client = None # Initialize as None
-try:
-    api_key_loaded = app.config.get("ANTHROPIC_API_KEY")
-    if api_key_loaded:
-        print(f"Attempting to initialize Anthropic client with key type: {type(api_key_loaded)}, starting with: {api_key_loaded[:5]}...")
-        anthropic_client = anthropic.Anthropic(api_key=api_key_loaded)
-        print("Anthropic client initialized successfully.") # Add success log
-    else:
-        print("Error: ANTHROPIC_API_KEY not found in app config.")
+style_watch_stop = threading.Event()
 
-except Exception as e:
-    print("--- FATAL: Error initializing Anthropic client --- ") # Make error more visible
-    print(f"Error Type: {type(e).__name__}")
-    print(f"Error Args: {e.args}")
-    print("Traceback:")
-    traceback.print_exc() # Print full traceback
-    print("--- End Anthropic Init Error ---")
-    anthropic_client = None # Ensure it's None on error
+def start_style_cache_watcher():
+    """Starts the change stream watcher thread if STYLE_CACHE_CHANGE_STREAM is enabled."""
+    if not app.config["STYLE_CACHE_CHANGE_STREAM"]:
+        return None
+    style_watch_stop.clear()
+    watcher = threading.Thread(target=watch_style_changes, args=(style_watch_stop,),
+                               name="style-cache-watch", daemon=True)
+    watcher.start()
+    return watcher
 
 # --- Routes ---
 @app.route('/')
 def home():
     return "LinkedIn Style Syncer Backend"
 
-# Style Analysis & Auto-Save Endpoint
-@app.route('/api/analyze-style', methods=['POST'])
-def analyze_and_save_style(): # Renamed function for clarity
-    if not anthropic_client:
-         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+def build_stylometry_hints(features, sampled_posts=None, separated=True):
+    """Prompt section with the locally measured features.
+
+    `separated` is False when the posts were not separated by '---' lines and paragraphs were
+    measured as posts instead.
+    """
+    scope = f"all {features['posts']} posts"
+    if not separated:
+        scope = f"all {features['posts']} paragraphs (the posts are not separated, so each paragraph counts as a post)"
+    sample_note = ""
+    if sampled_posts is not None:
+        sample_note = f" The posts below are an excerpt ({sampled_posts} of them, spread over the corpus)."
+    return f"""
+The following features were measured exactly over {scope}.{sample_note} Base common_keywords, sentence_structure, emoji_usage, common_cta and perspective on these measurements rather than re-counting; use the posts for tone, themes and the style name.
+<stylometry>
+{json.dumps(features, ensure_ascii=False)}
+</stylometry>
+"""
 
-    # 1. Get posts from request body
-    data = request.get_json()
-    posts_text = data.get('posts_text')
-    if not posts_text or len(posts_text.strip()) < 100: # Basic validation
-        return jsonify({"error": "Insufficient post text provided for analysis (min 100 chars recommended)."}), 400
 
-    # 2. Send to Anthropic for analysis AND name suggestion
-    try:
-        # Prompt for Messages API (no HUMAN/AI prompts needed explicitly)
-        analysis_prompt = f"""Analyze the following LinkedIn posts provided below to determine the author's writing style. Extract the key stylistic elements and provide the analysis as a JSON object.
+def build_analysis_prompt(posts_text, features=None, sampled_posts=None, separated=True):
+    """Builds the Messages API user content for a style analysis.
+
+    `features` (from stylometry.corpus_features) are added as hints; `sampled_posts` is how
+    many posts `posts_text` holds when it is only an excerpt of the corpus.
+    """
+    hints = build_stylometry_hints(features, sampled_posts, separated) if features else ""
+    # Prompt for Messages API (no HUMAN/AI prompts needed explicitly)
+    return f"""Analyze the following LinkedIn posts provided below to determine the author's writing style. Extract the key stylistic elements and provide the analysis as a JSON object.
 
 The JSON object should include keys for:
 - overall_tone (e.g., Formal, Informal, Enthusiastic, Analytical, Inspirational, Humorous)
@@ -81,95 +443,640 @@ The JSON object should include keys for:
 - style_name (Suggest a short, descriptive name for this style based on the analysis, e.g., "Professional Tech Insights", "Casual Startup Banter", "Inspirational Leadership Voice")
 
 Please ensure the output is ONLY the JSON object, without any introductory text or explanation.
-
+{hints}
 Here are the posts:
 --- START POSTS ---
 {posts_text}
 --- END POSTS ---
 """
 
-        # Use the Messages API
-        message = anthropic_client.messages.create(
-            model="claude-3-7-sonnet-20250219", # Use specific Sonnet 3.7 model ID
-            max_tokens=1000,
-            temperature=0.1,
-            messages=[
-                {
-                    "role": "user",
-                    "content": analysis_prompt
-                }
-            ]
-        )
-        # Extract text from Messages API response
-        analysis_text = message.content[0].text.strip()
 
+def extract_json_object(text):
+    """Pulls the JSON object out of a model response (bare, fenced, or surrounded by prose).
+
+    Returns the extracted JSON text, or None if no object could be located.
+    """
+    text = text.strip()
+    if text.startswith("```json"):
+        return text.strip("```json").strip("`").strip()
+    if text.startswith("{") and text.endswith("}"):
+        return text # Looks like JSON already
+    json_start = text.find('{')
+    json_end = text.rfind('}')
+    if json_start != -1 and json_end != -1 and json_end > json_start:
+        return text[json_start:json_end+1]
+    return None
+
+
+class AnalysisParseError(Exception):
+    """Raised when the model response does not contain a parseable JSON analysis."""
+
+    def __init__(self, message, raw_output):
+        super().__init__(message)
+        self.raw_output = raw_output
+
+
+def analysis_prompt_content(posts_text, features=None):
+    """The analysis prompt for a corpus: stylometry hints plus (a sample of) the posts."""
+    if not app.config["ANALYSIS_STYLOMETRY_HINTS"]:
+        return build_analysis_prompt(posts_text)
+    if features is None:
+        with timed("stylometry"):
+            features = stylometry.corpus_features(posts_text)
+    if not stylometry.has_post_separators(posts_text):
+        # Post boundaries are unknown, so there is nothing to sample whole posts from: send it all
+        return build_analysis_prompt(posts_text, features, separated=False)
+    posts = stylometry.split_posts(posts_text)
+    sample = stylometry.sample_posts(posts, app.config["ANALYSIS_SAMPLE_CHARS"])
+    if sample == posts:
+        return build_analysis_prompt(posts_text, features)
+    return build_analysis_prompt("\n---\n".join(sample), features, sampled_posts=len(sample))
+
+
+def analysis_request_params(posts_text, features=None):
+    """Messages API parameters for a style analysis (shared by direct and batch calls)."""
+    return dict(
+        model=ANALYSIS_MODEL,
+        max_tokens=1000,
+        temperature=0.1,
+        messages=[
+            {
+                "role": "user",
+                "content": analysis_prompt_content(posts_text, features)
+            }
+        ]
+    )
+
+
+def parse_analysis_text(raw_text):
+    """Parses the model's analysis text into a dict, raising AnalysisParseError on failure."""
+    raw_text = raw_text.strip()
+    with timed("json_extraction"):
         # Parse JSON (using existing robust logic)
-        if analysis_text.startswith("```json"):
-            analysis_text = analysis_text.strip("```json").strip("`").strip()
-        elif analysis_text.startswith("{") and analysis_text.endswith("}"):
-            pass # Looks like JSON already
-        else:
-            json_start = analysis_text.find('{')
-            json_end = analysis_text.rfind('}')
-            if json_start != -1 and json_end != -1 and json_end > json_start:
-                analysis_text = analysis_text[json_start:json_end+1]
-            else:
-                 print(f"Warning: Could not reliably extract JSON from Anthropic response. Raw response: {analysis_text}")
-                 return jsonify({"error": "Could not extract JSON analysis from AI model response.", "raw_output": analysis_text}), 500
+        analysis_text = extract_json_object(raw_text)
+        if analysis_text is None:
+            logger.warning("Could not reliably extract JSON from Anthropic response.")
+            logger.debug(f"Raw response: {raw_text}")
+            raise AnalysisParseError("Could not extract JSON analysis from AI model response.", raw_text)
 
         try:
-            analysis_result = json.loads(analysis_text)
+            return json.loads(analysis_text)
         except json.JSONDecodeError as e:
-             print(f"Warning: Could not parse extracted Anthropic response as JSON. Parse error: {e}. Extracted text: {analysis_text}")
-             return jsonify({"error": "Failed to parse analysis from AI model", "raw_output": analysis_text}), 500
+            logger.warning(f"Could not parse extracted Anthropic response as JSON. Parse error: {e}")
+            logger.debug(f"Extracted text: {analysis_text}")
+            raise AnalysisParseError("Failed to parse analysis from AI model", analysis_text)
+
+
+def run_style_analysis(posts_text, priority=PRIORITY_INTERACTIVE, features=None):
+    """Asks Claude to analyze the posts and returns the parsed analysis dict.
+
+    Raises AnalysisParseError if no JSON could be parsed; Anthropic API errors are left to
+    propagate so the caller can map them to HTTP statuses. Bulk callers pass PRIORITY_BATCH
+    so they queue behind interactive requests when we are near the rate limits.
+    """
+    # Use the Messages API
+    message = create_message("anthropic_analysis", priority, **analysis_request_params(posts_text, features))
+    record_tokens("analysis", usage_counts(message.usage))
+    # Extract text from Messages API response
+    return parse_analysis_text(message.content[0].text)
+
+
+def analysis_error_response(e):
+    """Maps an exception raised while analyzing a style to (error body, HTTP status)."""
+    if isinstance(e, AnalysisParseError):
+        return {"error": str(e), "raw_output": e.raw_output}, 500
+    if isinstance(e, GovernorTimeout):
+        logger.warning(f"Gave up waiting for Anthropic rate limit capacity: {e}")
+        return {"error": "Rate limit exceeded. Please try again later."}, 429 # Too Many Requests
+    import anthropic # Already loaded if the error came from the client
+    if isinstance(e, anthropic.APIConnectionError):
+        logger.error(f"Anthropic API connection error: {e}")
+        return {"error": "Failed to connect to Anthropic API"}, 503 # Service Unavailable
+    if isinstance(e, anthropic.RateLimitError):
+        logger.warning(f"Anthropic API rate limit exceeded: {e}")
+        return {"error": "Rate limit exceeded. Please try again later."}, 429 # Too Many Requests
+    if isinstance(e, anthropic.APIStatusError):
+        logger.error(f"Anthropic API status error: {e}")
+        return {"error": f"Anthropic API error: {e.status_code} {e.response}"}, 500
+    # Catch-all for other unexpected errors (includes DB errors during save)
+    logger.exception(f"Unexpected error during style analysis or auto-save: {e}")
+    return {"error": "An unexpected error occurred during style analysis or auto-save."}, 500
+
+
+def post_digest(post):
+    """Short content hash of a post, so posts added to a style again are recognized."""
+    return hashlib.sha256(normalize_posts_text(post).encode("utf-8")).hexdigest()[:16]
+
+
+def measure_posts(posts):
+    """Per-post stylometry features (with each post's digest) for a list of posts."""
+    with timed("stylometry"):
+        return [{**stylometry.post_features(post), "digest": post_digest(post)} for post in posts]
+
+
+def unique_post_features(post_features):
+    """Drops features of posts repeated in the list (same digest), keeping the first of each."""
+    seen = set()
+    unique = []
+    for features in post_features:
+        if features["digest"] not in seen:
+            seen.add(features["digest"])
+            unique.append(features)
+    return unique
+
+
+def build_style_doc(analysis_result, post_features=None, mode=ANALYSIS_MODE_FULL):
+    """Builds the `styles` document saved for an analysis.
+
+    With `post_features` (from measure_posts), the per-post features and their summary are
+    stored too, so posts can be added later without re-analyzing the whole corpus. Repeated
+    posts count once, and only the last STYLE_MAX_STORED_POSTS features are kept.
+    """
+    style_name = analysis_result.get('style_name', 'Unnamed Style') # Use suggested name or default
+    doc = {
+        # "user_id": user_id, # Add later
+        "name": style_name.strip(),
+        "analysis": analysis_result, # Store the full analysis
+        "analysis_mode": mode,
+        "version": 1, # Incremented by every refinement (PATCH /api/styles/<id>/posts)
+        "created_at": datetime.utcnow()
+    }
+    if post_features is not None:
+        post_features = unique_post_features(post_features)
+        doc["post_features"] = post_features[-app.config["STYLE_MAX_STORED_POSTS"]:]
+        doc["post_count"] = len(post_features)
+        doc["stylometry"] = stylometry.summarize(post_features)
+    return doc
+
+
+def validate_posts_text(posts_text):
+    """Returns an error body if the posts are too short to analyze, else None."""
+    if not posts_text or len(posts_text.strip()) < 100: # Basic validation
+        return {"error": "Insufficient post text provided for analysis (min 100 chars recommended)."}
+    return None
+
+
+def validate_analysis_mode(mode):
+    """Returns an error body if `mode` is not a known analysis mode, else None."""
+    if mode not in ANALYSIS_MODES:
+        return {"error": f"'mode' must be one of: {', '.join(ANALYSIS_MODES)}."}
+    return None
+
+
+def analyze_and_save_style_payload(posts_text, mode=ANALYSIS_MODE_FULL):
+    """Runs the analyze + auto-save flow. Returns (response body, HTTP status).
+
+    Shared by the synchronous endpoint and the background job worker. In "fast" mode the
+    profile is derived from local stylometry alone, without calling Claude.
+    """
+    mode = mode or ANALYSIS_MODE_FULL
+    validation_error = validate_analysis_mode(mode)
+    if validation_error:
+        return validation_error, 400
+
+    if mode == ANALYSIS_MODE_FULL and not get_anthropic_client():
+         return {"error": "Anthropic client not initialized. Check API key."}, 500
+
+    validation_error = validate_posts_text(posts_text)
+    if validation_error:
+        return validation_error, 400
+
+    # Send to Anthropic for analysis AND name suggestion (unless this exact corpus was analyzed recently)
+    try:
+        post_features = measure_posts(stylometry.split_posts(posts_text))
+        features = stylometry.summarize(post_features)
+        if mode == ANALYSIS_MODE_FAST:
+            analysis_result, cached = stylometry.local_profile(features), False
+        else:
+            analysis_result, cached = analyze_posts(posts_text, features=features)
 
         # --- Auto-Save Logic ---
         style_name = analysis_result.get('style_name', 'Unnamed Style') # Use suggested name or default
 
         styles_collection = mongo.db.styles
-        style_doc = {
-            # "user_id": user_id, # Add later
-            "name": style_name.strip(),
-            "analysis": analysis_result, # Store the full analysis
-            "created_at": datetime.utcnow()
-        }
+        style_doc = build_style_doc(analysis_result, post_features, mode)
         insert_result = styles_collection.insert_one(style_doc)
 
         if not insert_result.inserted_id:
              # Log error, but maybe still return analysis?
-             print(f"Error: Failed to auto-save style '{style_name}' to database after analysis.")
+             logger.error(f"Failed to auto-save style '{style_name}' to database after analysis.")
              # Decide if we should return an error or just the analysis without save confirmation
              # Returning analysis but with a warning for now:
              analysis_result['save_warning'] = 'Style analysis complete, but failed to auto-save.'
-             return jsonify(analysis_result), 200 # 200 OK, but with warning
+             return analysis_result, 200 # 200 OK, but with warning
 
         saved_style_id = str(insert_result.inserted_id)
-        print(f"Style '{style_name}' analyzed and auto-saved successfully with ID: {saved_style_id}")
+        invalidate_style(saved_style_id)
+        logger.info(f"Style '{style_name}' analyzed and auto-saved successfully with ID: {saved_style_id}")
         # --- End Auto-Save ---
 
-        # 3. Return analysis result AND save confirmation
-        return jsonify({
+        # Return analysis result AND save confirmation
+        return {
             "message": f"Style analyzed and saved as '{style_name}'!",
+            "cached": cached, # True when no LLM call was made (cache hit or shared identical in-flight call)
+            "mode": mode,
             "style_id": saved_style_id,
             "style_name": style_name, # Return the name used for saving
             "analysis": analysis_result # Return the full analysis object
-            }), 200 # 200 OK since analysis and save (mostly) succeeded
-
-    except anthropic.APIConnectionError as e:
-        print(f"Anthropic API connection error: {e}")
-        return jsonify({"error": "Failed to connect to Anthropic API"}), 503 # Service Unavailable
-    except anthropic.RateLimitError as e:
-        print(f"Anthropic API rate limit exceeded: {e}")
-        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429 # Too Many Requests
-    except anthropic.APIStatusError as e:
-        print(f"Anthropic API status error: {e}")
-        return jsonify({"error": f"Anthropic API error: {e.status_code} {e.response}"}), 500
+            }, 200 # 200 OK since analysis and save (mostly) succeeded
+
     except Exception as e:
-        # Catch-all for other unexpected errors (includes DB errors during save)
-        print(f"Unexpected error during style analysis or auto-save: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": "An unexpected error occurred during style analysis or auto-save."}), 500
+        return analysis_error_response(e)
+
+
+# Style Analysis & Auto-Save Endpoint
+@app.route('/api/analyze-style', methods=['POST'])
+def analyze_and_save_style(): # Renamed function for clarity
+    # 1. Get posts (and the optional analysis mode: "full" by default, or "fast") from request body
+    data = request.get_json()
+    posts_text = data.get('posts_text')
+    mode = data.get('mode') or ANALYSIS_MODE_FULL
+    validation_error = validate_analysis_mode(mode)
+    if validation_error:
+        return jsonify(validation_error), 400
+
+    if mode == ANALYSIS_MODE_FULL and not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+
+    validation_error = validate_posts_text(posts_text)
+    if validation_error:
+        return jsonify(validation_error), 400
+
+    # Clients sending "Prefer: respond-async" get a job id back instead of waiting on Claude
+    if wants_async_response():
+        return enqueue_job_response(JOB_TYPE_ANALYZE_STYLE, {"posts_text": posts_text, "mode": mode})
+
+    # 2. Analyze and auto-save, 3. return analysis result AND save confirmation
+    body, status = analyze_and_save_style_payload(posts_text, mode)
+    return jsonify(body), status
+
+
+# --- Chunked Style Ingestion (map-reduce over very large corpora) ---
+def build_merge_prompt(weighted_analyses, features=None):
+    """Builds the prompt that merges partial style analyses into one profile.
+
+    `weighted_analyses` is a list of (analysis dict, number of posts it was derived from);
+    `features` are stylometry features measured over all the posts, if available.
+    """
+    hints = ""
+    if features:
+        hints = f"""
+These features were measured exactly over all {features["posts"]} posts; prefer them over the partials for common_keywords, sentence_structure, emoji_usage, common_cta and perspective:
+<stylometry>
+{json.dumps(features, ensure_ascii=False)}
+</stylometry>
+"""
+    partials = "\n".join(
+        f"<partial_analysis posts=\"{post_count}\">\n{json.dumps(analysis, indent=2)}\n</partial_analysis>"
+        for analysis, post_count in weighted_analyses
+    )
+    return f"""The following are partial analyses of the same LinkedIn author's writing style, each computed from a different subset of their posts. The "posts" attribute gives how many posts each partial analysis covers; weigh them accordingly.
+
+Merge them into a single analysis of the author's overall style, as a JSON object with exactly these keys:
+- overall_tone
+- key_themes (list of strings)
+- common_keywords (list of strings)
+- sentence_structure
+- emoji_usage
+- common_cta (or null if none consistent)
+- perspective
+- style_name (a short, descriptive name for the merged style)
+
+Keep traits that are consistent across partials, favor the larger partials on disagreements, and deduplicate lists.
+{hints}
+Please ensure the output is ONLY the JSON object, without any introductory text or explanation.
+
+{partials}
+"""
+
+
+def merge_style_analyses(weighted_analyses, features=None, priority=PRIORITY_BATCH):
+    """Reduces partial analyses to one with a single (small) Claude call."""
+    if len(weighted_analyses) == 1:
+        return weighted_analyses[0][0]
+    message = create_message(
+        "anthropic_merge", priority,
+        model=ANALYSIS_MODEL,
+        max_tokens=1000,
+        temperature=0.1,
+        messages=[{"role": "user", "content": build_merge_prompt(weighted_analyses, features)}]
+    )
+    record_tokens("merge", usage_counts(message.usage))
+    return parse_analysis_text(message.content[0].text)
+
+
+def analyze_corpus_chunks(chunks):
+    """Map step: analyzes each (chunk_text, post_count) with bounded concurrency.
+
+    At most INGEST_CONCURRENCY chunks are analyzed at a time. Chunk analyses go through the
+    analysis cache, so re-uploading an overlapping corpus reuses earlier work.
+    Returns (weighted_analyses, post_count, failures).
+    """
+    weighted_analyses, failures = [], []
+    total_posts = 0
+    max_in_flight = max(1, app.config["INGEST_CONCURRENCY"])
+
+    def analyze_chunk(chunk_text):
+        return analyze_posts(chunk_text, priority=PRIORITY_BATCH)[0]
+
+    def collect(future, post_count):
+        try:
+            weighted_analyses.append((future.result(), post_count))
+        except Exception as e:
+            failures.append(e)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ingest") as executor:
+        in_flight = {}
+        for chunk_text, post_count in chunks:
+            total_posts += post_count
+            in_flight[executor.submit(analyze_chunk, chunk_text)] = post_count
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, in_flight.pop(future))
+        for future, post_count in in_flight.items():
+            collect(future, post_count)
+
+    return weighted_analyses, total_posts, failures
+
+
+# Streamed Style Ingestion & Auto-Save Endpoint
+# Body: NDJSON (Content-Type: application/x-ndjson, one post per line) or plain text with
+# posts separated by '---' lines. The body is read as a stream; its chunks (at most
+# INGEST_MAX_CHUNKS) are all collected before the first Claude call, so an oversized corpus is
+# rejected with a 413 before anything is paid for.
+@app.route('/api/analyze-style/ingest', methods=['POST'])
+def ingest_and_analyze_style():
+    if not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+
+    if request.content_length and request.content_length > app.config["INGEST_MAX_BYTES"]:
+        return jsonify({"error": f"Corpus too large (more than {app.config['INGEST_MAX_BYTES']} bytes)."}), 413
+
+    chunk_chars = app.config["INGEST_CHUNK_CHARS"]
+    lines = iter_stream_lines(request.stream)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+        posts = iter_ndjson_posts(lines)
+    else:
+        posts = iter_text_posts(lines, max_post_chars=chunk_chars)
+
+    try:
+        # Count the chunks first: a corpus over the limit is rejected before any Claude call
+        chunks = collect_chunks(iter_post_chunks(posts, chunk_chars), app.config["INGEST_MAX_CHUNKS"])
+        # Tiny uploads get the same 400 as /api/analyze-style
+        if not chunks or (len(chunks) == 1 and validate_posts_text(chunks[0][0])):
+            return jsonify({"error": "Insufficient post text provided for analysis (min 100 chars recommended)."}), 400
+
+        # Map: partial analyses per chunk
+        weighted_analyses, post_count, failures = analyze_corpus_chunks(chunks)
+        if not weighted_analyses:
+            body, status = analysis_error_response(failures[-1])
+            return jsonify(body), status
+
+        # Reduce: merge the partials into one profile
+        analysis_result = merge_style_analyses(weighted_analyses)
+
+        styles_collection = mongo.db.styles
+        style_doc = build_style_doc(analysis_result)
+        style_doc["source"] = {"posts": post_count, "chunks": len(weighted_analyses)}
+        style_doc["post_count"] = post_count
+        insert_result = styles_collection.insert_one(style_doc)
+        saved_style_id = str(insert_result.inserted_id)
+        invalidate_style(saved_style_id)
+        logger.info(f"Style '{style_doc['name']}' ingested from {post_count} posts in {len(weighted_analyses)} chunks, saved with ID: {saved_style_id}")
+
+        return jsonify({
+            "message": f"Style analyzed and saved as '{style_doc['name']}'!",
+            "style_id": saved_style_id,
+            "style_name": style_doc["name"],
+            "analysis": analysis_result,
+            "posts_analyzed": post_count,
+            "chunks": len(weighted_analyses),
+            "chunks_failed": len(failures),
+            }), 200
+
+    except CorpusTooLarge as e:
+        logger.warning(f"Rejected oversized style ingestion upload: {e}")
+        return jsonify({"error": str(e)}), 413 # Payload Too Large
+    except IngestError as e:
+        logger.warning(f"Rejected style ingestion upload: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        body, status = analysis_error_response(e)
+        return jsonify(body), status
+
+
+# --- Batch Style Analysis (multi-client agencies) ---
+def parse_batch_corpora(data):
+    """Normalizes the batch body into a list of posts_text strings.
+
+    Accepts {"corpora": ["...", ...]} or {"corpora": [{"posts_text": "..."}, ...]}.
+    Returns (corpora, None) or (None, error body).
+    """
+    corpora = (data or {}).get('corpora')
+    if not isinstance(corpora, list) or not corpora:
+        return None, {"error": "Provide a non-empty 'corpora' list."}
+    if len(corpora) > app.config["ANALYSIS_BATCH_MAX_ITEMS"]:
+        return None, {"error": f"Too many corpora in one batch (max {app.config['ANALYSIS_BATCH_MAX_ITEMS']})."}
+    return [item.get('posts_text') if isinstance(item, dict) else item for item in corpora], None
+
+
+def save_analyzed_styles(results, analyses, id_seed=None):
+    """Saves successful analyses with a single unordered insert_many and fills in per-item results.
+
+    `analyses` maps result index -> analysis dict. With `id_seed`, each style's _id is derived
+    from it and the index, so saving the same results again (a retried collection) cannot
+    create duplicates: styles already saved are reported as saved.
+    """
+    if not analyses:
+        return
+    indexes = sorted(analyses)
+    docs = [build_style_doc(analyses[i]) for i in indexes]
+    if id_seed is not None:
+        for i, doc in zip(indexes, docs):
+            doc["_id"] = ObjectId(hashlib.sha256(f"{id_seed}:{i}".encode("utf-8")).digest()[:12])
+    try:
+        insert_result = mongo.db.styles.insert_many(docs, ordered=False)
+        inserted_ids = insert_result.inserted_ids
+    except errors.BulkWriteError as e:
+        # Unordered: the other documents were still written
+        failed_positions = {
+            err["index"] for err in e.details.get("writeErrors", [])
+            if not (id_seed is not None and err.get("code") == 11000) # Duplicate key: saved by an earlier attempt
+        }
+        inserted_ids = [None if pos in failed_positions else doc.get("_id") for pos, doc in enumerate(docs)]
+
+    for i, doc, inserted_id in zip(indexes, docs, inserted_ids):
+        if inserted_id is None:
+            results[i].update({"status": "failed", "error": "Failed to save style to database."})
+        else:
+            invalidate_style(inserted_id)
+            results[i].update({"status": "saved", "style_id": str(inserted_id), "style_name": doc["name"]})
+
+
+@app.route('/api/analyze-style/batch', methods=['POST'])
+def analyze_style_batch():
+    """Analyzes many corpora at once.
+
+    mode "interactive" (default): fans out to Claude with bounded concurrency (cache hits skip
+    the call), saves all styles with one insert_many and returns per-item status.
+    mode "offline": submits cache misses to the Anthropic Message Batches API (cheaper, slower)
+    and returns 202; poll GET /api/analyze-style/batch/<batch_id> to collect and save results.
+    """
+    if not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+
+    data = request.get_json() or {}
+    corpora, error = parse_batch_corpora(data)
+    if error:
+        return jsonify(error), 400
+    mode = data.get('mode', 'interactive')
+    if mode not in ('interactive', 'offline'):
+        return jsonify({"error": "mode must be 'interactive' or 'offline'"}), 400
+
+    try:
+        results = []
+        analyses = {} # index -> analysis to save
+        pending = {} # index -> (posts_text, cache_key) still needing Claude
+        for i, posts_text in enumerate(corpora):
+            result = {"index": i}
+            results.append(result)
+            validation_error = validate_posts_text(posts_text) if isinstance(posts_text, str) else \
+                {"error": "Each corpus must be a string or an object with 'posts_text'."}
+            if validation_error:
+                result.update({"status": "invalid", "error": validation_error["error"]})
+                continue
+            cache_key = analysis_cache_key(posts_text)
+            cached_analysis = analysis_cache.get(cache_key)
+            if cached_analysis is not MISSING:
+                result["cached"] = True
+                analyses[i] = cached_analysis
+            else:
+                result["cached"] = False
+                pending[i] = (posts_text, cache_key)
+
+        if mode == 'offline' and pending:
+            return submit_offline_analysis_batch(results, analyses, pending)
+
+        def analyze_one(item):
+            i, (posts_text, cache_key) = item
+            try:
+                # Identical corpora in the batch (or in flight elsewhere) share one call
+                analysis_result, _ = analyze_posts(posts_text, priority=PRIORITY_BATCH, cache_key=cache_key)
+            except Exception as e:
+                body, status = analysis_error_response(e)
+                return i, None, body["error"], status
+            return i, analysis_result, None, 200
+
+        max_workers = max(1, min(app.config["ANALYSIS_BATCH_CONCURRENCY"], len(pending) or 1))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyze-batch") as executor:
+            for i, analysis_result, error_message, status in executor.map(analyze_one, pending.items()):
+                if analysis_result is None:
+                    results[i].update({"status": "failed", "error": error_message, "http_status": status})
+                else:
+                    analyses[i] = analysis_result
+
+        save_analyzed_styles(results, analyses)
+
+        saved = sum(1 for r in results if r["status"] == "saved")
+        logger.info(f"Batch style analysis: {saved}/{len(results)} styles saved.")
+        return jsonify({"saved": saved, "failed": len(results) - saved, "results": results}), 200
+
+    except Exception as e:
+        logger.exception(f"Unexpected error during batch style analysis: {e}")
+        return jsonify({"error": "An unexpected error occurred during batch style analysis."}), 500
+
+
+def submit_offline_analysis_batch(results, analyses, pending):
+    """Sends pending corpora to the Message Batches API and records the batch in Mongo."""
+    message_batch = get_anthropic_client().messages.batches.create(requests=[
+        {"custom_id": f"item-{i}", "params": analysis_request_params(posts_text)}
+        for i, (posts_text, _) in pending.items()
+    ])
+
+    # Cache hits and invalid items are resolved right away; the rest wait for the batch
+    save_analyzed_styles(results, analyses)
+    for i in pending:
+        results[i]["status"] = "pending"
+
+    batch_doc = {
+        "anthropic_batch_id": message_batch.id,
+        "status": "processing",
+        "results": results,
+        "cache_keys": {f"item-{i}": cache_key for i, (_, cache_key) in pending.items()},
+        "created_at": datetime.utcnow(),
+    }
+    batch_id = str(mongo.db.analysis_batches.insert_one(batch_doc).inserted_id)
+    logger.info(f"Submitted offline analysis batch {batch_id} (Anthropic batch {message_batch.id}) with {len(pending)} corpora.")
+    return jsonify({
+        "batch_id": batch_id,
+        "status": "processing",
+        "status_url": url_for('get_analysis_batch', batch_id=batch_id),
+        "results": results,
+        }), 202
+
+
+@app.route('/api/analyze-style/batch/<string:batch_id>', methods=['GET'])
+def get_analysis_batch(batch_id):
+    """Reports an offline batch; once Anthropic has finished it, saves the styles (exactly once)."""
+    try:
+        batches_collection = mongo.db.analysis_batches
+        batch_object_id = ObjectId(batch_id)
+        batch_doc = batches_collection.find_one({"_id": batch_object_id})
+        if not batch_doc:
+            return jsonify({"error": "Batch not found"}), 404
+
+        if batch_doc["status"] == "processing":
+            message_batch = get_anthropic_client().messages.batches.retrieve(batch_doc["anthropic_batch_id"])
+            # Only one poller gets to collect and save the results
+            if message_batch.processing_status == "ended" and batches_collection.find_one_and_update(
+                    {"_id": batch_object_id, "status": "processing"}, {"$set": {"status": "collecting"}}):
+                try:
+                    batch_doc = collect_offline_analysis_batch(batch_doc)
+                except Exception:
+                    # Hand the batch back so a later poll collects it again (styles are not saved twice)
+                    batches_collection.update_one({"_id": batch_object_id, "status": "collecting"},
+                                                  {"$set": {"status": "processing"}})
+                    raise
+
+        return jsonify({
+            "batch_id": batch_id,
+            "status": batch_doc["status"],
+            "results": batch_doc["results"],
+        })
+
+    except InvalidId:
+        return jsonify({"error": "Invalid batch ID format"}), 400
+    except Exception as e:
+        logger.exception(f"Error fetching analysis batch {batch_id}: {e}")
+        return jsonify({"error": "An unexpected error occurred while fetching the batch."}), 500
+
+
+def collect_offline_analysis_batch(batch_doc):
+    """Parses a finished Message Batch, saves its styles and marks the batch completed."""
+    results = batch_doc["results"]
+    analyses = {}
+    for entry in get_anthropic_client().messages.batches.results(batch_doc["anthropic_batch_id"]):
+        i = int(entry.custom_id.split("-", 1)[1])
+        if entry.result.type != "succeeded":
+            results[i].update({"status": "failed", "error": f"Batch request {entry.result.type}."})
+            continue
+        record_tokens("analysis_batch", usage_counts(entry.result.message.usage))
+        try:
+            analysis_result = parse_analysis_text(entry.result.message.content[0].text)
+        except AnalysisParseError as e:
+            results[i].update({"status": "failed", "error": str(e)})
+            continue
+        analysis_cache.set(batch_doc["cache_keys"][entry.custom_id], analysis_result)
+        analyses[i] = analysis_result
+
+    save_analyzed_styles(results, analyses, id_seed=batch_doc["_id"])
+    batch_doc.update({"status": "completed", "results": results, "completed_at": datetime.utcnow()})
+    mongo.db.analysis_batches.update_one(
+        {"_id": batch_doc["_id"]},
+        {"$set": {"status": "completed", "results": results, "completed_at": batch_doc["completed_at"]}},
+    )
+    return batch_doc
 
 
 # Style Listing Endpoint (GET only)
@@ -187,9 +1094,7 @@ def handle_styles_get(): # Renamed function
             return jsonify(all_styles)
 
         except Exception as e:
-            print(f"Error fetching styles from MongoDB: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error fetching styles from MongoDB: {e}")
             return jsonify({"error": "An unexpected error occurred while fetching styles."}), 500
         # --- End GET logic ---
 
@@ -203,281 +1108,1435 @@ def delete_style(style_id):
 
         # Attempt to delete the document
         delete_result = styles_collection.delete_one({"_id": style_object_id})
+        invalidate_style(style_object_id) # Even on a miss: another process may have deleted it
 
         # Check if a document was actually deleted
         if delete_result.deleted_count == 1:
-            print(f"Successfully deleted style with ID: {style_id}")
+            logger.info(f"Successfully deleted style with ID: {style_id}")
             return jsonify({"message": "Style deleted successfully"}), 200
         else:
             # No document found with that ID
-            print(f"Attempted to delete style ID: {style_id}, but it was not found.")
+            logger.warning(f"Attempted to delete style ID: {style_id}, but it was not found.")
             return jsonify({"error": "Style not found"}), 404
 
     except errors.InvalidId: # Catch BSON errors if the ID format is wrong
-        print(f"Invalid ObjectId format provided for deletion: {style_id}")
+        logger.warning(f"Invalid ObjectId format provided for deletion: {style_id}")
         return jsonify({"error": "Invalid style ID format"}), 400
     except Exception as e:
-        print(f"Error deleting style {style_id} from MongoDB: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error deleting style {style_id} from MongoDB: {e}")
         return jsonify({"error": "An unexpected error occurred while deleting the style."}), 500
 
+# --- Incremental Style Refinement ---
+def parse_refine_posts(data):
+    """Normalizes the refinement body into a list of posts.
+
+    Accepts {"posts": ["...", ...]} or {"posts_text": "..."} (posts separated by '---' lines).
+    Returns (posts, None) or (None, error body).
+    """
+    if isinstance(data.get('posts'), list):
+        if not all(isinstance(post, str) for post in data['posts']):
+            return None, {"error": "'posts' must be a list of strings."}
+        posts = [post.strip() for post in data['posts'] if post.strip()]
+    elif isinstance(data.get('posts_text'), str):
+        posts = stylometry.split_posts(data['posts_text'])
+    else:
+        return None, {"error": "Provide 'posts' (a list of strings) or 'posts_text'."}
+    if not posts:
+        return None, {"error": "No posts provided."}
+    if len(posts) > app.config["STYLE_REFINE_MAX_POSTS"]:
+        return None, {"error": f"Too many posts in one request (max {app.config['STYLE_REFINE_MAX_POSTS']})."}
+    return posts, None
+
+
+def refine_style_analysis(style, new_posts, new_features, all_features, mode):
+    """Updated analysis for a style after adding `new_posts`. Returns (analysis, cached).
+
+    Full mode analyzes only the new posts with Claude, then merges that analysis into the
+    existing one, weighted by post counts (both calls are sized by the delta, not the corpus).
+    Fast mode re-derives the measured fields locally: a style created in fast mode is rebuilt
+    entirely from the features, others keep Claude's tone, themes and name.
+    """
+    existing = style.get("analysis") or {}
+    if mode == ANALYSIS_MODE_FAST:
+        if style.get("analysis_mode") == ANALYSIS_MODE_FAST:
+            return stylometry.local_profile(all_features), False
+        return {**existing, **stylometry.measured_profile(all_features)}, False
+
+    delta_text = "\n---\n".join(new_posts)
+    delta_analysis, cached = analyze_posts(delta_text, features=stylometry.summarize(new_features))
+    # Styles saved before post counts were stored weigh as much as the new posts
+    existing_posts = style.get("post_count") or len(style.get("post_features", [])) or len(new_posts)
+    merged = merge_style_analyses(
+        [(existing, existing_posts), (delta_analysis, len(new_posts))],
+        features=all_features if style.get("post_features") else None,
+        priority=PRIORITY_INTERACTIVE,
+    )
+    return merged, cached
+
+
+# Add posts to an existing style: analyzes only the new posts and updates the style in place.
+# Body: {"posts": [...]} or {"posts_text": "..."}, optional "mode" ("full" or "fast") and
+# "version" (the version the client last saw; 409 if the style changed since).
+@app.route('/api/styles/<string:style_id>/posts', methods=['PATCH'])
+def add_style_posts(style_id):
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode') or ANALYSIS_MODE_FULL
+    validation_error = validate_analysis_mode(mode)
+    if validation_error:
+        return jsonify(validation_error), 400
+    posts, error = parse_refine_posts(data)
+    if error:
+        return jsonify(error), 400
+
+    try:
+        style_object_id = ObjectId(style_id)
+        style = mongo.db.styles.find_one({"_id": style_object_id}, {"analysis_history": 0})
+        if not style:
+            return jsonify({"error": "Style not found"}), 404
+        version = style.get("version", 1)
+        if data.get('version') is not None and data['version'] != version:
+            return jsonify({"error": "Style was modified since you loaded it.", "version": version}), 409
+
+        # Posts the style already has stored are skipped (and so is a post repeated in the request)
+        known = {features.get("digest") for features in style.get("post_features", [])}
+        new_posts, new_features = [], []
+        for post, features in zip(posts, measure_posts(posts)):
+            if features["digest"] not in known:
+                known.add(features["digest"])
+                new_posts.append(post)
+                new_features.append(features)
+        max_stored = app.config["STYLE_MAX_STORED_POSTS"]
+        duplicates = len(posts) - len(new_posts)
+
+        if not new_posts:
+            return jsonify({
+                "message": "No new posts to add.",
+                "style_id": style_id,
+                "version": version,
+                "added": 0,
+                "duplicates": duplicates,
+                "analysis": style.get("analysis"),
+                }), 200
+
+        if mode == ANALYSIS_MODE_FAST and "post_features" not in style:
+            # Saved before per-post features were stored (or ingested): the earlier posts were never measured
+            return jsonify({"error": "This style has no stored post features; add posts in full mode."}), 400
+        if mode == ANALYSIS_MODE_FULL and not get_anthropic_client():
+            return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+
+        # The summary follows the stored window, i.e. the user's most recent posts
+        all_features = (style.get("post_features", []) + new_features)[-max_stored:]
+        features = stylometry.summarize(all_features)
+        analysis_result, cached = refine_style_analysis(style, new_posts, new_features, features, mode)
+
+        now = datetime.utcnow()
+        post_count = (style.get("post_count") or len(style.get("post_features", []))) + len(new_posts)
+        # Optimistic concurrency: the update only applies if nobody refined the style meanwhile
+        version_filter = {"version": version} if "version" in style else {"version": {"$exists": False}}
+        update_result = mongo.db.styles.update_one({"_id": style_object_id, **version_filter}, {
+            "$set": {
+                "analysis": analysis_result,
+                "stylometry": features,
+                "post_count": post_count,
+                "version": version + 1,
+                "updated_at": now,
+            },
+            "$push": {
+                "post_features": {"$each": new_features, "$slice": -max_stored},
+                "analysis_history": {
+                    "$each": [{"version": version, "analysis": style.get("analysis"), "replaced_at": now}],
+                    "$slice": -app.config["STYLE_HISTORY_MAX"],
+                },
+            },
+        })
+        invalidate_style(style_object_id)
+        if update_result.matched_count == 0:
+            logger.warning(f"Style {style_id} changed while adding posts; refinement not saved.")
+            return jsonify({"error": "Style was modified concurrently. Please retry."}), 409
+
+        logger.info(f"Added {len(new_posts)} posts to style {style_id} ({mode} mode), now version {version + 1}")
+        return jsonify({
+            "message": f"Added {len(new_posts)} posts to '{style.get('name')}'.",
+            "style_id": style_id,
+            "version": version + 1,
+            "added": len(new_posts),
+            "duplicates": duplicates,
+            "post_count": post_count,
+            "mode": mode,
+            "cached": cached,
+            "analysis": analysis_result,
+            }), 200
+
+    except InvalidId:
+        logger.warning(f"Invalid ObjectId format provided for style refinement: {style_id}")
+        return jsonify({"error": "Invalid style ID format"}), 400
+    except Exception as e:
+        body, status = analysis_error_response(e)
+        return jsonify(body), status
+
+# --- Cache Statistics Endpoint ---
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the backend caches."""
+    return jsonify({"analysis": analysis_cache.stats(), "search": search_cache.stats(), "styles": style_cache.stats(),
+                    "single_flight": single_flight.stats(), "search_flight": search_flight.stats()})
+
+# --- Request Timing & Metrics ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_timing(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # Streamed (SSE) responses are timed until the stream starts, not until it ends
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        observe_request(request.method, endpoint, response.status_code, elapsed)
+        logger.info(f"{request.method} {request.path} {response.status_code} {elapsed * 1000:.1f}ms",
+                    extra={"endpoint": endpoint, "status": response.status_code, "duration_ms": round(elapsed * 1000, 1)})
+    return response
+
+# Prometheus scrape endpoint
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+# --- Health Checks ---
+# Liveness: the process is up and serving. Never checks dependencies, so a Mongo outage does not
+# get every worker restarted.
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+# Readiness: can this process serve traffic right now? 503 while draining or if a dependency is down.
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    checks = {}
+    try:
+        mongo.db.command("ping")
+        checks["mongo"] = "ok"
+    except Exception as e:
+        checks["mongo"] = f"error: {e}"
+    # First probe creates the client, so a worker is warmed up before it gets traffic
+    checks["anthropic"] = "ok" if get_anthropic_client() else "error: client not initialized"
+    if draining.is_set():
+        checks["draining"] = "shutting down"
+    ready = all(value == "ok" for value in checks.values())
+    return jsonify({"status": "ready" if ready else "not_ready", "checks": checks}), 200 if ready else 503
+
 # --- Helper Function for Brave Search (Real Implementation) ---
+def search_cache_tiers():
+    """(memory, mongo) tiers of the search cache for the current settings."""
+    return (
+        TTLCache(max_entries=app.config["SEARCH_CACHE_MAX_ENTRIES"], ttl=app.config["SEARCH_CACHE_TTL_SECONDS"]),
+        MongoCache(lambda: mongo.db.search_cache, ttl=app.config["SEARCH_CACHE_TTL_SECONDS"])
+        if app.config["SEARCH_CACHE_MONGO"] else None,
+    )
+
+search_cache = TieredCache("search", *search_cache_tiers())
+
+def search_cache_key(query, count):
+    """Cache key for a search: case/whitespace-normalized query plus the result count."""
+    normalized_query = " ".join(query.lower().split())
+    digest = hashlib.sha256(f"{count}\n{normalized_query}".encode("utf-8")).hexdigest()
+    return f"brave:{digest}"
+
+
+def fetch_brave_results(query, count=3):
+    """Calls the Brave Search API. Returns a (possibly empty) list of results, raises SearchError on failure."""
+    with timed("brave_search"):
+        return get_brave_client().search(query, count=count, api_key=app.config.get("BRAVE_SEARCH_API_KEY"))
+
+
+# In-process only: a prefetch and the generation request it was made for often search at once
+search_flight = SingleFlight()
+
 def perform_brave_search(query, count=3):
-    """Calls the Brave Search API and returns results or None on error."""
+    """Returns Brave Search results for the query (served from the search cache when possible), or None."""
     api_key = app.config.get("BRAVE_SEARCH_API_KEY")
     if not api_key:
-        print("Warning: BRAVE_SEARCH_API_KEY not set. Skipping web search.")
+        logger.warning("BRAVE_SEARCH_API_KEY not set. Skipping web search.")
         return None
 
-    url = "https://api.search.brave.com/res/v1/web/search" # Corrected endpoint
-    headers = {
-        "Accept": "application/json",
-        "Accept-Encoding": "gzip",
-        "X-Subscription-Token": api_key # Use X-Subscription-Token header
-    }
-    params = {
-        "q": query,
-        "count": count
-    }
+    cache_key = search_cache_key(query, count)
+    results = search_cache.get(cache_key)
+    if results is not MISSING:
+        logger.info(f"Brave Search cache hit for query: {query}")
+        return results or None
+
+    def search():
+        results = search_cache.memory.get(cache_key) # An identical search may have finished since our lookup
+        if results is MISSING:
+            results = fetch_brave_results(query, count=count)
+            # Empty results are cached too (negative caching), but for a shorter time
+            ttl = None if results else app.config["SEARCH_CACHE_NEGATIVE_TTL_SECONDS"]
+            search_cache.set(cache_key, results, ttl=ttl)
+        return results
 
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10) # Added timeout
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-        data = response.json()
-        # Adjust based on Brave's actual response structure - often under 'web' -> 'results'
-        results = data.get('web', {}).get('results')
-
-        if results:
-            # Return simplified list of title/description
-            return [
-                {"title": r.get('title'), "description": r.get('description')}
-                for r in results if r.get('title') and r.get('description')
-                ]
-        else:
-            print(f"Brave Search returned no results under 'web.results' for query: {query}")
-            print(f"Raw response sample: {str(data)[:200]}") # Log sample of response
-            return None
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error during Brave Search API call for query '{query}': {e}")
-        return None
+        results, _ = search_flight.do(cache_key, search)
+    except SearchError as e:
+        logger.error(f"Error during Brave Search API call for query '{query}': {e}")
+        return None # Errors are not cached, the next request retries
     except Exception as e:
-        print(f"Unexpected error processing Brave Search results for query '{query}': {e}")
+        logger.error(f"Unexpected error processing Brave Search results for query '{query}': {e}")
         return None
+    return results or None
 
-# --- Post Generation Endpoint (Modified to use real search) ---
-@app.route('/api/generate-post', methods=['POST'])
-def generate_post():
-    if not anthropic_client:
-         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
 
-    # 1. Get inputs (including optional subjects/angles)
-    data = request.get_json()
+# Shared by every request, so concurrent searches stay bounded (the Brave client pools connections too)
+search_executor = LazyProxy(lambda: ThreadPoolExecutor(max_workers=max(1, app.config["SEARCH_WORKERS"]),
+                                                       thread_name_prefix="search"))
+
+def start_searches(queries, count=3):
+    """Starts the searches on the shared search pool. Returns {query: Future of its results}."""
+    return {query: search_executor.submit(perform_brave_search, query, count=count) for query in dict.fromkeys(queries)}
+
+
+def wait_for_search(search, search_query):
+    """Results of a started search, or None if it failed or missed SEARCH_DEADLINE_SECONDS.
+
+    A search past its deadline keeps running and still fills the search cache.
+    """
+    deadline = app.config["SEARCH_DEADLINE_SECONDS"] or None
+    try:
+        with timed("search_wait"):
+            return search.result(timeout=deadline)
+    except FutureTimeoutError:
+        logger.warning(f"Search for '{search_query}' missed its {deadline}s deadline; generating without snippets")
+    except Exception as e:
+        logger.warning(f"Shared search for '{search_query}' failed: {e}")
+    return None
+
+
+# Warms the search cache while the user is still typing, so generation finds its snippets ready.
+# Body: {"topic", "subjects_or_angles"?} (same fields as a generation request). Returns 202 at once.
+@app.route('/api/search/prefetch', methods=['POST'])
+def prefetch_searches():
+    data = request.get_json(silent=True) or {}
+    topic = data.get('topic')
+    if not isinstance(topic, str) or len(topic.strip()) < 3:
+        return jsonify({"error": "Provide a 'topic' of at least 3 characters."}), 400
+    if not app.config.get("BRAVE_SEARCH_API_KEY"):
+        return jsonify({"queries": [], "message": "Web search is not configured."}), 200
+
+    angles = parse_angles(data)[:app.config["SEARCH_PREFETCH_MAX_QUERIES"]]
+    queries = list(start_searches(f"{topic} {angle}" for angle in angles if angle))
+    logger.info(f"Prefetching {len(queries)} searches for topic: {topic}")
+    return jsonify({"queries": queries}), 202 # 202 Accepted: results land in the search cache
+
+# --- Helpers for Post Generation ---
+# The generation prompt is split so Anthropic prompt caching can reuse its stable part:
+#   system[0] - instructions + style analysis: identical for every generation with this style
+#   system[1] - post requirements: short and request-specific, sent uncached
+#   user      - angle + search snippets: the only part that changes per draft
+# system[0] carries the only cache breakpoint, and only when it reaches the model's minimum
+# cacheable length: below it the API ignores the breakpoint. A cache entry is readable once the
+# response that wrote it has started, so generate_drafts holds back the other angles until then.
+GENERATION_MODEL = "claude-3-7-sonnet-20250219" # Use specific Sonnet 3.7 model ID
+GENERATION_CACHE_MIN_TOKENS = 1024 # Minimum cacheable prompt length of Sonnet models
+USAGE_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+
+def build_generation_system(style_analysis, topic, key_points, cta=None):
+    """Builds the system blocks shared by every angle of a generation request (see above)."""
+    style_block = f"""You are an AI assistant helping a user write a LinkedIn post draft based on their established writing style, the provided requirements, and relevant web search results.
+
+User's Writing Style Analysis:
+<style_analysis>
+{json.dumps(style_analysis, indent=2, sort_keys=True)}
+</style_analysis>
+
+**Instructions:**
+- Write a LinkedIn post draft that adheres to the User's Writing Style Analysis provided above.
+- Focus the content on the angle given in the user message.
+- Integrate relevant information or viewpoints found in the 'Relevant Web Search Snippets' from the user message into the discussion for this angle.
+- Generate only the text of the LinkedIn post draft itself, without any extra commentary or preamble.
+"""
+
+    requirements_block = f"""Post Requirements:
+- **Main Topic:** {topic}
+- **Key Points User Wants to Include:**
+{key_points}
+"""
+    if cta:
+        requirements_block += f"- **Desired Call-to-Action:** {cta}\n"
+
+    system_blocks = [
+        {"type": "text", "text": style_block},
+        {"type": "text", "text": requirements_block},
+    ]
+    if estimate_input_tokens({"system": system_blocks[:1]}) >= GENERATION_CACHE_MIN_TOKENS:
+        system_blocks[0]["cache_control"] = {"type": "ephemeral"}
+    return system_blocks
+
+
+def build_generation_prompt(angle, search_results=None):
+    """Builds the per-angle Messages API user content (the uncached suffix)."""
+    search_summary = "No specific web search results available for this angle." # Default
+    if search_results:
+        search_summary = "Relevant Web Search Snippets:\n"
+        for res in search_results:
+            search_summary += f"- Title: {res.get('title', 'N/A')}\n  Snippet: {res.get('description', 'N/A')}\n"
+
+    return f"""- **Specific Angle/Focus for this draft:** {angle}
+
+{search_summary}
+**Final Instruction:**
+- Focus the content on the angle: '{angle}'.
+- Write the LinkedIn post draft now.
+"""
+
+
+def usage_counts(usage):
+    """Token counts from a Messages API `usage` object (missing fields count as 0)."""
+    counts = {}
+    for field in USAGE_FIELDS:
+        value = getattr(usage, field, None) if usage is not None else None
+        counts[field] = value if isinstance(value, int) else 0
+    return counts
+
+
+def add_usage(total, counts):
+    """Adds one request's token counts into a running total (in place)."""
+    for field in USAGE_FIELDS:
+        total[field] = total.get(field, 0) + counts.get(field, 0)
+    total["requests"] = total.get("requests", 0) + 1
+    return total
+
+
+def generate_draft_for_angle(system_blocks, angle, search_query, angle_index, on_delta=None, search=None,
+                             on_started=None):
+    """Runs the search + generation pipeline for one angle.
+
+    Returns (draft text or None on failure, token usage counts or None if the call failed).
+    If `on_delta` is given the draft is streamed and each text delta is passed to it as it arrives.
+    If `on_started` is given the draft is streamed too, and it is called at the first delta: from
+    then on, the prompt cache entry written by this call can be read by the others.
+    `search` is a Future of the results when the search was already started (see start_searches);
+    generation starts as soon as it completes, or without snippets once its deadline passes.
+    """
+    logger.info(f"Exploring angle {angle_index + 1}: {angle}")
+
+    # Call the REAL search function (or wait for the one already started)
+    if search is not None:
+        search_results = wait_for_search(search, search_query)
+    else:
+        search_results = perform_brave_search(search_query, count=3)
+
+    if logger.isEnabledFor(logging.DEBUG): # Skip the json.dumps entirely unless debugging
+        logger.debug(f"Search results for '{search_query}':\n{json.dumps(search_results, indent=2) if search_results else 'None'}")
+
+    generation_prompt_content = build_generation_prompt(angle, search_results=search_results)
+
+    # System prefix is logged once per request by generate_drafts
+    logger.debug(f"Prompt content for Anthropic (angle '{angle}'):\n{generation_prompt_content}")
+
+    request_kwargs = dict(
+        model=GENERATION_MODEL,
+        max_tokens=1500, # Allow for longer posts
+        temperature=0.75, # Slightly higher temp for variation
+        system=system_blocks,
+        messages=[
+            {
+                "role": "user",
+                "content": generation_prompt_content
+            }
+        ]
+    )
+
+    # Send prompt to Anthropic using Messages API
+    try:
+        if on_delta or on_started:
+            # Streaming Messages API: forward deltas as they come, keep the full text for the result
+            chunks = []
+
+            def send_streaming(**kwargs):
+                with timed("anthropic_generation"):
+                    with get_anthropic_client().messages.stream(**kwargs) as stream:
+                        for text in stream.text_stream:
+                            if not chunks and on_started:
+                                on_started()
+                            chunks.append(text)
+                            if on_delta:
+                                on_delta(text)
+                        return stream.get_final_message()
+
+            # A 429 is raised when the stream opens, before any delta, so retrying cannot duplicate text
+            message = anthropic_governor.call(send_streaming, request_kwargs, PRIORITY_INTERACTIVE)
+            generated_post = "".join(chunks).strip()
+        else:
+            message = create_message("anthropic_generation", PRIORITY_INTERACTIVE, **request_kwargs)
+            # Extract text from Messages API response
+            generated_post = message.content[0].text.strip()
+    except Exception as api_err:
+        logger.error(f"Error generating draft for angle '{angle}': {api_err}")
+        return None, None
+
+    usage = usage_counts(getattr(message, "usage", None))
+    record_tokens("generation", usage)
+    logger.debug(f"Token usage for angle '{angle}': {usage}")
+
+    if not generated_post:
+        logger.info(f"Empty draft generated for angle: {angle}")
+        return None, usage
+
+    logger.info(f"Draft generated for angle: {angle}")
+    return generated_post, usage
+
+
+def generation_flight_key(system_blocks, angle, search_query):
+    """Canonical hash of everything that determines one angle's generation request."""
+    canonical = json.dumps({
+        "model": GENERATION_MODEL,
+        "system": [block["text"] for block in system_blocks],
+        "angle": angle,
+        "search_query": search_query,
+    }, sort_keys=True)
+    return "generation:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+GENERATION_MAX_DRAFTS = 3 # Drafts per generation request (per style for the multi-style fan-out)
+
+
+def generate_drafts(style_analysis, topic, key_points, cta, angles_to_explore, max_drafts=GENERATION_MAX_DRAFTS,
+                    on_delta=None, on_result=None, on_duplicate=None, cancel_event=None,
+                    searches=None, limiter=None):
+    """Generates up to `max_drafts` drafts, one per angle.
+
+    Returns (drafts in angle order, token usage summed over every Anthropic call made).
+
+    Each angle's search + generation runs on its own worker. We only launch as many
+    angles as we still need drafts for; if some of them fail, the next wave falls back
+    to the following angles (same outcome as the old serial loop, minus the waiting).
+    A draft that is a near-duplicate of an earlier one (DRAFT_DUPLICATE_THRESHOLD) is dropped
+    and replaced the same way, at most DRAFT_DUPLICATE_MAX_REGENERATIONS times per request and
+    only while angles are left to replace it; otherwise it is kept (and reported) rather than
+    thrown away after being paid for. Angles repeated in the request are only generated once.
+
+    Optional hooks (used by the streaming endpoint):
+    - on_delta(angle_index, text): called for each streamed text delta
+    - on_result(angle_index, angle, draft): called once per angle, draft is None on failure
+    - on_duplicate(angle_index, angle, duplicate_of, replaced): a draft passed to on_result is a
+      near-duplicate of the draft of angle `duplicate_of`; replaced=True when it was dropped for
+      another angle, False when it was kept
+
+    Searches run ahead of generation on the shared search pool: before each wave, the searches
+    of its angles and of the next SEARCH_FALLBACK_WINDOW angles are started, so a fallback angle
+    rarely waits for its search, while angles that are never needed cost no search. Pass
+    `searches` to share searches already started by the caller.
+
+    Used by the multi-style fan-out:
+    - searches: {search query: Future of its results}, searches already started and shared
+    - limiter: semaphore bounding concurrent angle generations across several generate_drafts calls
+    - cancel_event: threading.Event, no further waves are started once it is set, and streamed
+      angles stop early unless an identical request is waiting for the same call
+    """
+    generated_drafts = []
+    kept_signatures = [] # (angle_index, MinHash signature) of each kept draft
+    usage_total = {}
+    dedupe = app.config["DRAFT_DEDUP_AT_GENERATION"]
+    threshold = app.config["DRAFT_DUPLICATE_THRESHOLD"]
+    regenerations_left = app.config["DRAFT_DUPLICATE_MAX_REGENERATIONS"]
+
+    # The same angle twice (ignoring case and spacing) would only buy a near-identical draft
+    remaining_angles, seen_angles = [], set()
+    for angle_index, angle in enumerate(angles_to_explore):
+        angle_key = " ".join(str(angle).lower().split())
+        if angle_key not in seen_angles:
+            seen_angles.add(angle_key)
+            remaining_angles.append((angle_index, angle))
+    max_workers = max(1, min(app.config["GENERATION_CONCURRENCY"], max_drafts))
+    searches = dict(searches or {})
+
+    def search_ahead(count):
+        """Starts the searches of the next `count` remaining angles that have none yet."""
+        queries = [f"{topic} {angle}" for _, angle in remaining_angles[:count]]
+        searches.update(start_searches(query for query in queries if query not in searches))
+
+    # Same system blocks for every angle. With a cacheable prefix, the first angle writes the cache
+    # entry alone; the others start once its response has begun (or failed) and read the entry
+    # instead of each paying for a write of their own
+    system_blocks = build_generation_system(style_analysis, topic, key_points, cta=cta)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("System prompt for Anthropic (cached prefix):\n" + "\n".join(block["text"] for block in system_blocks))
+    prefix_cached = threading.Event()
+    if "cache_control" not in system_blocks[0]:
+        prefix_cached.set() # Nothing to wait for
+
+    def run_angle(angle_index, angle, writes_prefix=False):
+        if not writes_prefix:
+            prefix_cached.wait() # Outside the limiter: waiting angles hold no generation slot
+        try:
+            return generate_angle(angle_index, angle, on_started=prefix_cached.set if writes_prefix else None)
+        finally:
+            if writes_prefix:
+                prefix_cached.set() # Failed (or shared another request's call): stop holding the others back
+
+    def generate_angle(angle_index, angle, on_started=None):
+        search_query = f"{topic} {angle}"
+        search = searches.get(search_query)
+        flight_key = generation_flight_key(system_blocks, angle, search_query)
+        delta_handler = None
+        if on_delta:
+            def delta_handler(text):
+                if cancel_event is not None and cancel_event.is_set():
+                    if not single_flight.waiting(flight_key):
+                        # Nobody needs the rest: abort this angle's stream (surfaces as a failed draft)
+                        raise RuntimeError("Client disconnected")
+                    return # Identical requests share this call: finish it for them
+                on_delta(angle_index, text)
+        # The same prompt already being generated (double submit) is shared rather than paid twice
+        with limiter or contextlib.nullcontext():
+            (draft, usage), shared = single_flight.do(
+                flight_key,
+                lambda: generate_draft_for_angle(system_blocks, angle, search_query, angle_index,
+                                                 on_delta=delta_handler, search=search, on_started=on_started)
+            )
+        if shared:
+            usage = None # Paid for by the request that made the call
+            if draft and delta_handler:
+                delta_handler(draft) # Nothing was streamed to this caller
+        if on_result:
+            on_result(angle_index, angle, draft)
+        return draft, usage
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generate") as executor:
+        while remaining_angles and len(generated_drafts) < max_drafts:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            wave = remaining_angles[:max_drafts - len(generated_drafts)]
+            search_ahead(len(wave) + app.config["SEARCH_FALLBACK_WINDOW"])
+            remaining_angles = remaining_angles[len(wave):]
+            futures = [executor.submit(run_angle, i, angle, writes_prefix=not prefix_cached.is_set() and n == 0)
+                       for n, (i, angle) in enumerate(wave)]
+            replacements = 0 # Duplicates of this wave dropped for one of the remaining angles
+            # Collect in submission order so drafts always come back in angle order
+            for (angle_index, angle), future in zip(wave, futures):
+                draft, usage = future.result()
+                if usage:
+                    add_usage(usage_total, usage)
+                if draft and dedupe:
+                    signature = similarity.signature(draft)
+                    duplicates = similarity.near_duplicates(signature, kept_signatures, threshold)
+                    if duplicates:
+                        duplicate_of, score = duplicates[0]
+                        replaced = regenerations_left > 0 and len(remaining_angles) > replacements
+                        logger.info(f"{'Dropping' if replaced else 'Keeping'} draft for angle '{angle}': "
+                                    f"{score:.2f} similar to angle {duplicate_of + 1}'s draft")
+                        if on_duplicate:
+                            on_duplicate(angle_index, angle, duplicate_of, replaced)
+                        if replaced:
+                            regenerations_left -= 1 # Another angle will be paid for instead
+                            replacements += 1
+                            continue
+                    kept_signatures.append((angle_index, signature))
+                if draft:
+                    generated_drafts.append(draft)
+
+    if usage_total:
+        logger.info(f"Generation token usage: {usage_total}")
+    return generated_drafts, usage_total
+
+
+def validate_generation_request(data):
+    """Returns an error body if required generation fields are missing, else None."""
+    data = data or {}
+    if not data.get('style_id') or not data.get('topic') or not data.get('key_points'):
+        return {"error": "Missing required fields (style_id, topic, key_points)"}
+    return None
+
+
+def load_generation_request(data):
+    """Validates a generation request body and loads its style profile.
+
+    Returns (inputs, None) on success or (None, (error body, status_code)) on a client error.
+    """
+    data = data or {}
+    # Basic validation
+    validation_error = validate_generation_request(data)
+    if validation_error:
+        return None, (validation_error, 400)
+
     style_id = data.get('style_id')
     topic = data.get('topic')
     key_points = data.get('key_points')
     cta = data.get('cta')
+
+    # Retrieve style profile, cached in-process (raises InvalidId for malformed ids, handled by the caller)
+    style_profile = get_style_profile(style_id)
+    if not style_profile:
+        return None, ({"error": "Style not found"}, 404)
+
+    return {
+        "style_id": style_id,
+        "style_analysis": style_profile.get('analysis', {}),
+        "topic": topic,
+        "key_points": key_points,
+        "cta": cta,
+        "angles": parse_angles(data),
+    }, None
+
+
+def parse_angles(data):
+    """Angles to explore (one draft each), from the optional `subjects_or_angles`."""
     # New optional input for variations
     subjects_or_angles = data.get('subjects_or_angles', []) # Expect a list of strings
     if isinstance(subjects_or_angles, str): # Handle if a single string is passed
         subjects_or_angles = [subjects_or_angles] if subjects_or_angles.strip() else []
+    max_angles = app.config["GENERATION_MAX_ANGLES"]
+    if len(subjects_or_angles) > max_angles:
+        # Each angle may cost a search and a generation; extra ones are ignored
+        logger.warning(f"Request has {len(subjects_or_angles)} angles, only the first {max_angles} are used")
+        subjects_or_angles = subjects_or_angles[:max_angles]
+    # Determine search queries/angles for variations
+    return subjects_or_angles if subjects_or_angles else [data.get('topic')] # Default to topic if no angles
 
-    # Basic validation
-    if not style_id or not topic or not key_points:
-        return jsonify({"error": "Missing required fields (style_id, topic, key_points)"}), 400
+
+def generate_post_payload(data):
+    """Runs the full generation flow. Returns (response body, HTTP status).
+
+    Shared by the synchronous endpoint and the background job worker.
+    """
+    if not get_anthropic_client():
+         return {"error": "Anthropic client not initialized. Check API key."}, 500
 
     try:
-        # 2. Retrieve style profile (no changes here)
-        styles_collection = mongo.db.styles
-        style_object_id = ObjectId(style_id)
-        style_profile = styles_collection.find_one({"_id": style_object_id})
-        if not style_profile:
-            return jsonify({"error": "Style not found"}), 404
-        style_analysis = style_profile.get('analysis', {})
+        # 1. Get inputs and 2. retrieve style profile
+        inputs, error_response = load_generation_request(data)
+        if error_response:
+            return error_response
 
         # --- Web Search & Multi-Generation Logic ---
-        generated_drafts = []
-        search_context_base = f"Topic: {topic}. Key Points: {key_points}. "
+        generated_drafts, usage = generate_drafts(
+            inputs["style_analysis"], inputs["topic"], inputs["key_points"], inputs["cta"], inputs["angles"]
+        )
 
-        # Determine search queries/angles for variations
-        angles_to_explore = subjects_or_angles if subjects_or_angles else [topic] # Default to topic if no angles
-        max_drafts = 3 # Limit the number of generated drafts
+        # 5. Return collected drafts
+        if not generated_drafts:
+             return {"error": "Failed to generate any drafts. Check inputs or logs."}, 500
 
-        for i, angle in enumerate(angles_to_explore):
-            if len(generated_drafts) >= max_drafts:
-                break
+        return {"generated_posts": generated_drafts, "usage": usage}, 200
 
-            print(f"Exploring angle {i+1}: {angle}")
-            search_query = f"{topic} {angle}"
+    except ValueError as e:
+        logger.warning(f"Invalid style ID format: {e}")
+        return {"error": "Invalid style ID format"}, 400
+    except Exception as e:
+        logger.exception(f"Unexpected outer error during post generation: {e}")
+        return {"error": "An unexpected error occurred during post generation."}, 500
 
-            # Call the REAL search function
-            search_results = perform_brave_search(search_query, count=3)
 
-            # --- Add Logging for Search Results ---
-            print(f"--- Search Results for '{search_query}': ---")
-            print(json.dumps(search_results, indent=2) if search_results else "None")
-            print("-------------------------------------")
-            # --- End Logging ---
+def format_sse(event, data):
+    """Formats a single Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-            search_summary = "No specific web search results available for this angle." # Default
-            if search_results:
-                search_summary = "\n\nRelevant Web Search Snippets:\n"
-                for res in search_results:
-                    search_summary += f"- Title: {res.get('title', 'N/A')}\n  Snippet: {res.get('description', 'N/A')}\n"
 
-            # 3. Construct prompt for Anthropic API (incorporating search results)
-            # --- Prompt Refinement ---
-            simplified_topic = topic # Use the user's topic directly here
-            simplified_key_points = key_points # Use the user's points directly here
+# --- Post Generation Endpoint (Modified to use real search) ---
+@app.route('/api/generate-post', methods=['POST'])
+def generate_post():
+    if not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
 
-            # Construct the user message content for Messages API - More general instructions
-            generation_prompt_content = f"""You are an AI assistant helping a user write a LinkedIn post draft based on their established writing style, the provided requirements, and relevant web search results.
+    data = request.get_json()
+    # Clients sending "Prefer: respond-async" get a job id back instead of waiting on Claude
+    if wants_async_response():
+        validation_error = validate_generation_request(data)
+        if validation_error:
+            return jsonify(validation_error), 400
+        return enqueue_job_response(JOB_TYPE_GENERATE_POST, data)
+
+    body, status = generate_post_payload(data)
+    return jsonify(body), status
+
+
+# --- Streaming Post Generation Endpoint (Server-Sent Events) ---
+# Emits, in order of arrival:
+#   event: delta        {"angle_index", "text"}            - streamed token text for one angle
+#   event: draft        {"angle_index", "angle", "draft"}  - a finished draft
+#   event: angle_failed {"angle_index", "angle"}           - an angle produced no draft
+#   event: draft_duplicate {"angle_index", "angle", "duplicate_of", "replaced"} - that draft is a
+#                          near-duplicate of angle `duplicate_of`'s draft; dropped for another
+#                          angle when "replaced", else kept in the final drafts
+#   event: done         {"generated_posts", "usage"}       - final drafts (angle order) + token usage
+#   event: error        {"error"}                          - generation failed as a whole
+@app.route('/api/generate-post/stream', methods=['POST'])
+def generate_post_stream():
+    if not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
 
-User's Writing Style Analysis:
-<style_analysis>
-{json.dumps(style_analysis, indent=2)}
-</style_analysis>
+    # Validation and style lookup happen up front so errors still come back as plain JSON
+    try:
+        inputs, error_response = load_generation_request(request.get_json())
+        if error_response:
+            body, status = error_response
+            return jsonify(body), status
+    except ValueError as e:
+        logger.warning(f"Invalid style ID format: {e}")
+        return jsonify({"error": "Invalid style ID format"}), 400
+    except Exception as e:
+        logger.exception(f"Unexpected error preparing streamed post generation: {e}")
+        return jsonify({"error": "An unexpected error occurred during post generation."}), 500
 
-Post Requirements:
-- **Main Topic:** {simplified_topic}
-- **Key Points User Wants to Include:**
-{simplified_key_points}
-- **Specific Angle/Focus for this draft:** {angle}
-"""
-            if cta:
-                generation_prompt_content += f"- **Desired Call-to-Action:** {cta}\n"
+    def run_generation(emit, cancelled):
+        def on_delta(angle_index, text):
+            emit("delta", {"angle_index": angle_index, "text": text}) # generate_drafts stops once cancelled
 
-            # Add Search Context AFTER requirements
-            generation_prompt_content += "\n" # Add separation
-            generation_prompt_content += search_summary # Add search summary
+        def on_result(angle_index, angle, draft):
+            if draft:
+                emit("draft", {"angle_index": angle_index, "angle": angle, "draft": draft})
+            else:
+                emit("angle_failed", {"angle_index": angle_index, "angle": angle})
 
-            # Remove the explicit style instructions section
-            # The model should infer style from the <style_analysis> block.
+        def on_duplicate(angle_index, angle, duplicate_of, replaced):
+            emit("draft_duplicate", {"angle_index": angle_index, "angle": angle, "duplicate_of": duplicate_of,
+                                     "replaced": replaced})
 
-            # Final Instruction with guidance on using search context and angle
-            generation_prompt_content += f"""\n**Final Instruction:**
-- Write a LinkedIn post draft that adheres to the User's Writing Style Analysis provided above.
-- Focus the content on the angle: '{angle}'.
-- Integrate relevant information or viewpoints found in the 'Relevant Web Search Snippets' provided above into the discussion for this angle.
-- Generate only the text of the LinkedIn post draft itself, without any extra commentary or preamble.
-"""
-            # --- End Prompt Refinement ---
+        try:
+            drafts, usage = generate_drafts(
+                inputs["style_analysis"], inputs["topic"], inputs["key_points"], inputs["cta"], inputs["angles"],
+                on_delta=on_delta, on_result=on_result, on_duplicate=on_duplicate, cancel_event=cancelled
+            )
+            if drafts:
+                emit("done", {"generated_posts": drafts, "usage": usage})
+            else:
+                emit("error", {"error": "Failed to generate any drafts. Check inputs or logs."})
+        except Exception as e:
+            logger.exception(f"Unexpected error during streamed post generation: {e}")
+            emit("error", {"error": "An unexpected error occurred during post generation."})
 
-            # --- Logging (remains the same) ---
-            print(f"--- Prompt Content for Anthropic (Angle: '{angle}'): ---") # Adjusted log label slightly
-            print(generation_prompt_content)
-            print("-------------------------------------------------------------")
-            # --- End Logging ---
+    return stream_sse(run_generation, "generate-stream")
 
-            # 4. Send prompt to Anthropic using Messages API
-            try:
-                message = anthropic_client.messages.create(
-                    model="claude-3-7-sonnet-20250219", # Use specific Sonnet 3.7 model ID
-                    max_tokens=1500, # Allow for longer posts
-                    temperature=0.75, # Slightly higher temp for variation
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": generation_prompt_content
-                        }
-                    ]
-                )
-                # Extract text from Messages API response
-                generated_post = message.content[0].text.strip()
-
-                if generated_post:
-                    generated_drafts.append(generated_post)
-                    print(f"--- Draft generated for angle: {angle} ---")
-                else:
-                     print(f"--- Warning: Empty draft generated for angle: {angle} ---")
-            except Exception as api_err:
-                print(f"Error generating draft for angle '{angle}': {api_err}")
-        # --- End Loop ---
 
-        # 5. Return collected drafts
-        if not generated_drafts:
-             return jsonify({"error": "Failed to generate any drafts. Check inputs or logs."}), 500
+def stream_sse(produce, thread_name):
+    """Runs produce(emit, cancelled) on a background thread and streams what it emits as SSE.
 
-        return jsonify({"generated_posts": generated_drafts})
+    emit(event, payload) sends one event; `cancelled` (a threading.Event) is set once the
+    client goes away, so the producer can stop early.
+    """
+    events = queue.Queue()
+    cancelled = threading.Event()
+    finished = object() # Sentinel marking the end of the event stream
 
-    except ValueError as e:
-        print(f"Invalid style ID format: {e}")
-        return jsonify({"error": "Invalid style ID format"}), 400
+    def run():
+        try:
+            produce(lambda event, payload: events.put((event, payload)), cancelled)
+        finally:
+            events.put(finished)
+
+    threading.Thread(target=run, name=thread_name, daemon=True).start()
+
+    def event_stream():
+        try:
+            while True:
+                item = events.get()
+                if item is finished:
+                    break
+                event, payload = item
+                yield format_sse(event, payload)
+        finally:
+            cancelled.set()
+
+    return Response(event_stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # Disable proxy buffering so deltas are flushed immediately
+    })
+
+
+# --- Multi-Style Fan-Out Generation (Server-Sent Events) ---
+# One topic rendered in several client voices. Body: as /api/generate-post, with "style_ids"
+# (up to MULTI_STYLE_MAX_STYLES) instead of "style_id". All styles are loaded with one $in
+# query, each angle's search runs once and is shared by every style, and the style x angle
+# generations run concurrently with at most MULTI_STYLE_CONCURRENCY Claude calls in flight.
+def load_multi_style_request(data):
+    """Validates a fan-out request and loads its styles.
+
+    Returns (inputs, None) on success or (None, (error body, status_code)) on a client error.
+    """
+    data = data or {}
+    style_ids = data.get('style_ids')
+    if not isinstance(style_ids, list) or not style_ids or not all(isinstance(i, str) and i for i in style_ids):
+        return None, ({"error": "style_ids must be a non-empty list of style ids"}, 400)
+    style_ids = list(dict.fromkeys(style_ids)) # Each style once, request order
+    if len(style_ids) > app.config["MULTI_STYLE_MAX_STYLES"]:
+        return None, ({"error": f"Too many styles in one request (max {app.config['MULTI_STYLE_MAX_STYLES']})."}, 400)
+    if not data.get('topic') or not data.get('key_points'):
+        return None, ({"error": "Missing required fields (topic, key_points)"}, 400)
+
+    try:
+        profiles = get_style_profiles(style_ids)
+    except InvalidId:
+        return None, ({"error": "Invalid style ID format"}, 400)
+    missing = [style_id for style_id in style_ids if style_id not in profiles]
+    if missing:
+        return None, ({"error": "Style not found", "missing_style_ids": missing}, 404)
+
+    return {
+        "styles": [profiles[style_id] for style_id in style_ids],
+        "topic": data['topic'],
+        "key_points": data['key_points'],
+        "cta": data.get('cta'),
+        "angles": parse_angles(data),
+    }, None
+
+
+# Emits, in order of completion:
+#   event: draft           {"style_id", "angle_index", "angle", "draft"}
+#   event: angle_failed    {"style_id", "angle_index", "angle"}
+#   event: draft_duplicate {"style_id", "angle_index", "angle", "duplicate_of", "replaced"}
+#   event: style_done      {"style_id", "style_name", "generated_posts"} - one style finished (angle order)
+#   event: done            {"results": [{"style_id", "style_name", "generated_posts"}], "usage"}
+#   event: error           {"error"}
+@app.route('/api/generate-post/multi', methods=['POST'])
+def generate_post_multi():
+    if not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+
+    try:
+        inputs, error_response = load_multi_style_request(request.get_json(silent=True))
+        if error_response:
+            body, status = error_response
+            return jsonify(body), status
     except Exception as e:
-        print(f"Unexpected outer error during post generation: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Unexpected error preparing multi-style generation: {e}")
         return jsonify({"error": "An unexpected error occurred during post generation."}), 500
 
+    topic, angles = inputs["topic"], inputs["angles"]
+
+    def run_generation(emit, cancelled):
+        # Every style explores the same angles, so the first searches are started once, right away
+        # (fallback searches are started by each style as needed, and coalesced)
+        queries = list(dict.fromkeys(f"{topic} {angle}" for angle in angles))
+        queries = queries[:GENERATION_MAX_DRAFTS + app.config["SEARCH_FALLBACK_WINDOW"]]
+        limiter = threading.BoundedSemaphore(max(1, app.config["MULTI_STYLE_CONCURRENCY"]))
+        usage_total = {}
+        results = []
+
+        def generate_style(style):
+            style_id = str(style["_id"])
+
+            def on_result(angle_index, angle, draft):
+                if draft:
+                    emit("draft", {"style_id": style_id, "angle_index": angle_index, "angle": angle, "draft": draft})
+                else:
+                    emit("angle_failed", {"style_id": style_id, "angle_index": angle_index, "angle": angle})
+
+            def on_duplicate(angle_index, angle, duplicate_of, replaced):
+                emit("draft_duplicate", {"style_id": style_id, "angle_index": angle_index, "angle": angle,
+                                         "duplicate_of": duplicate_of, "replaced": replaced})
+
+            drafts, usage = generate_drafts(
+                style.get("analysis", {}), topic, inputs["key_points"], inputs["cta"], angles,
+                on_result=on_result, on_duplicate=on_duplicate, cancel_event=cancelled,
+                searches=searches, limiter=limiter,
+            )
+            result = {"style_id": style_id, "style_name": style.get("name"), "generated_posts": drafts}
+            emit("style_done", result)
+            return result, usage
+
+        try:
+            searches = start_searches(queries)
+            with ThreadPoolExecutor(max_workers=len(inputs["styles"]), thread_name_prefix="multi-style") as style_pool:
+                futures = [style_pool.submit(generate_style, style) for style in inputs["styles"]]
+                for future in futures:
+                    result, usage = future.result()
+                    results.append(result) # Request order
+                    for field, value in usage.items():
+                        usage_total[field] = usage_total.get(field, 0) + value
+            if any(result["generated_posts"] for result in results):
+                emit("done", {"results": results, "usage": usage_total})
+            else:
+                emit("error", {"error": "Failed to generate any drafts. Check inputs or logs."})
+        except Exception as e:
+            logger.exception(f"Unexpected error during multi-style generation: {e}")
+            emit("error", {"error": "An unexpected error occurred during post generation."})
+
+    return stream_sse(run_generation, "generate-multi")
+
+# --- Background Jobs ---
+JOB_TYPE_ANALYZE_STYLE = "analyze-style"
+JOB_TYPE_GENERATE_POST = "generate-post"
+
+job_queue = JobQueue(
+    lambda: mongo.db.jobs,
+    max_workers=app.config["JOB_WORKERS"],
+    lease_seconds=app.config["JOB_LEASE_SECONDS"],
+    app=app,
+)
+job_queue.register(JOB_TYPE_ANALYZE_STYLE, lambda payload: analyze_and_save_style_payload(payload.get('posts_text'), payload.get('mode')))
+job_queue.register(JOB_TYPE_GENERATE_POST, generate_post_payload)
+
+# Synchronous validation per job type, so bad requests still fail fast with a 400
+JOB_VALIDATORS = {
+    JOB_TYPE_ANALYZE_STYLE: lambda payload: validate_analysis_mode(payload.get('mode') or ANALYSIS_MODE_FULL)
+                            or validate_posts_text(payload.get('posts_text')),
+    JOB_TYPE_GENERATE_POST: validate_generation_request,
+}
+
+
+def wants_async_response():
+    """True if the client asked for a job id instead of the result (RFC 7240 Prefer header)."""
+    return "respond-async" in request.headers.get("Prefer", "").lower()
+
+
+def enqueue_job_response(job_type, payload):
+    job_id = job_queue.submit(job_type, payload)
+    logger.info(f"Queued {job_type} job with ID: {job_id}")
+    return jsonify({
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "status_url": url_for('get_job', job_id=job_id),
+        "events_url": url_for('job_events', job_id=job_id),
+        }), 202 # 202 Accepted: the work happens in the background
+
+
+# Generic job submission: {"type": "analyze-style" | "generate-post", "payload": {...}}
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    if not get_anthropic_client():
+         return jsonify({"error": "Anthropic client not initialized. Check API key."}), 500
+
+    data = request.get_json() or {}
+    job_type = data.get('type')
+    payload = data.get('payload') or {}
+    if job_type not in JOB_VALIDATORS:
+        return jsonify({"error": f"Unknown job type. Expected one of: {', '.join(job_queue.job_types)}"}), 400
+    validation_error = JOB_VALIDATORS[job_type](payload)
+    if validation_error:
+        return jsonify(validation_error), 400
+
+    try:
+        return enqueue_job_response(job_type, payload)
+    except Exception as e:
+        logger.exception(f"Error queueing {job_type} job: {e}")
+        return jsonify({"error": "An unexpected error occurred while queueing the job."}), 500
+
+
+# Job status / result polling
+@app.route('/api/jobs/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = job_queue.get(job_id) # Read-only: workers start with the process and on submit
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job_to_json(job))
+    except Exception as e:
+        logger.exception(f"Error fetching job {job_id}: {e}")
+        return jsonify({"error": "An unexpected error occurred while fetching the job."}), 500
+
+
+# Job subscription: Server-Sent Events with a 'status' event per state change, ending in 'done'
+@app.route('/api/jobs/<string:job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if not job_queue.get(job_id):
+        return jsonify({"error": "Job not found"}), 404
+
+    poll_interval = app.config["JOB_EVENTS_POLL_SECONDS"]
+    deadline = time.monotonic() + app.config["JOB_EVENTS_TIMEOUT_SECONDS"]
+
+    def event_stream():
+        last_status = None
+        while time.monotonic() < deadline:
+            job = job_queue.get(job_id)
+            if not job:
+                yield format_sse("error", {"error": "Job not found"})
+                return
+            job_json = job_to_json(job)
+            if job_json["status"] != last_status:
+                last_status = job_json["status"]
+                yield format_sse("status", job_json)
+            if last_status in TERMINAL_STATES:
+                yield format_sse("done", job_json)
+                return
+            time.sleep(poll_interval)
+        yield format_sse("timeout", {"job_id": job_id, "status": last_status})
+
+    return Response(event_stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
 # --- Draft Endpoints ---
 
+def build_draft_doc(data):
+    """Returns (draft document, None) for a save request body, or (None, error message)."""
+    if not isinstance(data, dict):
+        return None, "Each draft must be an object"
+    draft_text = data.get('draft_text')
+    if not draft_text:
+        return None, "Missing draft_text"
+    signature = similarity.signature(draft_text)
+    return {
+        # "user_id": user_id, # Add later
+        "draft_text": draft_text,
+        # Optional context (add more fields if needed)
+        "style_id": data.get('style_id'), # Store reference to style used
+        "topic": data.get('topic'), # Store original topic for context
+        "created_at": datetime.utcnow(),
+        # Near-duplicate detection (similarity.py); never returned by the API
+        "minhash": signature,
+        "lsh_bands": similarity.band_keys(signature),
+    }, None
+
+
+MAX_REPORTED_DUPLICATES = 5
+
+def flag_near_duplicates(docs):
+    """Looks up saved drafts (and earlier drafts of the same batch) similar to each new draft doc.
+
+    Sets `near_duplicate_of` (id of the closest match) on docs that have one and returns, per doc,
+    a list of {"draft_id", "similarity"}. Saved drafts are found through the indexed LSH band keys
+    with a single query, so this stays fast however many drafts there are. Candidates sharing the
+    most band keys (the likeliest near-duplicates), then the newest, are checked first, so the
+    candidate limit drops the least likely matches.
+    """
+    for doc in docs:
+        doc.setdefault("_id", ObjectId()) # So drafts of the same batch can refer to each other
+    wanted_keys = sorted({key for doc in docs for key in doc["lsh_bands"]})
+    saved = list(mongo.db.drafts.aggregate([
+        {"$match": {"lsh_bands": {"$in": wanted_keys}}},
+        {"$project": {"minhash": 1, "lsh_bands": 1, "band_hits": {"$size": {"$filter": {
+            "input": "$lsh_bands", "as": "band", "cond": {"$in": ["$$band", wanted_keys]},
+        }}}}},
+        {"$sort": {"band_hits": -1, "_id": -1}},
+        {"$limit": app.config["DRAFT_DUPLICATE_MAX_CANDIDATES"] * len(docs)},
+    ]))
+
+    threshold = app.config["DRAFT_DUPLICATE_THRESHOLD"]
+    matches_per_doc = []
+    for position, doc in enumerate(docs):
+        doc_keys = set(doc["lsh_bands"])
+        candidates = [(c["_id"], c["minhash"]) for c in saved + docs[:position]
+                      if c.get("minhash") and doc_keys.intersection(c.get("lsh_bands", ()))]
+        matches = similarity.near_duplicates(doc["minhash"], candidates, threshold)[:MAX_REPORTED_DUPLICATES]
+        if matches:
+            doc["near_duplicate_of"] = str(matches[0][0])
+        matches_per_doc.append([{"draft_id": str(draft_id), "similarity": round(score, 2)} for draft_id, score in matches])
+    return matches_per_doc
+
+
+def find_near_duplicates_safely(docs):
+    """flag_near_duplicates, but a failed lookup only loses the flags, never the save."""
+    try:
+        return flag_near_duplicates(docs)
+    except Exception as e:
+        logger.warning(f"Near-duplicate lookup failed, saving without it: {e}")
+        return [[] for _ in docs]
+
+
 # Save New Draft
 @app.route('/api/drafts', methods=['POST'])
 def save_draft():
-    data = request.get_json()
-    draft_text = data.get('draft_text')
-    # Optional context (add more fields if needed)
-    style_id = data.get('style_id')
-    topic = data.get('topic')
-
-    if not draft_text:
-        return jsonify({"error": "Missing draft_text"}), 400
+    draft_doc, error = build_draft_doc(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
         drafts_collection = mongo.db.drafts # Use 'drafts' collection
-        draft_doc = {
-            # "user_id": user_id, # Add later
-            "draft_text": draft_text,
-            "style_id": style_id, # Store reference to style used
-            "topic": topic, # Store original topic for context
-            "created_at": datetime.utcnow()
-        }
+        near_duplicates = find_near_duplicates_safely([draft_doc])[0] # Flagged, still saved
         insert_result = drafts_collection.insert_one(draft_doc)
 
         if not insert_result.inserted_id:
              raise Exception("Failed to insert draft into database.")
 
         saved_draft_id = str(insert_result.inserted_id)
-        print(f"Draft saved successfully with ID: {saved_draft_id}")
+        logger.info(f"Draft saved successfully with ID: {saved_draft_id}")
         return jsonify({
             "message": "Draft saved successfully!",
-            "draft_id": saved_draft_id
+            "draft_id": saved_draft_id,
+            "near_duplicates": near_duplicates
             }), 201
 
     except Exception as e:
-        print(f"Error saving draft to MongoDB: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error saving draft to MongoDB: {e}")
         return jsonify({"error": "An unexpected error occurred while saving the draft."}), 500
 
-# List Saved Drafts
+
+# Save Many Drafts (one insert_many instead of a request + round trip per draft)
+# Body: {"drafts": [{"draft_text", "style_id", "topic"}, ...]}
+@app.route('/api/drafts/bulk', methods=['POST'])
+def save_drafts_bulk():
+    drafts = (request.get_json(silent=True) or {}).get('drafts')
+    if not isinstance(drafts, list) or not drafts:
+        return jsonify({"error": "Request body must contain a non-empty 'drafts' list."}), 400
+    if len(drafts) > app.config["DRAFTS_BULK_MAX_ITEMS"]:
+        return jsonify({"error": f"Too many drafts in one request (max {app.config['DRAFTS_BULK_MAX_ITEMS']})."}), 400
+
+    results, docs, positions = [], [], []
+    for i, data in enumerate(drafts):
+        draft_doc, error = build_draft_doc(data)
+        results.append({"index": i, "status": "invalid", "error": error} if error else {"index": i})
+        if draft_doc:
+            docs.append(draft_doc)
+            positions.append(i)
+
+    if docs:
+        near_duplicates = find_near_duplicates_safely(docs)
+        try:
+            insert_result = mongo.db.drafts.insert_many(docs, ordered=False)
+            inserted_ids = insert_result.inserted_ids
+        except errors.BulkWriteError as e:
+            # Unordered: the other documents were still written
+            failed_positions = {err["index"] for err in e.details.get("writeErrors", [])}
+            inserted_ids = [None if pos in failed_positions else doc.get("_id") for pos, doc in enumerate(docs)]
+        except Exception as e:
+            logger.exception(f"Error saving drafts to MongoDB: {e}")
+            return jsonify({"error": "An unexpected error occurred while saving the drafts."}), 500
+
+        for i, inserted_id, matches in zip(positions, inserted_ids, near_duplicates):
+            if inserted_id is None:
+                results[i].update({"status": "failed", "error": "Failed to save draft to database."})
+            else:
+                results[i].update({"status": "saved", "draft_id": str(inserted_id), "near_duplicates": matches})
+
+    saved = sum(1 for r in results if r["status"] == "saved")
+    logger.info(f"Bulk draft save: {saved}/{len(results)} drafts saved.")
+    if saved:
+        status_code = 201
+    elif any(r["status"] == "failed" for r in results):
+        status_code = 500 # Nothing saved and the database rejected what was valid: not the client's fault
+    else:
+        status_code = 400 # Every draft was invalid
+    return jsonify({"saved": saved, "failed": len(results) - saved, "results": results}), status_code
+
+# --- Draft listing helpers ---
+DRAFT_PREVIEW_CHARS = 280 # Length of draft_text returned in the summary view
+EPOCH = datetime(1970, 1, 1)
+
+def encode_drafts_cursor(draft):
+    """Opaque keyset cursor for the (created_at, _id) position of a draft."""
+    created_at_ms = (draft['created_at'] - EPOCH) // timedelta(milliseconds=1) # Mongo stores ms precision
+    raw = json.dumps({"t": created_at_ms, "id": str(draft['_id'])}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_drafts_cursor(cursor):
+    """Returns (created_at, ObjectId) from a cursor, raising ValueError if it is malformed."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return EPOCH + timedelta(milliseconds=int(data["t"])), ObjectId(data["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def serialize_draft(draft):
+    """Converts a draft document to JSON-friendly types."""
+    draft['_id'] = str(draft['_id']) # Convert ObjectId
+    draft.pop('minhash', None) # Internal similarity signature
+    draft.pop('lsh_bands', None)
+    # Explicitly format datetime to ISO 8601 string for reliable JS parsing
+    if 'created_at' in draft and isinstance(draft['created_at'], datetime):
+        draft['created_at'] = draft['created_at'].isoformat() + 'Z' # Add Z to indicate UTC
+    return draft
+
+
+DRAFTS_SORT = [("created_at", -1), ("_id", -1)] # Served by the (created_at, _id) index
+TEXT_SCORE = {"$meta": "textScore"}
+
+def parse_drafts_page_args():
+    """Reads the `limit` and `view` query params shared by the draft listings.
+
+    Returns (limit, view, None) or (None, None, error body).
+    """
+    try:
+        limit = int(request.args.get('limit', app.config["DRAFTS_PAGE_SIZE"]))
+    except ValueError:
+        return None, None, {"error": "limit must be an integer"}
+    limit = max(1, min(limit, app.config["DRAFTS_MAX_PAGE_SIZE"]))
+    view = request.args.get('view', 'summary')
+    if view not in ('summary', 'full'):
+        return None, None, {"error": "view must be 'summary' or 'full'"}
+    return limit, view, None
+
+
+def keyset_after_filter(after_created_at, after_id):
+    """Everything strictly "older" than the cursor in (created_at, _id) order."""
+    return {"$or": [
+        {"created_at": {"$lt": after_created_at}},
+        {"created_at": after_created_at, "_id": {"$lt": after_id}},
+    ]}
+
+
+def fetch_drafts_page(query, limit, view, skip=0, ranked=False):
+    """Runs a draft listing query and returns up to `limit` + 1 documents (the extra one tells
+    whether another page exists). `ranked` sorts text search matches by relevance first."""
+    drafts_collection = mongo.db.drafts
+    sort = ([("score", TEXT_SCORE)] if ranked else []) + DRAFTS_SORT
+    if view == 'full':
+        projection = {'_id': 1, 'draft_text': 1, 'topic': 1, 'style_id': 1, 'created_at': 1}
+        if ranked:
+            projection['score'] = TEXT_SCORE
+        return list(drafts_collection.find(query, projection).sort(sort).skip(skip).limit(limit + 1))
+
+    # Truncate on the server so the full text never leaves MongoDB for list views
+    draft_text = {"$ifNull": ["$draft_text", ""]}
+    projection = {
+        '_id': 1, 'topic': 1, 'style_id': 1, 'created_at': 1,
+        'draft_preview': {"$substrCP": [draft_text, 0, DRAFT_PREVIEW_CHARS]},
+        'is_truncated': {"$gt": [{"$strLenCP": draft_text}, DRAFT_PREVIEW_CHARS]},
+    }
+    if ranked:
+        projection['score'] = TEXT_SCORE
+    pipeline = [{"$match": query}, {"$sort": dict(sort)}]
+    if skip:
+        pipeline.append({"$skip": skip})
+    pipeline += [{"$limit": limit + 1}, {"$project": projection}]
+    return list(drafts_collection.aggregate(pipeline))
+
+
+# List Saved Drafts (newest first, keyset-paginated)
+# Query params:
+#   limit - page size (default DRAFTS_PAGE_SIZE, capped at DRAFTS_MAX_PAGE_SIZE)
+#   after - `next_cursor` from the previous page
+#   view  - "summary" (default, truncated `draft_preview`) or "full" (complete `draft_text`)
 @app.route('/api/drafts', methods=['GET'])
 def get_drafts():
+    limit, view, error = parse_drafts_page_args()
+    if error:
+        return jsonify(error), 400
+
+    query = {} # TODO: Add user filtering later
+    after = request.args.get('after')
+    if after:
+        try:
+            query = keyset_after_filter(*decode_drafts_cursor(after))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
     try:
-        drafts_collection = mongo.db.drafts
-        # TODO: Add user filtering later
-        # Fetch necessary fields - maybe limit text length for list view?
-        all_drafts = list(drafts_collection.find({}, {
-            '_id': 1,
-            'draft_text': 1, # Fetch full text for now
-            'topic': 1,
-            'created_at': 1
-        }).sort("created_at", -1)) # Sort by newest first
-
-        for draft in all_drafts:
-            draft['_id'] = str(draft['_id']) # Convert ObjectId
-            # Explicitly format datetime to ISO 8601 string for reliable JS parsing
-            if 'created_at' in draft and isinstance(draft['created_at'], datetime):
-                draft['created_at'] = draft['created_at'].isoformat() + 'Z' # Add Z to indicate UTC
-
-        return jsonify(all_drafts)
+        drafts = fetch_drafts_page(query, limit, view)
+
+        # We fetched one extra document to know whether another page exists
+        next_cursor = None
+        if len(drafts) > limit:
+            drafts = drafts[:limit]
+            next_cursor = encode_drafts_cursor(drafts[-1])
+
+        return jsonify({
+            "drafts": [serialize_draft(draft) for draft in drafts],
+            "next_cursor": next_cursor,
+        })
 
     except Exception as e:
-        print(f"Error fetching drafts from MongoDB: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error fetching drafts from MongoDB: {e}")
         return jsonify({"error": "An unexpected error occurred while fetching drafts."}), 500
 
+
+def parse_date_param(name):
+    """Parses an ISO 8601 date or datetime query param into a naive UTC datetime (None if absent)."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None) # Stored created_at values are naive UTC
+    return parsed
+
+
+def encode_search_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor):
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["o"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if offset < 0:
+        raise ValueError("Invalid cursor: negative offset")
+    return offset
+
+
+# Search Saved Drafts
+# Query params:
+#   q        - words to find in draft_text and topic (MongoDB text search: stemmed words,
+#              "exact phrases", -excluded); results are ranked by relevance, then newest first
+#   style_id - only drafts generated with this style
+#   from, to - created_at range, ISO 8601 (`from` inclusive, `to` exclusive)
+#   facets   - "true" to also count matching drafts per style_id (first page only)
+#   limit, after, view - as for GET /api/drafts (`after` is this endpoint's `next_cursor`)
+# Without `q` the filtered drafts are listed newest first with keyset pagination.
+@app.route('/api/drafts/search', methods=['GET'])
+def search_drafts():
+    limit, view, error = parse_drafts_page_args()
+    if error:
+        return jsonify(error), 400
+    try:
+        created_from, created_to = parse_date_param('from'), parse_date_param('to')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    text = request.args.get('q', '').strip()
+    filters = {}
+    if request.args.get('style_id'):
+        filters["style_id"] = request.args['style_id']
+    if created_from or created_to:
+        filters["created_at"] = {k: v for k, v in (("$gte", created_from), ("$lt", created_to)) if v}
+    match = {"$text": {"$search": text}, **filters} if text else dict(filters)
+
+    after = request.args.get('after')
+    query, skip = match, 0
+    try:
+        if after and text:
+            # Relevance scores cannot be range-queried, so ranked pages are addressed by offset
+            skip = decode_search_cursor(after)
+            if skip > app.config["DRAFTS_SEARCH_MAX_RESULTS"]:
+                return jsonify({"error": "Too far into the results; refine the search instead."}), 400
+        elif after:
+            query = {"$and": [match, keyset_after_filter(*decode_drafts_cursor(after))]} if match else \
+                keyset_after_filter(*decode_drafts_cursor(after))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    try:
+        drafts = fetch_drafts_page(query, limit, view, skip=skip, ranked=bool(text))
+
+        next_cursor = None
+        if len(drafts) > limit:
+            drafts = drafts[:limit]
+            next_cursor = encode_search_cursor(skip + limit) if text else encode_drafts_cursor(drafts[-1])
+
+        body = {"drafts": [serialize_draft(draft) for draft in drafts], "next_cursor": next_cursor}
+        if request.args.get('facets', '').lower() in ('1', 'true', 'yes') and not after:
+            body["facets"] = {"style_id": [
+                {"value": facet["_id"], "count": facet["count"]}
+                for facet in mongo.db.drafts.aggregate([
+                    {"$match": match},
+                    {"$group": {"_id": "$style_id", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                    {"$limit": 50},
+                ])
+            ]}
+        return jsonify(body)
+
+    except Exception as e:
+        logger.exception(f"Error searching drafts in MongoDB: {e}")
+        return jsonify({"error": "An unexpected error occurred while searching drafts."}), 500
+
+# Get a Single Draft (full text)
+@app.route('/api/drafts/<string:draft_id>', methods=['GET'])
+def get_draft(draft_id):
+    try:
+        drafts_collection = mongo.db.drafts
+        draft = drafts_collection.find_one({"_id": ObjectId(draft_id)})
+        if not draft:
+            return jsonify({"error": "Draft not found"}), 404
+        return jsonify(serialize_draft(draft))
+
+    except InvalidId:
+        logger.warning(f"Invalid ObjectId format provided for draft lookup: {draft_id}")
+        return jsonify({"error": "Invalid draft ID format"}), 400
+    except Exception as e:
+        logger.exception(f"Error fetching draft {draft_id} from MongoDB: {e}")
+        return jsonify({"error": "An unexpected error occurred while fetching the draft."}), 500
+
+
 # Delete Saved Draft
 @app.route('/api/drafts/<string:draft_id>', methods=['DELETE'])
 def delete_draft(draft_id):
@@ -488,23 +2547,171 @@ def delete_draft(draft_id):
         delete_result = drafts_collection.delete_one({"_id": draft_object_id})
 
         if delete_result.deleted_count == 1:
-            print(f"Successfully deleted draft with ID: {draft_id}")
+            logger.info(f"Successfully deleted draft with ID: {draft_id}")
             return jsonify({"message": "Draft deleted successfully"}), 200
         else:
-            print(f"Attempted to delete draft ID: {draft_id}, but it was not found.")
+            logger.warning(f"Attempted to delete draft ID: {draft_id}, but it was not found.")
             return jsonify({"error": "Draft not found"}), 404
 
     except errors.InvalidId:
-        print(f"Invalid ObjectId format provided for draft deletion: {draft_id}")
+        logger.warning(f"Invalid ObjectId format provided for draft deletion: {draft_id}")
         return jsonify({"error": "Invalid draft ID format"}), 400
     except Exception as e:
-        print(f"Error deleting draft {draft_id} from MongoDB: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error deleting draft {draft_id} from MongoDB: {e}")
         return jsonify({"error": "An unexpected error occurred while deleting the draft."}), 500
 
-# --- Main Execution ---
+# Delete Many Drafts (one delete_many instead of a request + round trip per draft)
+# Body: {"ids": ["<draft id>", ...]}
+@app.route('/api/drafts', methods=['DELETE'])
+def delete_drafts_bulk():
+    draft_ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(draft_ids, list) or not draft_ids:
+        return jsonify({"error": "Request body must contain a non-empty 'ids' list."}), 400 # Never "delete everything"
+    if len(draft_ids) > app.config["DRAFTS_BULK_MAX_ITEMS"]:
+        return jsonify({"error": f"Too many ids in one request (max {app.config['DRAFTS_BULK_MAX_ITEMS']})."}), 400
+
+    results, object_ids = [], {}
+    for draft_id in draft_ids:
+        result = {"draft_id": draft_id}
+        results.append(result)
+        try:
+            object_ids[draft_id] = ObjectId(draft_id)
+        except (InvalidId, TypeError):
+            result.update({"status": "invalid", "error": "Invalid draft ID format"})
+
+    try:
+        drafts_collection = mongo.db.drafts
+        wanted = list(set(object_ids.values()))
+        # delete_many only returns a count; look up which ids exist first so each one gets a status
+        existing = {doc["_id"] for doc in drafts_collection.find({"_id": {"$in": wanted}}, {"_id": 1})} if wanted else set()
+        deleted_count = drafts_collection.delete_many({"_id": {"$in": list(existing)}}).deleted_count if existing else 0
+    except Exception as e:
+        logger.exception(f"Error deleting drafts from MongoDB: {e}")
+        return jsonify({"error": "An unexpected error occurred while deleting the drafts."}), 500
+
+    # If another request deleted some of them in between, the count comes up short and there is no
+    # telling which ones this request removed: those get "unconfirmed" (they are gone either way)
+    found_status = "deleted" if deleted_count == len(existing) else "unconfirmed"
+    if found_status == "unconfirmed":
+        logger.warning(f"Bulk draft delete: found {len(existing)} drafts but deleted {deleted_count}; "
+                       f"some were deleted concurrently.")
+    for result in results:
+        if "status" not in result:
+            result["status"] = found_status if object_ids[result["draft_id"]] in existing else "not_found"
+
+    logger.info(f"Bulk draft delete: {deleted_count} of {len(draft_ids)} requested drafts deleted.")
+    return jsonify({"deleted": deleted_count, "results": results}), 200
+
+# --- Indexes ---
+def ensure_indexes(check_plans=True):
+    """Creates any missing indexes from indexes.INDEX_SPECS and logs a report (idempotent).
+
+    Returns (report, warnings); warnings flag hot queries that would scan or sort in memory.
+    """
+    report = indexes.ensure_indexes(mongo.db)
+    for entry in report:
+        if entry["status"] in ("created", "conflict", "error"):
+            log = logger.info if entry["status"] == "created" else logger.warning
+            log(f"Index {entry['collection']}.{entry['index']}: {entry['status']} {entry.get('error', '')}".rstrip())
+    for build in indexes.index_builds_in_progress(mongo.db):
+        logger.info(f"Index build in progress on {build['collection']}: {build['message']}")
+
+    warnings = indexes.check_query_plans(mongo.db) if check_plans else []
+    for warning in warnings:
+        logger.warning(f"Slow query plan: {warning}")
+    return report, warnings
+
+@app.cli.command("ensure-indexes")
+@click.option("--skip-plan-check", is_flag=True, help="Do not explain the hot queries afterwards.")
+def ensure_indexes_command(skip_plan_check):
+    """Creates MongoDB indexes and reports their status (flask --app app ensure-indexes)."""
+    report, warnings = ensure_indexes(check_plans=not skip_plan_check)
+    for entry in report:
+        print(f"{entry['collection']:<18} {entry['index']:<26} {entry['status']}")
+    print(f"{len(warnings)} slow query warning(s).")
+
+@app.cli.command("backfill-draft-signatures")
+@click.option("--batch-size", default=500, show_default=True, help="Drafts updated per bulk write.")
+def backfill_draft_signatures_command(batch_size):
+    """Adds near-duplicate signatures to drafts saved before they existed (flask --app app backfill-draft-signatures)."""
+    from pymongo import UpdateOne
+    drafts_collection = mongo.db.drafts
+    updated = 0
+    batch = []
+    for draft in drafts_collection.find({"lsh_bands": {"$exists": False}}, {"draft_text": 1}):
+        signature = similarity.signature(draft.get("draft_text", ""))
+        batch.append(UpdateOne({"_id": draft["_id"]},
+                               {"$set": {"minhash": signature, "lsh_bands": similarity.band_keys(signature)}}))
+        if len(batch) >= batch_size:
+            updated += drafts_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += drafts_collection.bulk_write(batch, ordered=False).modified_count
+    print(f"{updated} draft(s) updated.")
+
+# --- Settings applied by create_app ---
+def apply_settings():
+    """Rebuilds the process-wide objects created at import from app.config, in place, so settings
+    passed to create_app take effect (module-level references to them stay valid).
+
+    Cached entries are dropped. The job queue keeps its worker pool once started, so JOB_WORKERS
+    only applies before that; a change afterwards is logged and ignored.
+    """
+    configure_logging(app.config["LOG_LEVEL"], app.config["LOG_FORMAT"])
+    analysis_cache.memory, analysis_cache.mongo = analysis_cache_tiers()
+    search_cache.memory, search_cache.mongo = search_cache_tiers()
+    style_cache.memory = style_cache_memory()
+    single_flight.lease = single_flight_lease()
+    job_queue.lease_seconds = app.config["JOB_LEASE_SECONDS"]
+    if job_queue.max_workers != app.config["JOB_WORKERS"]:
+        if job_queue.running:
+            logger.warning(f"JOB_WORKERS={app.config['JOB_WORKERS']} ignored: the job workers are already running.")
+        else:
+            job_queue.max_workers = app.config["JOB_WORKERS"]
+    anthropic_governor.reset() # Rebuilt on first use with the current rate limits
+
+# --- Process Lifecycle ---
+# Production serving goes through gunicorn (gunicorn.conf.py + wsgi.py), which calls these
+# per worker process: after fork on start, and on graceful shutdown.
+draining = threading.Event() # Set once shutdown starts; /readyz then reports 503
+
+def start_background_services():
+    """Per-process startup: indexes, job workers (resuming jobs left by a previous process), change stream."""
+    draining.clear()
+    if app.config["ENSURE_INDEXES_ON_STARTUP"]:
+        ensure_indexes()
+    job_queue.start()
+    start_style_cache_watcher()
+
+def serves_requests():
+    """False in the file-watching parent of the debug reloader, which loads the app but never serves
+    it: background services there would duplicate (and outlive) the ones in the serving child."""
+    return not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+def begin_drain():
+    """Marks the process as shutting down so load balancers stop routing new requests to it."""
+    if not draining.is_set():
+        logger.info("Draining: readiness now reports 503.")
+    draining.set()
+
+def stop_background_services(wait=True):
+    """Graceful shutdown: stops the background threads; with wait=True running jobs finish first."""
+    begin_drain()
+    style_watch_stop.set()
+    job_queue.shutdown(wait=wait)
+    executor = search_executor.reset()
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True) # Searches nobody waits for any more
+    brave_client = brave_holder.reset()
+    if brave_client:
+        brave_client.close()
+    logger.info("Background services stopped.")
+
+# --- Main Execution (development server; see gunicorn.conf.py for production) ---
 if __name__ == '__main__':
     # Use PORT environment variable if available, otherwise default to 5001
     # to avoid conflicts with React's default port 5173
     port = int(os.environ.get('PORT', 5001))
+    app.debug = True # Before create_app, so the reloader's parent process skips the background services
+    create_app(start_services=True)
     app.run(debug=True, port=port)
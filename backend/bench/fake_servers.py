@@ -0,0 +1,239 @@
+"""Local stand-ins for the Anthropic Messages API and Brave Search.
+
+Both are plain threaded HTTP servers that answer with realistic payloads after a configurable
+delay, so the backend can be load tested without network access or API keys:
+
+- FakeAnthropic answers POST /v1/messages. Latency is `latency` seconds (time to first token)
+  plus output_tokens / tokens_per_second. Requests with a `system` prompt are treated as
+  generations and get post text back; everything else (analysis, merge) gets a style-analysis
+  JSON object. Like the real prompt cache, the system blocks up to the last cache_control
+  breakpoint form the cacheable prefix, which is only cached when it has at least
+  `min_cacheable_tokens` tokens (1024 for Sonnet); repeated prefixes are then reported as cache
+  reads in `usage`. A prefix only counts as cached once a response to it has started, so
+  concurrent requests that arrive while it is being written are billed as cache writes too.
+  Streaming requests (`"stream": true`) get Messages API server-sent events.
+- FakeBrave answers GET /res/v1/web/search with `count` results after `latency` seconds.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FAKE_ANALYSIS = {
+    "style_name": "Benchmark Voice",
+    "overall_tone": "Confident and practical",
+    "key_themes": ["engineering", "leadership"],
+    "common_keywords": ["ship", "team", "learn"],
+    "sentence_structure": "Short sentences, frequent line breaks",
+    "emoji_usage": "rare",
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), good enough for load modelling."""
+    return max(1, len(text) // 4)
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real APIs
+
+    def log_message(self, format, *args):
+        pass # One line per request would dominate the benchmark output
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _FakeServer:
+    """Runs a ThreadingHTTPServer on an ephemeral port in a background thread."""
+
+    def __init__(self, handler_class, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self # Lets the handler reach the server's settings
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _AnthropicHandler(_QuietHandler):
+    def do_POST(self):
+        fake = self.server.fake
+        fake.count_request()
+        if urlparse(self.path).path != "/v1/messages":
+            self.send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        system = body.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        breakpoints = [i for i, block in enumerate(system) if block.get("cache_control")]
+        prefix_end = breakpoints[-1] + 1 if breakpoints else 0
+        cacheable = "".join(block["text"] for block in system[:prefix_end])
+        uncached = "".join(block["text"] for block in system[prefix_end:])
+        if cacheable and estimate_tokens(cacheable) < fake.min_cacheable_tokens:
+            uncached, cacheable = cacheable + uncached, "" # Too short: the API silently skips caching
+        uncached += "".join(
+            message["content"] if isinstance(message["content"], str)
+            else "".join(part.get("text", "") for part in message["content"])
+            for message in body.get("messages", [])
+        )
+
+        usage = {"input_tokens": estimate_tokens(uncached), "cache_creation_input_tokens": 0,
+                 "cache_read_input_tokens": 0}
+        if cacheable:
+            # Checked on arrival, but only recorded once the first token is out (below): requests
+            # that arrive while the prefix is still being written miss the cache, as with the real API
+            if fake.is_cached(cacheable):
+                usage["cache_read_input_tokens"] = estimate_tokens(cacheable)
+            else:
+                usage["cache_creation_input_tokens"] = estimate_tokens(cacheable)
+
+        if system:
+            output_tokens = min(fake.output_tokens, body.get("max_tokens", fake.output_tokens))
+            text = " ".join(["Benchmark draft sentence."] * max(1, output_tokens // 4))
+        else:
+            text = json.dumps(FAKE_ANALYSIS)
+            output_tokens = estimate_tokens(text)
+        usage["output_tokens"] = output_tokens
+        fake.count_usage(usage)
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage,
+        }
+
+        time.sleep(fake.latency) # Time to first token
+        if cacheable:
+            fake.remember_prefix(cacheable)
+        if body.get("stream"):
+            self.send_stream(message, output_tokens / fake.tokens_per_second)
+        else:
+            time.sleep(output_tokens / fake.tokens_per_second)
+            self.send_json(200, message)
+
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def send_stream(self, message, duration):
+        """Streams `message` as Messages API server-sent events, spread over `duration` seconds."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close") # No Content-Length: the stream ends with the connection
+        self.end_headers()
+        self.close_connection = True
+        usage = message["usage"]
+        self.send_event("message_start", {"type": "message_start", "message": {
+            **message, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 1}}})
+        self.send_event("content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        words = message["content"][0]["text"].split(" ")
+        chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+        chunks[-1] = chunks[-1].rstrip()
+        for chunk in chunks:
+            time.sleep(duration / len(chunks))
+            self.send_event("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}})
+        self.send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self.send_event("message_delta", {"type": "message_delta",
+                                          "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                          "usage": {"output_tokens": usage["output_tokens"]}})
+        self.send_event("message_stop", {"type": "message_stop"})
+
+
+class FakeAnthropic(_FakeServer):
+    """Fake Messages API. Point the backend at it with ANTHROPIC_BASE_URL=<url>."""
+
+    def __init__(self, latency=0.5, tokens_per_second=80.0, output_tokens=300, min_cacheable_tokens=1024, **kwargs):
+        super().__init__(_AnthropicHandler, **kwargs)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self._prefixes = set()
+        self.usage = {"input_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0,
+                      "output_tokens": 0}
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def is_cached(self, text):
+        """True if this cacheable prefix has already been written (a cache read)."""
+        with self._lock:
+            return self._digest(text) in self._prefixes
+
+    def remember_prefix(self, text):
+        """Marks a prefix as cached; called once a response to it has started."""
+        with self._lock:
+            self._prefixes.add(self._digest(text))
+
+    def count_usage(self, usage):
+        with self._lock:
+            for key in self.usage:
+                self.usage[key] += usage.get(key, 0)
+
+
+class _BraveHandler(_QuietHandler):
+    def do_GET(self):
+        fake = self.server.fake
+        fake.count_request()
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get("q", [""])[0]
+        count = int(params.get("count", ["3"])[0])
+        time.sleep(fake.latency)
+        self.send_json(200, {"web": {"results": [
+            {"title": f"Result {i + 1} for {query}", "description": f"Snippet {i + 1} about {query}."}
+            for i in range(count)
+        ]}})
+
+
+class FakeBrave(_FakeServer):
+    """Fake Brave Search. Point the backend at it with BRAVE_SEARCH_URL=<url>/res/v1/web/search."""
+
+    def __init__(self, latency=0.15, **kwargs):
+        super().__init__(_BraveHandler, **kwargs)
+        self.latency = latency
+
+    @property
+    def search_url(self):
+        return f"{self.url}/res/v1/web/search"
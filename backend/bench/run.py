@@ -0,0 +1,240 @@
+"""Offline load benchmark for the backend.
+
+Starts the fake Anthropic and Brave servers (bench/fake_servers.py), serves the Flask app on a
+local port with a threaded WSGI server, backs it with mongomock (or a real mongod via
+--mongo-uri) and drives each endpoint at increasing concurrency. Reports requests/sec and
+p50/p95/p99 latency per endpoint and concurrency level.
+
+Run from backend/:
+
+    python -m bench.run
+    python -m bench.run --endpoints generate --concurrency 1,8,32 --requests 200
+    python -m bench.run --anthropic-latency 1.0 --anthropic-tps 60 --json results.json
+
+Every request uses distinct posts/topics so the analysis and search caches do not turn the
+benchmark into a cache benchmark (pass --allow-cache-hits to measure the warm path instead).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import httpx
+
+from bench.fake_servers import FakeAnthropic, FakeBrave
+
+ENDPOINTS = ("analyze", "generate", "drafts")
+
+SAMPLE_POSTS = """Shipping beats polishing. Last quarter our team cut the release cycle from three weeks to three days.
+---
+The best code review comment I ever got was a question, not an instruction.
+---
+Hiring for curiosity has paid off more than hiring for any specific framework. Here is what we look for."""
+
+
+def percentile(sorted_values, p):
+    """Linear-interpolated percentile (0-100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(endpoint, concurrency, latencies, errors, wall_seconds):
+    latencies = sorted(latencies)
+    completed = len(latencies) + errors
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": completed,
+        "errors": errors,
+        "rps": round(completed / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def build_request(endpoint, request_id, style_id, unique, drafts_view="summary"):
+    """Returns (method, path, json body) for one request; `request_id` makes the content unique."""
+    suffix = f" (run {request_id})" if unique else ""
+    if endpoint == "analyze":
+        return "POST", "/api/analyze-style", {"posts_text": SAMPLE_POSTS + suffix}
+    if endpoint == "generate":
+        return "POST", "/api/generate-post", {
+            "style_id": style_id,
+            "topic": f"Why small releases win{suffix}",
+            "key_points": "- Faster feedback\n- Smaller blast radius",
+            "subjects_or_angles": ["Team morale", "Customer impact", "Tooling"],
+        }
+    return "GET", f"/api/drafts?limit=20&view={drafts_view}", None
+
+
+def run_level(base_url, endpoint, concurrency, total, style_id, unique, timeout, drafts_view="summary"):
+    """Fires `total` requests with `concurrency` in flight; returns the summary dict."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    counter = iter(range(total))
+
+    with httpx.Client(base_url=base_url, timeout=timeout, limits=limits) as client:
+        def worker():
+            nonlocal errors
+            for i in counter: # Shared iterator: each worker pulls the next request number
+                method, path, body = build_request(endpoint, f"{concurrency}-{i}", style_id, unique, drafts_view)
+                start = time.perf_counter()
+                try:
+                    response = client.request(method, path, json=body)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        wall_seconds = time.perf_counter() - started
+
+    return summarize(endpoint, concurrency, latencies, errors, wall_seconds)
+
+
+def seed_database(db, drafts):
+    """Inserts one style for /api/generate-post and `drafts` drafts for /api/drafts."""
+    style_id = db.styles.insert_one({
+        "name": "Benchmark Voice",
+        "analysis": {"overall_tone": "Confident and practical", "key_themes": ["engineering"]},
+        "created_at": datetime.utcnow(),
+    }).inserted_id
+    now = datetime.utcnow()
+    if drafts:
+        db.drafts.insert_many([
+            {"draft_text": "Benchmark draft. " * 40, "topic": f"Topic {i}", "style_id": str(style_id),
+             "created_at": now - timedelta(seconds=i)}
+            for i in range(drafts)
+        ])
+    return str(style_id)
+
+
+def start_app(args, anthropic_url, brave_url):
+    """Imports the backend configured against the fakes and serves it. Returns (server, base url, style id)."""
+    # The backend reads its configuration at import time
+    os.environ.update({
+        "ANTHROPIC_API_KEY": "sk-bench",
+        "ANTHROPIC_BASE_URL": anthropic_url,
+        "BRAVE_SEARCH_API_KEY": "bench",
+        "BRAVE_SEARCH_URL": brave_url,
+        "MONGO_URI": args.mongo_uri or "mongodb://localhost:27017/linkedin_bench",
+        "LOG_LEVEL": args.log_level,
+        "GENERATION_CONCURRENCY": str(args.generation_concurrency),
+        "ANALYSIS_CACHE_MONGO": "true",
+        "ENSURE_INDEXES_ON_STARTUP": "false",
+        # Measure the backend, not our own throttling (the fake API has no rate limits)
+        "ANTHROPIC_REQUESTS_PER_MINUTE": "0",
+        "ANTHROPIC_INPUT_TOKENS_PER_MINUTE": "0",
+        "ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE": "0",
+    })
+    import app as backend
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(args.log_level) # Otherwise werkzeug logs every request at INFO
+
+    if args.mongo_uri:
+        db = backend.mongo.db
+        db.styles.drop()
+        db.drafts.drop()
+        backend.ensure_indexes(check_plans=False)
+    else:
+        import mongomock
+        db = mongomock.MongoClient().linkedin_bench
+        backend.mongo.db = db
+    style_id = seed_database(db, args.seed_drafts)
+
+    server = make_server("127.0.0.1", 0, backend.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", style_id
+
+
+def print_table(results):
+    header = f"{'endpoint':<10} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['endpoint']:<10} {r['concurrency']:>5} {r['requests']:>6} {r['errors']:>6} {r['rps']:>8} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--anthropic-latency", type=float, default=0.5, help="Fake Anthropic time to first token (s)")
+    parser.add_argument("--anthropic-tps", type=float, default=80.0, help="Fake Anthropic output tokens per second")
+    parser.add_argument("--output-tokens", type=int, default=300, help="Fake draft length in tokens")
+    parser.add_argument("--min-cacheable-tokens", type=int, default=1024, help="Fake prompt cache minimum prefix length")
+    parser.add_argument("--brave-latency", type=float, default=0.15, help="Fake Brave Search latency (s)")
+    parser.add_argument("--generation-concurrency", type=int, default=3, help="GENERATION_CONCURRENCY for the app")
+    parser.add_argument("--seed-drafts", type=int, default=500, help="Drafts inserted before the run")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB (its styles/drafts are dropped!) instead of mongomock")
+    parser.add_argument("--allow-cache-hits", action="store_true", help="Repeat identical requests (warm caches)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request (s)")
+    parser.add_argument("--log-level", default="WARNING", help="Backend LOG_LEVEL during the run")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        sys.exit(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    # mongomock cannot run the summary view's $substrCP projection, so without --mongo-uri the drafts
+    # scenario measures view=full (whole draft bodies), not the default the frontend requests
+    drafts_view = "summary" if args.mongo_uri else "full"
+
+    with FakeAnthropic(latency=args.anthropic_latency, tokens_per_second=args.anthropic_tps,
+                       output_tokens=args.output_tokens,
+                       min_cacheable_tokens=args.min_cacheable_tokens) as fake_anthropic, \
+            FakeBrave(latency=args.brave_latency) as fake_brave:
+        server, base_url, style_id = start_app(args, fake_anthropic.url, fake_brave.search_url)
+        try:
+            results = []
+            for endpoint in endpoints:
+                for concurrency in levels:
+                    total = max(args.requests, concurrency)
+                    results.append(run_level(base_url, endpoint, concurrency, total, style_id,
+                                             not args.allow_cache_hits, args.timeout, drafts_view))
+        finally:
+            server.shutdown()
+
+        print_table(results)
+        print(f"\nFake Anthropic calls: {fake_anthropic.requests}, fake Brave calls: {fake_brave.requests}")
+        usage = fake_anthropic.usage
+        print(f"Fake Anthropic tokens: {usage['input_tokens']} input, {usage['cache_creation_input_tokens']} "
+              f"cache write, {usage['cache_read_input_tokens']} cache read, {usage['output_tokens']} output")
+        if "drafts" in endpoints and drafts_view != "summary":
+            print("Note: drafts measured with view=full; the default summary view needs --mongo-uri "
+                  "(mongomock cannot run its $substrCP projection)")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "drafts_view": drafts_view, "anthropic_usage": fake_anthropic.usage,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Small caching helpers shared by the backend.
+
+- TTLCache: bounded, thread-safe, in-process LRU with per-entry expiry.
+- MongoCache: shared cache tier stored in a MongoDB collection with a TTL index.
+- TieredCache: in-process LRU in front of an optional Mongo tier, with hit/miss counters.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Returned by get() on a miss, so that None can be cached as a real value (negative caching)
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache where every entry also expires after a TTL (in seconds)."""
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expires_at monotonic, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key) # Mark as most recently used
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False) # Evict least recently used
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class MongoCache:
+    """Cache tier backed by a MongoDB collection.
+
+    Documents look like {"_id": key, "value": ..., "expires_at": datetime}. A TTL index on
+    `expires_at` lets MongoDB purge expired entries; reads also check expiry because the
+    TTL monitor only runs about once a minute.
+
+    `get_collection` is a callable so the collection is resolved at call time (Flask-PyMongo's
+    `mongo.db` is only usable once the app is configured, and tests patch it).
+    """
+
+    def __init__(self, get_collection, ttl=3600):
+        self.get_collection = get_collection
+        self.ttl = ttl
+        self._index_ready = False
+
+    def ensure_index(self):
+        if not self._index_ready:
+            self.get_collection().create_index("expires_at", expireAfterSeconds=0)
+            self._index_ready = True
+
+    def get(self, key):
+        doc = self.get_collection().find_one({"_id": key})
+        if not doc or doc.get("expires_at") is None or doc["expires_at"] <= datetime.utcnow():
+            return MISSING
+        return doc.get("value")
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.ensure_index()
+        now = datetime.utcnow()
+        self.get_collection().replace_one(
+            {"_id": key},
+            {"_id": key, "value": value, "created_at": now, "expires_at": now + timedelta(seconds=ttl)},
+            upsert=True,
+        )
+
+    def invalidate(self, key):
+        self.get_collection().delete_one({"_id": key})
+
+
+class TieredCache:
+    """In-process TTLCache in front of an optional shared MongoCache.
+
+    Values are deep-copied on the way in and out so callers can freely mutate what they get.
+    Errors from the Mongo tier are logged and treated as misses; a cache must never fail a request.
+    """
+
+    def __init__(self, name, memory, mongo=None):
+        self.name = name
+        self.memory = memory
+        self.mongo = mongo
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {"hits": 0, "memory_hits": 0, "mongo_hits": 0, "misses": 0, "sets": 0, "errors": 0}
+
+    def _count(self, *fields):
+        with self._stats_lock:
+            for field in fields:
+                self._stats[field] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self._count("hits", "memory_hits")
+            return copy.deepcopy(value)
+
+        if self.mongo is not None:
+            try:
+                value = self.mongo.get(key)
+            except Exception as e:
+                logger.warning(f"{self.name} cache Mongo lookup failed: {e}")
+                self._count("errors")
+                value = MISSING
+            if value is not MISSING:
+                self.memory.set(key, value) # Promote to the in-process tier
+                self._count("hits", "mongo_hits")
+                return copy.deepcopy(value)
+
+        self._count("misses")
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        value = copy.deepcopy(value)
+        self.memory.set(key, value, ttl=ttl)
+        self._count("sets")
+        if self.mongo is not None:
+            try:
+                self.mongo.set(key, value, ttl=ttl)
+            except Exception as e:
+                logger.warning(f"{self.name} cache Mongo write failed: {e}")
+                self._count("errors")
+
+    def invalidate(self, key):
+        self.memory.invalidate(key)
+        if self.mongo is not None:
+            try:
+                self.mongo.invalidate(key)
+            except Exception as e:
+                logger.warning(f"{self.name} cache Mongo invalidation failed: {e}")
+                self._count("errors")
+
+    def clear(self):
+        """Clears the in-process tier only (the shared tier expires on its own)."""
+        self.memory.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["mongo_tier"] = self.mongo is not None
+        return stats
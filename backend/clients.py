@@ -0,0 +1,49 @@
+"""Lazily created, process-wide clients.
+
+Building clients at import time makes every worker boot, test run and cold start pay for them
+(and for importing their libraries) even when a request never uses them. A LazyClient builds
+its client with `factory()` on first use, once, even when several threads ask at the same time.
+"""
+import threading
+
+
+class LazyClient:
+    """Thread-safe holder for a client created on first use.
+
+    If the factory returns None the holder stays empty and the next get() tries again.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self):
+        return self._client is not None
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def reset(self):
+        """Forgets the client (e.g. on shutdown) and returns it, or None if it was never created."""
+        with self._lock:
+            client, self._client = self._client, None
+        return client
+
+
+class LazyProxy(LazyClient):
+    """A LazyClient that forwards attribute access, so it can stand in for the client itself
+    (e.g. `mongo.db`), creating it on first access."""
+
+    def __getattr__(self, name):
+        # Only called for attributes not found normally; our own are all underscored
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
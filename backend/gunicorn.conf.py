@@ -0,0 +1,66 @@
+"""Production gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+
+The workload is I/O bound: a request mostly waits on Anthropic (seconds to a minute) and Brave,
+so we run a few processes with many threads each (gthread) rather than one request per process.
+Every setting can be overridden from the environment.
+
+Workers are not preloaded: PyMongo clients and our background threads (job queue, change
+stream) are not fork-safe, so each worker imports the app and starts its services after fork.
+"""
+import multiprocessing
+import os
+import shutil
+import signal
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5001')}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+# Concurrent requests per worker; each generation also fans out GENERATION_CONCURRENCY angle threads
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+# gthread heartbeats from its main loop, so this only kills workers that are truly stuck
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+# On SIGTERM, in-flight requests (including SSE generation streams) get this long to finish
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 120))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers now and then to cap slow memory growth; jitter avoids restarting them all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") # Off by default: the app already logs one line per request
+errorlog = "-"
+
+
+def on_starting(server):
+    # Multi-process Prometheus metrics: start from an empty directory on every (re)start
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_worker_init(worker):
+    import app as backend
+
+    backend.start_background_services()
+
+    # Flip readiness to 503 as soon as the drain starts, then let gunicorn's own handler run
+    # (it stops accepting connections and waits up to graceful_timeout for in-flight requests)
+    original_handler = worker.handle_exit
+
+    def handle_exit(sig, frame):
+        backend.begin_drain()
+        original_handler(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_exit)
+
+
+def worker_exit(server, worker):
+    import app as backend
+
+    backend.stop_background_services(wait=True) # Running background jobs finish before the process exits
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
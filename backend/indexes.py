@@ -0,0 +1,144 @@
+"""Declarative MongoDB index management.
+
+INDEX_SPECS lists every index the backend relies on, per collection. ensure_indexes() creates
+whatever is missing (idempotent, safe to run on every start) and reports what it did.
+check_query_plans() explains the hot queries and warns when one would fall back to a
+collection scan or an in-memory sort.
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+INDEX_SPECS = {
+    "styles": [
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+    ],
+    "drafts": [
+        # Keyset pagination of GET /api/drafts
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+        # GET /api/drafts/search: style filter (newest first) and relevance-ranked text search
+        IndexModel([("style_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                   name="style_id_created_at_id"),
+        IndexModel([("draft_text", TEXT), ("topic", TEXT)], name="draft_text_topic_text", weights={"topic": 3}),
+        # Near-duplicate candidates: multikey over the LSH band keys of each draft (similarity.py)
+        IndexModel([("lsh_bands", ASCENDING)], name="lsh_bands"),
+    ],
+    # Cache tiers: MongoDB purges entries once expires_at has passed
+    "analysis_cache": [IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0)],
+    "search_cache": [IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0)],
+    # Single-flight leases (SINGLE_FLIGHT_MONGO): finished and abandoned leases are purged
+    "single_flight": [IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0)],
+    # Job recovery sweep: queued jobs and running jobs with an expired lease
+    "jobs": [IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease_expires_at")],
+}
+
+# Representative hot-path queries: (collection, filter, sort)
+QUERY_CHECKS = [
+    ("drafts", {}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("drafts", {"user_id": None}, [("created_at", DESCENDING)]),
+    ("drafts", {"lsh_bands": {"$in": [0]}}, None),
+    ("drafts", {"style_id": None}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("styles", {"user_id": None}, [("created_at", DESCENDING)]),
+    ("jobs", {"status": "queued"}, None),
+]
+
+
+def _index_options(document):
+    """The parts of an index definition that must match for two indexes to be the same."""
+    key = list(document["key"].items())
+    # The server reports a text index as {_fts: "text", _ftsx: 1} with the fields under `weights`
+    text_fields = {field for field, kind in key if kind == TEXT} | set(document.get("weights", {}))
+    text_fields.discard("_fts")
+    return {
+        "key": [(field, kind) for field, kind in key if kind != TEXT and field != "_ftsx"],
+        "text_fields": sorted(text_fields),
+        "expireAfterSeconds": document.get("expireAfterSeconds"),
+        "unique": bool(document.get("unique", False)),
+    }
+
+
+def ensure_indexes(db, specs=INDEX_SPECS):
+    """Creates missing indexes. Returns a report: one dict per index with a status of
+    "exists", "created", "conflict" (same name, different definition) or "error"."""
+    report = []
+    for collection_name, models in specs.items():
+        collection = db[collection_name]
+        try:
+            existing = collection.index_information()
+        except PyMongoError as e:
+            existing = {}
+            if not isinstance(e, OperationFailure) or e.code != 26: # 26 = NamespaceNotFound
+                report.append({"collection": collection_name, "index": "*", "status": "error", "error": str(e)})
+                continue
+
+        for model in models:
+            document = model.document
+            entry = {"collection": collection_name, "index": document["name"]}
+            current = existing.get(document["name"])
+            if current is not None:
+                wanted = _index_options({**document, "key": dict(document["key"])})
+                current_options = _index_options({**current, "key": dict(current["key"])})
+                if wanted == current_options:
+                    entry["status"] = "exists"
+                else:
+                    entry.update({"status": "conflict",
+                                  "error": f"Existing index differs: {current_options} != {wanted}"})
+                report.append(entry)
+                continue
+            try:
+                collection.create_indexes([model])
+                entry["status"] = "created"
+            except PyMongoError as e:
+                entry.update({"status": "error", "error": str(e)})
+            report.append(entry)
+    return report
+
+
+def index_builds_in_progress(db):
+    """Index builds currently running on the server (needs the inprog privilege, else [])."""
+    try:
+        operations = db.client.admin.aggregate([
+            {"$currentOp": {"allUsers": True}},
+            {"$match": {"command.createIndexes": {"$exists": True}}},
+        ])
+        return [
+            {"collection": op["command"]["createIndexes"], "message": op.get("msg"),
+             "progress": op.get("progress")}
+            for op in operations
+        ]
+    except PyMongoError:
+        return []
+
+
+def _plan_stages(plan):
+    """Yields every stage name in an explain() plan tree."""
+    if not plan:
+        return
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+    if "queryPlan" in plan: # Slot-based engine wraps the classic plan
+        yield from _plan_stages(plan["queryPlan"])
+
+
+def check_query_plans(db, checks=QUERY_CHECKS):
+    """Explains the hot queries; returns warnings for collection scans and in-memory sorts."""
+    warnings = []
+    for collection_name, query, sort in checks:
+        try:
+            cursor = db[collection_name].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = cursor.explain()
+        except Exception as e:
+            warnings.append(f"{collection_name} {query}: could not explain query ({e})")
+            continue
+        stages = set(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        if "COLLSCAN" in stages:
+            warnings.append(f"{collection_name} {query} sort={sort}: collection scan (no usable index)")
+        if "SORT" in stages:
+            warnings.append(f"{collection_name} {query} sort={sort}: in-memory sort (index does not cover the sort)")
+    return warnings
@@ -0,0 +1,140 @@
+"""Streaming parsing and chunking of large style corpora.
+
+Everything here works on iterators so an upload is processed as it is read: memory use is
+bounded by the chunk size (plus one line), not by the size of the corpus.
+
+Supported upload formats:
+- NDJSON (application/x-ndjson): one post per line, either a JSON string or an object with a
+  "post" or "text" field.
+- Plain text: posts separated by a line containing only dashes ("---") or a form feed.
+"""
+import json
+import re
+
+POST_SEPARATOR = re.compile(r"^\s*(-{3,}|\f)\s*$")
+
+
+class IngestError(ValueError):
+    """Raised for malformed uploads."""
+
+
+class CorpusTooLarge(IngestError):
+    """Raised when an upload exceeds the size or chunk limits (HTTP 413)."""
+
+
+def iter_stream_lines(stream, max_line_bytes=64 * 1024):
+    """Yields decoded lines from a binary stream without reading it all into memory.
+
+    Lines longer than `max_line_bytes` raise IngestError (keeps a single line from
+    growing without bound).
+    """
+    pending = b""
+    while True:
+        piece = stream.readline(max_line_bytes + 1)
+        if not piece:
+            break
+        pending += piece
+        if pending.endswith(b"\n"):
+            yield pending.decode("utf-8", errors="replace")
+            pending = b""
+        elif len(pending) > max_line_bytes:
+            raise IngestError(f"Line longer than {max_line_bytes} bytes")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def iter_ndjson_posts(lines):
+    """Yields post texts from NDJSON lines."""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise IngestError(f"Invalid JSON on line {line_number}: {e}")
+        if isinstance(item, dict):
+            item = item.get("post") or item.get("text")
+        if not isinstance(item, str):
+            raise IngestError(f"Line {line_number} must be a string or an object with 'post'/'text'")
+        if item.strip():
+            yield item.strip()
+
+
+def iter_text_posts(lines, max_post_chars):
+    """Yields posts from plain text separated by '---' lines.
+
+    A post longer than `max_post_chars` is emitted in pieces (split at paragraph boundaries
+    where possible), so a file without separators still streams in bounded memory.
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        if POST_SEPARATOR.match(line):
+            post = "".join(buffer).strip()
+            if post:
+                yield post
+            buffer, size = [], 0
+            continue
+        buffer.append(line)
+        size += len(line)
+        if size > max_post_chars:
+            text = "".join(buffer)
+            head, tail = split_at_paragraph(text, max_post_chars)
+            if head.strip():
+                yield head.strip()
+            buffer, size = [tail], len(tail)
+    post = "".join(buffer).strip()
+    if post:
+        yield post
+
+
+def split_at_paragraph(text, max_chars):
+    """Splits text into (head, tail) with len(head) <= max_chars, preferring a blank-line boundary."""
+    if len(text) <= max_chars:
+        return text, ""
+    cut = text.rfind("\n\n", 0, max_chars)
+    if cut <= 0:
+        cut = text.rfind("\n", 0, max_chars)
+    if cut <= 0:
+        cut = max_chars
+    return text[:cut], text[cut:]
+
+
+def iter_post_chunks(posts, max_chunk_chars):
+    """Groups posts into chunks of at most `max_chunk_chars` characters.
+
+    Yields (chunk_text, post_count). Posts within a chunk are separated by '---' lines.
+    """
+    chunk, size = [], 0
+    for post in posts:
+        while len(post) > max_chunk_chars: # Oversized single post: split it across chunks
+            head, post = split_at_paragraph(post, max_chunk_chars)
+            if chunk:
+                yield "\n---\n".join(chunk), len(chunk)
+                chunk, size = [], 0
+            yield head.strip(), 1
+            post = post.strip()
+        if not post:
+            continue
+        if chunk and size + len(post) > max_chunk_chars:
+            yield "\n---\n".join(chunk), len(chunk)
+            chunk, size = [], 0
+        chunk.append(post)
+        size += len(post) + 5
+    if chunk:
+        yield "\n---\n".join(chunk), len(chunk)
+
+
+def collect_chunks(chunks, max_chunks):
+    """Reads all chunks into a list, raising CorpusTooLarge as soon as there are more than `max_chunks`.
+
+    Lets a caller reject an oversized corpus before paying for any chunk; memory use is
+    bounded by max_chunks chunks.
+    """
+    collected = []
+    for chunk in chunks:
+        if len(collected) >= max_chunks:
+            raise CorpusTooLarge(f"Corpus too large (more than {max_chunks} chunks).")
+        collected.append(chunk)
+    return collected
@@ -0,0 +1,218 @@
+"""Background job queue for long-running LLM work.
+
+Jobs are persisted in a MongoDB collection and executed by a bounded in-process worker pool,
+so HTTP workers are freed as soon as the job is recorded. A worker claims a job atomically
+(find_one_and_update) and holds a lease on it while it runs. Jobs that are still queued, or
+whose lease expired because their process died, are picked up again by recover(), which runs
+on start and then periodically - so a restart does not lose work.
+
+Handlers take the job payload and return (response body, HTTP status), the same shape the
+synchronous endpoints produce, so a finished job carries exactly what the endpoint would have
+returned.
+"""
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+def _isoformat(value):
+    return value.isoformat() + 'Z' if isinstance(value, datetime) else value
+
+
+def job_to_json(job):
+    """Serializes a job document for the API (the stored payload is not echoed back)."""
+    return {
+        "job_id": str(job["_id"]),
+        "type": job.get("type"),
+        "status": job.get("status"),
+        "attempts": job.get("attempts", 0),
+        "http_status": job.get("http_status"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": _isoformat(job.get("created_at")),
+        "started_at": _isoformat(job.get("started_at")),
+        "finished_at": _isoformat(job.get("finished_at")),
+    }
+
+
+class JobQueue:
+    """Mongo-backed job queue executed by a local thread pool."""
+
+    def __init__(self, get_collection, max_workers=4, lease_seconds=600, max_attempts=3,
+                 recovery_interval=60, app=None):
+        self.get_collection = get_collection # Callable, resolved at call time (see MongoCache)
+        self.max_workers = max_workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.recovery_interval = recovery_interval
+        self.app = app # Optional Flask app; handlers then run inside an app context
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}
+        self._executor = None
+        self._scheduled = set() # Job ids already handed to our executor
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def register(self, job_type, handler):
+        self._handlers[job_type] = handler
+
+    @property
+    def job_types(self):
+        return sorted(self._handlers)
+
+    @property
+    def running(self):
+        """True once start() created the worker pool (until shutdown)."""
+        return self._executor is not None
+
+    def start(self):
+        """Creates the worker pool and recovers pending jobs. Safe to call repeatedly."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        try:
+            self.recover()
+        except Exception as e:
+            logger.warning(f"Could not recover pending jobs: {e}")
+        if self.recovery_interval:
+            threading.Thread(target=self._recovery_loop, name="job-recovery", daemon=True).start()
+
+    def shutdown(self, wait=True):
+        """Stops accepting work; with wait=True, blocks until running jobs finish (drain)."""
+        self._stop.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._scheduled.clear()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def submit(self, job_type, payload):
+        """Persists a new job and schedules it. Returns the job id as a string."""
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        self.start()
+        job = {
+            "type": job_type,
+            "payload": payload,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "created_at": datetime.utcnow(),
+        }
+        job_id = self.get_collection().insert_one(job).inserted_id
+        self._schedule(job_id)
+        return str(job_id)
+
+    def get(self, job_id):
+        """Returns the job document, or None if the id is unknown or malformed."""
+        try:
+            job_object_id = ObjectId(job_id)
+        except (InvalidId, TypeError):
+            return None
+        return self.get_collection().find_one({"_id": job_object_id})
+
+    def recover(self):
+        """Schedules queued jobs and jobs whose lease expired. Returns how many were scheduled."""
+        collection = self.get_collection()
+        now = datetime.utcnow()
+        # Jobs that already crashed their worker too many times are given up on
+        collection.update_many(
+            {"status": {"$in": [JOB_QUEUED, JOB_RUNNING]}, "attempts": {"$gte": self.max_attempts},
+             "$or": [{"status": JOB_QUEUED}, {"lease_expires_at": {"$lt": now}}]},
+            {"$set": {"status": JOB_FAILED, "finished_at": now, "http_status": 500,
+                      "error": "Job abandoned after too many attempts."}},
+        )
+        pending = collection.find(self._claimable_filter(now), {"_id": 1})
+        count = 0
+        for job in pending:
+            if self._schedule(job["_id"]):
+                count += 1
+        if count:
+            logger.info(f"Recovered {count} pending job(s).")
+        return count
+
+    def _recovery_loop(self):
+        while not self._stop.wait(self.recovery_interval):
+            try:
+                self.recover()
+            except Exception as e:
+                logger.warning(f"Job recovery sweep failed: {e}")
+
+    def _claimable_filter(self, now):
+        return {
+            "attempts": {"$lt": self.max_attempts},
+            "$or": [
+                {"status": JOB_QUEUED},
+                {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}},
+            ],
+        }
+
+    def _schedule(self, job_id):
+        with self._lock:
+            if self._executor is None or job_id in self._scheduled:
+                return False
+            self._scheduled.add(job_id)
+            self._executor.submit(self._run, job_id)
+            return True
+
+    def _claim(self, job_id):
+        """Atomically marks the job as running for this worker. Returns the job or None."""
+        now = datetime.utcnow()
+        claim_filter = self._claimable_filter(now)
+        claim_filter["_id"] = job_id
+        return self.get_collection().find_one_and_update(
+            claim_filter,
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "started_at": now,
+                    "worker": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+        )
+
+    def _run(self, job_id):
+        try:
+            job = self._claim(job_id)
+            if job is None:
+                return # Already claimed or finished elsewhere
+
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        body, status = self._handlers[job["type"]](job["payload"])
+                else:
+                    body, status = self._handlers[job["type"]](job["payload"])
+                update = {
+                    "status": JOB_SUCCEEDED if status < 400 else JOB_FAILED,
+                    "http_status": status,
+                    "result": body,
+                    "error": body.get("error") if status >= 400 and isinstance(body, dict) else None,
+                }
+            except Exception as e:
+                logger.exception(f"Error running job {job_id} ({job.get('type')}): {e}")
+                update = {"status": JOB_FAILED, "http_status": 500, "result": None,
+                          "error": "An unexpected error occurred while running the job."}
+
+            update["finished_at"] = datetime.utcnow()
+            self.get_collection().update_one({"_id": job_id, "worker": self.worker_id}, {"$set": update})
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_id)
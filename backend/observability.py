@@ -0,0 +1,128 @@
+"""Logging setup and Prometheus metrics.
+
+Every module logs through `logging.getLogger(__name__)`; configure_logging() decides the level
+(LOG_LEVEL) and whether lines are plain text or one JSON object per line (LOG_FORMAT=json).
+Prompts and raw search results are only logged at DEBUG.
+
+Metrics live in their own registry and are served by the /metrics endpoint:
+- request latency per endpoint,
+- latency of each pipeline stage (Mongo lookup, Brave search, Anthropic request, JSON extraction),
+- Anthropic token counts per operation, split into uncached input, cache reads/writes and output.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+NAMESPACE = "linkedin_generator"
+REGISTRY = CollectorRegistry() # Only our metrics (no default process collectors), safe to import once per process
+
+# Stages range from a ~1 ms Mongo hit to a ~60 s generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency (until the response is returned).",
+    ["method", "endpoint", "status"], namespace=NAMESPACE, buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Latency of one pipeline stage.",
+    ["stage"], namespace=NAMESPACE, buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+STAGE_ERRORS = Counter(
+    "stage_errors", "Pipeline stages that raised.",
+    ["stage"], namespace=NAMESPACE, registry=REGISTRY,
+)
+ANTHROPIC_TOKENS = Counter(
+    "anthropic_tokens", "Anthropic tokens by operation and kind (input, cache_read, cache_creation, output).",
+    ["operation", "kind"], namespace=NAMESPACE, registry=REGISTRY,
+)
+
+# Messages API usage field -> "kind" label
+TOKEN_KINDS = {
+    "input_tokens": "input",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_creation",
+    "output_tokens": "output",
+}
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, plus any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level="INFO", fmt="text"):
+    """Configures the root logger once (LOG_LEVEL / LOG_FORMAT)."""
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+
+@contextmanager
+def timed(stage):
+    """Times the enclosed block into STAGE_SECONDS (errors are counted, then re-raised)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_stage(stage, seconds):
+    """Records a stage duration measured elsewhere (e.g. time spent queued for a rate limit)."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    logger.debug("stage %s took %.3fs", stage, seconds, extra={"stage": stage, "seconds": round(seconds, 4)})
+
+
+def record_tokens(operation, counts):
+    """Adds a usage dict ({"input_tokens": ..., ...}) to the token counters."""
+    for field, kind in TOKEN_KINDS.items():
+        value = counts.get(field) or 0
+        if value:
+            ANTHROPIC_TOKENS.labels(operation, kind).inc(value)
+
+
+def observe_request(method, endpoint, status, seconds):
+    REQUEST_SECONDS.labels(method, endpoint, str(status)).observe(seconds)
+
+
+def render_metrics():
+    """Returns (body, content type) in the Prometheus text exposition format.
+
+    Under gunicorn with PROMETHEUS_MULTIPROC_DIR set, every worker writes its samples to that
+    directory and a scrape aggregates all workers, whichever one serves it.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,305 @@
+"""Process-wide rate-limit governor for Anthropic calls.
+
+Anthropic limits each organization on requests, input tokens and output tokens per minute and
+answers 429 (or 529 when overloaded) past them. Rather than letting concurrent generations,
+ingest chunks and batch analyses race into those errors, every call first reserves capacity
+from three token buckets and waits (in priority order) while they are empty:
+
+- requests: 1 per call,
+- input tokens: estimated from the prompt size,
+- output tokens: `max_tokens`, refunded down to the real usage once the call returns
+  (the same way Anthropic accounts for output tokens).
+
+The buckets start from the configured limits and adapt to what the API reports: the
+`anthropic-ratelimit-*-limit/remaining` headers of every response, and `retry-after` on
+429/529, which pauses all calls for that long. Rate-limited calls are retried after the pause
+instead of failing, and transient failures (5xx, timeouts, dropped connections) after a backoff;
+the governor is the only retry layer, so the Anthropic client is created with max_retries=0.
+Interactive work (post generation) is served before batch work (bulk
+analysis, ingest chunks, merges) whenever both are waiting.
+
+Each process has its own governor; with several workers, set the limits to your tier's
+limits divided by the number of processes (the response headers then keep them in sync).
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+RATE_LIMITED_STATUS_CODES = {429, 529}
+TRANSIENT_STATUS_CODES = {408, 409, 500, 502, 503, 504} # The errors the SDK itself would retry
+HEADER_PREFIX = "anthropic-ratelimit-"
+BUCKET_HEADERS = {"requests": "requests", "input_tokens": "input-tokens", "output_tokens": "output-tokens"}
+CHARS_PER_TOKEN = 4 # Rough estimate for English prose, only used until the real usage is known
+
+
+class GovernorTimeout(Exception):
+    """Raised when capacity did not free up within the governor's maximum wait."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Holds up to `limit` units, refilled continuously at `limit` per minute.
+
+    A limit of 0 (or None) disables the bucket. The level may go negative when a call used
+    more than it reserved; later calls then wait for the debt to refill.
+    """
+
+    def __init__(self, limit, clock=time.monotonic):
+        self._clock = clock
+        self.limit = limit or 0
+        self.level = float(self.limit)
+        self._updated = clock()
+
+    def _refill(self, now):
+        if self.limit:
+            self.level = min(float(self.limit), self.level + (now - self._updated) * self.limit / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        if not self.limit:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.limit) # A request larger than the limit waits for a full bucket
+        missing = amount - self.level
+        return 0.0 if missing <= 0 else missing * 60.0 / self.limit
+
+    def take(self, amount, now):
+        if self.limit:
+            self._refill(now)
+            self.level -= min(amount, self.limit)
+
+    def give(self, amount, now):
+        """Returns `amount` units (negative to take more than was reserved)."""
+        if self.limit:
+            self._refill(now)
+            self.level = min(float(self.limit), self.level + amount)
+
+    def observe(self, limit, remaining, now):
+        """Adopts the limit and remaining capacity reported by the API."""
+        self._refill(now)
+        if limit:
+            self.limit = limit
+        if self.limit and remaining is not None:
+            # The server sees every process of the organization; never assume more than it allows
+            self.level = min(self.level, float(remaining), float(self.limit))
+
+
+class Reservation:
+    """Capacity taken for one call, settled against the real usage when the call returns."""
+
+    def __init__(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+def estimate_input_tokens(request_kwargs):
+    """Rough input token count of a Messages API request (system + messages text)."""
+    chars = 0
+    parts = [request_kwargs.get("system")] + [m.get("content") for m in request_kwargs.get("messages", [])]
+    for part in parts:
+        if isinstance(part, str):
+            chars += len(part)
+        elif isinstance(part, list):
+            chars += sum(len(block.get("text", "")) for block in part if isinstance(block, dict))
+    return max(1, chars // CHARS_PER_TOKEN)
+
+
+def error_retry_after(error):
+    """Seconds the API asked us to wait in a 429/529 error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) in RATE_LIMITED_STATUS_CODES
+
+
+def is_transient(error):
+    """True for failures worth retrying that are not rate limits: 5xx/408/409, timeouts, dropped connections."""
+    if getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES:
+        return True
+    import anthropic # Deferred like in app.py; already loaded by the client that raised
+    return isinstance(error, anthropic.APIConnectionError) # Includes APITimeoutError
+
+
+class AnthropicGovernor:
+    """Token-bucket governor for requests, input tokens and output tokens per minute."""
+
+    def __init__(self, requests_per_minute=0, input_tokens_per_minute=0, output_tokens_per_minute=0,
+                 max_wait=120.0, max_retries=3, backoff_base=1.0, adapt_to_headers=True, on_wait=None,
+                 clock=time.monotonic):
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.adapt_to_headers = adapt_to_headers
+        self.on_wait = on_wait # Called with the seconds each call spent queued (metrics)
+        self._clock = clock
+        self._buckets = {
+            "requests": TokenBucket(requests_per_minute, clock),
+            "input_tokens": TokenBucket(input_tokens_per_minute, clock),
+            "output_tokens": TokenBucket(output_tokens_per_minute, clock),
+        }
+        self._paused_until = 0.0
+        self._waiters = [] # heap of (priority, arrival), the head is the next call to be admitted
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition()
+
+    # --- Admission ---
+    def _wait_time(self, cost, now):
+        wait = max(0.0, self._paused_until - now)
+        for name, amount in cost.items():
+            wait = max(wait, self._buckets[name].wait_time(amount, now))
+        return wait
+
+    def acquire(self, input_tokens, output_tokens, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Blocks until the call fits in every bucket and no higher-priority (or earlier) call is
+        waiting, then takes the capacity. Raises GovernorTimeout after `timeout` (default max_wait)."""
+        cost = {"requests": 1, "input_tokens": input_tokens, "output_tokens": output_tokens}
+        entry = (priority, next(self._arrivals))
+        with self._cond:
+            deadline = self._clock() + (self.max_wait if timeout is None else timeout)
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = self._clock()
+                    wait = None # Not our turn: sleep until the head moves
+                    if self._waiters[0] == entry:
+                        wait = self._wait_time(cost, now)
+                        if wait <= 0:
+                            for name, amount in cost.items():
+                                self._buckets[name].take(amount, now)
+                            return Reservation(input_tokens, output_tokens)
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise GovernorTimeout("Timed out waiting for Anthropic rate limit capacity",
+                                              retry_after=self._wait_time(cost, now))
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def settle(self, reservation, usage):
+        """Refunds (or charges) the difference between the reservation and the real usage."""
+        if usage is None:
+            return
+        used_input = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+        used_output = getattr(usage, "output_tokens", 0) or 0
+        if not isinstance(used_input, int) or not isinstance(used_output, int):
+            return # Not a real usage object (e.g. a test double)
+        with self._cond:
+            now = self._clock()
+            self._buckets["input_tokens"].give(reservation.input_tokens - used_input, now)
+            self._buckets["output_tokens"].give(reservation.output_tokens - used_output, now)
+            self._cond.notify_all()
+
+    def release(self, reservation):
+        """Returns the token estimates of a call that failed before producing output."""
+        with self._cond:
+            now = self._clock()
+            self._buckets["input_tokens"].give(reservation.input_tokens, now)
+            self._buckets["output_tokens"].give(reservation.output_tokens, now)
+            self._cond.notify_all()
+
+    # --- Feedback from the API ---
+    def pause(self, seconds):
+        """Holds every call for `seconds` (e.g. the retry-after of a 429)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+            self._cond.notify_all()
+
+    def observe_headers(self, headers):
+        """Updates the buckets from an API response's rate-limit headers."""
+        if not self.adapt_to_headers:
+            return
+        with self._cond:
+            now = self._clock()
+            for name, header in BUCKET_HEADERS.items():
+                limit = _int_header(headers, f"{HEADER_PREFIX}{header}-limit")
+                remaining = _int_header(headers, f"{HEADER_PREFIX}{header}-remaining")
+                if limit is not None or remaining is not None:
+                    self._buckets[name].observe(limit, remaining, now)
+            self._cond.notify_all()
+
+    def observe_response(self, response):
+        """httpx response hook: adapts to rate-limit headers and pauses on 429/529."""
+        self.observe_headers(response.headers)
+        if response.status_code in RATE_LIMITED_STATUS_CODES:
+            retry_after = _float_header(response.headers, "retry-after")
+            self.pause(retry_after if retry_after is not None else self.backoff_base)
+
+    # --- Calls ---
+    def call(self, send, request_kwargs, priority=PRIORITY_INTERACTIVE):
+        """Runs `send(**request_kwargs)` (which returns a Message) within the limits.
+
+        Waits for capacity, and when the API still answers 429/529, waits out its retry-after
+        (exponential backoff without one) and tries again, up to max_retries times. Transient
+        failures are retried the same way, but only this call backs off: the other calls go on.
+        """
+        input_tokens = estimate_input_tokens(request_kwargs)
+        output_tokens = request_kwargs.get("max_tokens", 0)
+        attempt = 0
+        while True:
+            queued_at = self._clock()
+            reservation = self.acquire(input_tokens, output_tokens, priority)
+            if self.on_wait:
+                self.on_wait(self._clock() - queued_at)
+            try:
+                message = send(**request_kwargs)
+            except Exception as e:
+                self.release(reservation)
+                rate_limited = is_rate_limited(e)
+                if attempt >= self.max_retries or not (rate_limited or is_transient(e)):
+                    raise
+                attempt += 1
+                delay = error_retry_after(e)
+                if delay is None:
+                    delay = self.backoff_base * (2 ** (attempt - 1))
+                if rate_limited:
+                    logger.warning(f"Anthropic rate limited (HTTP {e.status_code}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    self.pause(delay)
+                else:
+                    logger.warning(f"Anthropic call failed ({e!r}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    time.sleep(delay)
+                continue
+            self.settle(reservation, getattr(message, "usage", None))
+            return message
+
+    def stats(self):
+        with self._cond:
+            now = self._clock()
+            for bucket in self._buckets.values():
+                bucket.wait_time(0, now) # Refill before reporting
+            return {
+                "waiting": len(self._waiters),
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "buckets": {name: {"limit": b.limit, "available": round(b.level, 1) if b.limit else None}
+                            for name, b in self._buckets.items()},
+            }
+
+
+def _int_header(headers, name):
+    value = _float_header(headers, name)
+    return None if value is None else int(value)
+
+
+def _float_header(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,182 @@
+"""Long-lived Brave Search API client.
+
+One BraveSearchClient is shared by the whole process so connections to Brave are pooled and
+kept alive between searches (no new TCP/TLS handshake per query). It retries 429/5xx responses
+with exponential backoff and trips a circuit breaker when Brave keeps failing, so callers fail
+fast instead of waiting on timeouts while the API is degraded.
+"""
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BRAVE_SEARCH_URL = "https://api.search.brave.com/res/v1/web/search"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SearchError(Exception):
+    """Raised when a search could not be completed."""
+
+
+class SearchRequestError(SearchError):
+    """Raised for non-retryable 4xx responses (bad key, bad query). Does not trip the breaker."""
+
+
+class CircuitOpenError(SearchError):
+    """Raised without calling Brave while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are rejected
+    for `reset_timeout` seconds. The first call after that is let through as a trial
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class BraveSearchClient:
+    """Pooled, keep-alive Brave Search client with retries and a circuit breaker."""
+
+    def __init__(self, api_key=None, url=BRAVE_SEARCH_URL, timeout=10.0,
+                 max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0,
+                 failure_threshold=5, reset_timeout=30.0, transport=None):
+        self.api_key = api_key
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        import httpx # Deferred so importing this module (and the app) stays cheap
+        self._http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            headers={"Accept": "application/json", "Accept-Encoding": "gzip"},
+            transport=transport, # Only set by tests (httpx.MockTransport)
+        )
+
+    def close(self):
+        self._http.close()
+
+    def _backoff_delay(self, attempt, response=None):
+        """Seconds to wait before retry `attempt` (1-based), honoring Retry-After when present."""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        delay = self.backoff_base * (2 ** (attempt - 1))
+        return min(delay, self.backoff_max) * random.uniform(0.8, 1.2) # Jitter avoids synchronized retries
+
+    def _request(self, params, api_key):
+        """GETs the search endpoint, retrying transient failures. Returns the httpx response."""
+        import httpx # Already loaded by __init__
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self._http.get(self.url, params=params, headers={"X-Subscription-Token": api_key})
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = SearchError(f"Brave Search returned HTTP {response.status_code}")
+            except httpx.HTTPStatusError as e:
+                # Non-retryable 4xx: a problem with our request, not with Brave
+                raise SearchRequestError(f"Brave Search returned HTTP {e.response.status_code}") from e
+            except httpx.TransportError as e:
+                error = SearchError(f"Brave Search request failed: {e}")
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            time.sleep(self._backoff_delay(attempt, response))
+
+    def search(self, query, count=3, api_key=None):
+        """Returns a list of {"title", "description"} results (possibly empty).
+
+        `api_key` overrides the key the client was created with.
+        Raises CircuitOpenError while Brave is considered degraded, SearchError on other failures.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("Brave Search circuit is open, skipping search")
+
+        try:
+            response = self._request({"q": query, "count": count}, api_key or self.api_key)
+            data = response.json()
+        except SearchRequestError:
+            self.breaker.record_success() # Brave answered; the request itself was bad
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+        # Adjust based on Brave's actual response structure - often under 'web' -> 'results'
+        results = data.get('web', {}).get('results')
+        if not results:
+            logger.info(f"Brave Search returned no results under 'web.results' for query: {query}")
+            logger.debug(f"Raw response sample: {str(data)[:200]}") # Log sample of response
+            return []
+
+        # Return simplified list of title/description
+        return [
+            {"title": r.get('title'), "description": r.get('description')}
+            for r in results if r.get('title') and r.get('description')
+        ]
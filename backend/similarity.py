@@ -0,0 +1,83 @@
+"""Near-duplicate detection for drafts with MinHash signatures and LSH bands.
+
+A draft is reduced to the set of its word 3-shingles ("ai changes hiring", "changes hiring
+for", ...). The MinHash signature (NUM_PERM integers) of two drafts agrees in about as many
+positions as the Jaccard similarity of their shingle sets, so comparing two signatures is
+cheap and does not need the texts.
+
+To find candidates among millions of saved drafts without comparing against each one, the
+signature is cut into BANDS bands of ROWS values and each band is hashed to one integer key
+(stored on the draft, multikey-indexed). Drafts sharing at least one band key are
+candidates: with 20 bands of 3 rows, pairs at similarity 0.6 share a band ~99% of the time,
+pairs at 0.1 ~2% of the time. Candidates are then checked with the full signatures.
+
+Signatures are stored in MongoDB, so the hashing below must never change: every value is
+derived from blake2b, not from Python's per-process randomized hash().
+"""
+import hashlib
+import re
+import struct
+
+NUM_PERM = 60
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+
+_PRIME = (1 << 61) - 1 # Mersenne prime: signature values fit in a signed 64-bit BSON int
+_BAND_KEY_BITS = 56 # Band number in the high bits keeps keys of different bands apart
+_WORD_RE = re.compile(r"\w+")
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+# Fixed (a, b) coefficients of the NUM_PERM hash permutations h -> (a * h + b) mod p
+_PERMUTATIONS = [
+    (_hash64(f"minhash-a-{i}".encode()) % (_PRIME - 1) + 1, _hash64(f"minhash-b-{i}".encode()) % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+
+def shingles(text):
+    """Set of word n-grams of the normalized (lowercased, punctuation-free) text."""
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text):
+    """MinHash signature of a text: a list of NUM_PERM ints (all zeros for empty text)."""
+    hashes = [_hash64(shingle.encode("utf-8")) for shingle in shingles(text)]
+    if not hashes:
+        return [0] * NUM_PERM
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity (0..1) of the texts behind two signatures."""
+    if not signature_a or len(signature_a) != len(signature_b):
+        return 0.0
+    return sum(1 for x, y in zip(signature_a, signature_b) if x == y) / len(signature_a)
+
+
+def band_keys(sig):
+    """The BANDS LSH keys of a signature (ints, stored and indexed on the draft)."""
+    keys = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS:(band + 1) * ROWS]
+        digest = _hash64(struct.pack(f">{ROWS}Q", *rows)) & ((1 << _BAND_KEY_BITS) - 1)
+        keys.append((band << _BAND_KEY_BITS) | digest)
+    return keys
+
+
+def near_duplicates(sig, candidates, threshold):
+    """[(id, similarity)] of the (id, signature) candidates at or above `threshold`, most similar first."""
+    matches = []
+    for candidate_id, candidate_sig in candidates:
+        score = similarity(sig, candidate_sig)
+        if score >= threshold:
+            matches.append((candidate_id, score))
+    matches.sort(key=lambda match: match[1], reverse=True)
+    return matches
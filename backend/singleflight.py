@@ -0,0 +1,155 @@
+"""Single-flight request coalescing for identical in-flight LLM calls.
+
+A double click, or two users submitting the same corpus, should cost one Claude call, not two.
+SingleFlight.do(key, fn) runs fn() once per key at a time: callers that arrive while a call
+with the same key is running wait for it and share its result (or its exception).
+
+With a MongoLease, the call is also coordinated across processes. The first process inserts
+a lease document for the key; other processes poll it until the owner stores the result, and
+take over if the owner dies (its lease expires) or fails. Results must then be BSON-encodable.
+Only callers that arrive while a call is running share it: a finished call never answers a
+later request, that is what the caches are for.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEASE_RUNNING = "running"
+LEASE_DONE = "done"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0 # Callers in this process waiting for the result
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, within the process and optionally via `lease`."""
+
+    def __init__(self, lease=None):
+        self.lease = lease
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Returns (result, shared); `shared` is True when another caller's call produced it."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            if self.lease is not None:
+                call.result, shared = self.lease.run(key, fn)
+            else:
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, shared
+
+    def waiting(self, key):
+        """Number of callers in this process waiting for the in-flight call with this key.
+
+        A leader that would like to give up (its own client went away) should finish when this
+        is non-zero. Waiters in other processes need no such care: when the owner fails, they
+        run the call themselves (see MongoLease).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            return call.waiters if call is not None else 0
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class MongoLease:
+    """Cross-process coordination through one lease document per in-flight key.
+
+    Documents: {_id: key, status: "running" | "done", owner, expires_at, result}. A running
+    lease is renewed by nobody: `lease_seconds` must exceed the slowest call. Finished leases
+    are kept for `result_ttl` seconds so pollers can read them (TTL index on expires_at).
+    """
+
+    def __init__(self, collection_getter, lease_seconds=120, poll_interval=0.25, result_ttl=60):
+        self._collection_getter = collection_getter
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+
+    def _try_acquire(self, collection, key, owner):
+        """Takes the lease if it is free, expired or holds an old result. Returns True on success."""
+        now = datetime.utcnow()
+        lease = {"status": LEASE_RUNNING, "owner": owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}
+        try:
+            collection.insert_one({"_id": key, **lease})
+            return True
+        except DuplicateKeyError:
+            pass
+        taken = collection.update_one(
+            {"_id": key, "$or": [{"status": LEASE_DONE}, {"expires_at": {"$lt": now}}]},
+            {"$set": lease, "$unset": {"result": ""}},
+        )
+        return taken.modified_count == 1
+
+    def run(self, key, fn):
+        """Runs fn() as the lease owner, or waits for the owner's result. Returns (result, shared)."""
+        collection = self._collection_getter()
+        owner = uuid.uuid4().hex
+        waiting = False
+        while True:
+            if not waiting and self._try_acquire(collection, key, owner):
+                break
+            # Someone else is running it (or just took over): wait for their result
+            waiting = True
+            time.sleep(self.poll_interval)
+            lease = collection.find_one({"_id": key})
+            if lease is None or lease["expires_at"] < datetime.utcnow():
+                waiting = False # Owner failed or died: try to run it ourselves
+            elif lease["status"] == LEASE_DONE:
+                return lease.get("result"), True
+
+        try:
+            result = fn()
+        except Exception:
+            collection.delete_one({"_id": key, "owner": owner}) # Waiters take over
+            raise
+        try:
+            collection.update_one({"_id": key, "owner": owner}, {"$set": {
+                "status": LEASE_DONE,
+                "result": result,
+                "expires_at": datetime.utcnow() + timedelta(seconds=self.result_ttl),
+            }})
+        except Exception as e:
+            # Waiters will time out and run the call themselves; our caller still gets its result
+            logger.warning(f"Could not publish single-flight result for {key}: {e}")
+            collection.delete_one({"_id": key, "owner": owner})
+        return result, False
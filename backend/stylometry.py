@@ -0,0 +1,271 @@
+"""Local stylometry: style features measured from the posts without an LLM call.
+
+Emoji frequency, sentence lengths, keywords, hashtags, calls to action and pronoun
+perspective are plain counting, so they are measured here in a few milliseconds (regex +
+Counter over the whole corpus) instead of asking Claude to eyeball them. They are used in
+two ways:
+- as structured hints in the analysis prompt, so the model only has to judge tone, themes
+  and a name, and can be sent a sample of the posts rather than the whole corpus;
+- as a fully local profile ("fast" analysis mode), with the same keys as a Claude analysis.
+
+Features are computed per post (post_features) and then aggregated (summarize). Per-post
+features are small, JSON/BSON-encodable dicts, so they can be stored and re-aggregated later
+without the post texts.
+"""
+import re
+from collections import Counter
+
+from ingest import POST_SEPARATOR
+
+TOP_KEYWORDS = 12
+TOP_EMOJIS = 5
+TOP_HASHTAGS = 5
+POST_KEYWORDS = 30 # Keywords kept per post (bounds the size of stored per-post features)
+SHORT_SENTENCE_WORDS = 8
+LONG_SENTENCE_WORDS = 25
+CTA_MIN_SHARE = 0.2 # A CTA is "common" when at least this share of posts use it
+# Analysis keys that are measured here rather than judged (tone, themes and name need Claude)
+MEASURED_FIELDS = ("common_keywords", "sentence_structure", "emoji_usage", "common_cta", "perspective")
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+_HASHTAG_RE = re.compile(r"#(\w+)")
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+_EMOJI_RE = re.compile(
+    "[\U0001F1E6-\U0001F1FF\U0001F300-\U0001F5FF\U0001F600-\U0001F64F\U0001F680-\U0001F6FF"
+    "\U0001F900-\U0001F9FF\U0001FA70-\U0001FAFF\u2600-\u27BF\u2B50\u2B55]"
+)
+
+# Label -> pattern, matched case-insensitively against each post
+CTA_PATTERNS = {
+    "Link in comments": r"link (?:is )?in (?:the )?(?:first )?(?:comments?|bio)",
+    "DM me": r"\b(?:dm|message|inbox) me\b|send me a (?:dm|message)",
+    "Comment below": r"comment below|in the comments|drop (?:a|your) [\w ]{0,20}below",
+    "Ask for thoughts": r"what do you think|what are your thoughts|what's your take|let me know|agree\?",
+    "Follow for more": r"follow (?:me )?for more|hit (?:the )?follow|follow me\b",
+    "Repost / share": r"\brepost\b|♻️|share (?:this|it) with",
+    "Visit / sign up": r"sign up|register (?:here|now|today)|check out|visit (?:our|my|the)|subscribe",
+}
+_CTA_RES = {label: re.compile(pattern, re.IGNORECASE) for label, pattern in CTA_PATTERNS.items()}
+
+PRONOUNS = {
+    "first_singular": {"i", "me", "my", "mine", "myself", "i'm", "i've", "i'd", "i'll"},
+    "first_plural": {"we", "us", "our", "ours", "ourselves", "we're", "we've", "we'll"},
+    "second": {"you", "your", "yours", "yourself", "you're", "you've", "you'll"},
+    "third": {"he", "she", "they", "him", "her", "them", "his", "hers", "their", "theirs", "he's", "she's", "they're"},
+}
+
+STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "had", "has", "have", "was",
+    "were", "one", "our", "out", "get", "got", "how", "its", "it's", "just", "like", "also", "been",
+    "from", "into", "more", "most", "much", "only", "over", "some", "such", "than", "that", "them",
+    "then", "there", "these", "they", "this", "those", "very", "what", "when", "where", "which",
+    "while", "who", "whom", "why", "will", "with", "would", "could", "should", "about", "after",
+    "again", "because", "before", "being", "both", "did", "does", "doing", "don't", "each", "few",
+    "her", "here", "his", "him", "let", "may", "might", "must", "now", "off", "own", "same", "she",
+    "so", "their", "too", "under", "until", "upon", "way", "yet", "your", "yours", "what's", "i'm",
+    "i've", "we're", "you're", "that's", "there's", "can't", "won't", "isn't", "didn't", "every",
+    "through", "other", "make", "made", "many", "need", "new", "really", "thing", "things", "today",
+    "even", "still", "well", "back", "know", "see", "say", "said", "want", "take", "time", "year",
+    "years", "first", "last", "lot", "going", "something", "anything", "nothing", "everyone",
+}
+for _words in PRONOUNS.values():
+    STOPWORDS |= _words
+
+
+def has_post_separators(posts_text):
+    """True if the corpus marks post boundaries with '---' (or form feed) lines."""
+    return any(POST_SEPARATOR.match(line) for line in (posts_text or "").splitlines())
+
+
+def split_posts(posts_text):
+    """Splits a pasted corpus into posts at '---' (or form feed) lines, like the ingest endpoint.
+
+    Without any separator, blank-line separated paragraphs stand in for posts: per-post
+    statistics are then approximate, but a whole corpus is not measured as one giant post.
+    """
+    if not has_post_separators(posts_text):
+        return [paragraph.strip() for paragraph in _PARAGRAPH_SPLIT_RE.split(posts_text or "") if paragraph.strip()]
+    posts, buffer = [], []
+    for line in (posts_text or "").splitlines():
+        if POST_SEPARATOR.match(line):
+            posts.append("\n".join(buffer).strip())
+            buffer = []
+        else:
+            buffer.append(line)
+    posts.append("\n".join(buffer).strip())
+    return [post for post in posts if post]
+
+
+def post_features(post):
+    """Raw counts for one post (mergeable across posts, see summarize)."""
+    words = _WORD_RE.findall(post.replace("’", "'").lower())
+    sentences = [len(_WORD_RE.findall(s)) for s in _SENTENCE_SPLIT_RE.split(post)]
+    pronouns = {kind: sum(1 for w in words if w in kind_words) for kind, kind_words in PRONOUNS.items()}
+    keywords = Counter(w for w in words if len(w) >= 3 and w not in STOPWORDS)
+    return {
+        "words": len(words),
+        "sentences": [n for n in sentences if n],
+        "lines": sum(1 for line in post.splitlines() if line.strip()),
+        "emojis": dict(Counter(_EMOJI_RE.findall(post))),
+        "hashtags": dict(Counter(tag.lower() for tag in _HASHTAG_RE.findall(post))),
+        "keywords": dict(keywords.most_common(POST_KEYWORDS)),
+        "cta": [label for label, pattern in _CTA_RES.items() if pattern.search(post)],
+        "pronouns": pronouns,
+        "question": post.rstrip().endswith("?"),
+        "exclamations": post.count("!"),
+    }
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _ranked(per_post, field, top):
+    """Top keys of a per-post Counter field, ranked by how many posts use them, then total count."""
+    posts_using, totals = Counter(), Counter()
+    for features in per_post:
+        posts_using.update(features[field].keys())
+        totals.update(features[field])
+    return sorted(posts_using, key=lambda key: (-posts_using[key], -totals[key], key))[:top]
+
+
+def perspective_label(shares):
+    """Dominant grammatical person, e.g. "First-person (I)" or "Third-person"."""
+    first = shares["first_singular"] + shares["first_plural"]
+    if not first and not shares["second"] and not shares["third"]:
+        return "Impersonal"
+    if shares["third"] > first and shares["third"] >= shares["second"]:
+        return "Third-person"
+    if shares["second"] > first:
+        return "Second-person (addresses the reader)"
+    return "First-person (I)" if shares["first_singular"] >= shares["first_plural"] else "First-person (we)"
+
+
+def summarize(per_post):
+    """Aggregates per-post features into corpus features (the hints given to the model)."""
+    post_count = len(per_post)
+    word_count = sum(f["words"] for f in per_post)
+    lengths = sorted(n for f in per_post for n in f["sentences"])
+    emoji_total = sum(sum(f["emojis"].values()) for f in per_post)
+    pronouns = Counter()
+    cta_posts = Counter()
+    for f in per_post:
+        pronouns.update(f["pronouns"])
+        cta_posts.update(f["cta"])
+    pronoun_total = sum(pronouns.values())
+    shares = {kind: round(pronouns[kind] / pronoun_total, 2) if pronoun_total else 0.0 for kind in PRONOUNS}
+    posts = max(post_count, 1)
+    return {
+        "posts": post_count,
+        "words": word_count,
+        "emoji": {
+            "per_100_words": round(100 * emoji_total / word_count, 2) if word_count else 0.0,
+            "posts_with_emoji": round(sum(1 for f in per_post if f["emojis"]) / posts, 2),
+            "top": _ranked(per_post, "emojis", TOP_EMOJIS),
+        },
+        "sentences": {
+            "count": len(lengths),
+            "mean_words": round(sum(lengths) / len(lengths), 1) if lengths else 0.0,
+            "median_words": _percentile(lengths, 0.5),
+            "p90_words": _percentile(lengths, 0.9),
+            "short_share": round(sum(1 for n in lengths if n <= SHORT_SENTENCE_WORDS) / len(lengths), 2) if lengths else 0.0,
+            "long_share": round(sum(1 for n in lengths if n >= LONG_SENTENCE_WORDS) / len(lengths), 2) if lengths else 0.0,
+        },
+        "lines_per_post": round(sum(f["lines"] for f in per_post) / posts, 1),
+        "exclamations_per_post": round(sum(f["exclamations"] for f in per_post) / posts, 2),
+        "question_endings": round(sum(1 for f in per_post if f["question"]) / posts, 2),
+        "keywords": _ranked(per_post, "keywords", TOP_KEYWORDS),
+        "hashtags": ["#" + tag for tag in _ranked(per_post, "hashtags", TOP_HASHTAGS)],
+        "cta": {label: round(count / posts, 2) for label, count in cta_posts.most_common()},
+        "perspective": {**shares, "label": perspective_label(shares)},
+    }
+
+
+def corpus_features(posts_text):
+    """Corpus features of a pasted corpus (posts separated by '---' lines)."""
+    return summarize([post_features(post) for post in split_posts(posts_text)])
+
+
+def sample_posts(posts, max_chars):
+    """Picks posts spread evenly over the corpus, in order, totalling at most `max_chars`.
+
+    Returns all posts if they fit (or max_chars is 0) or if there is only one. Posts are never
+    cut: if every picked post is over budget, the first one is returned whole.
+    """
+    total = sum(len(post) for post in posts)
+    if not max_chars or total <= max_chars or len(posts) < 2:
+        return list(posts)
+    target = max(1, len(posts) * max_chars // total)
+    picked, size = [], 0
+    for i in sorted({j * len(posts) // target for j in range(target)}):
+        if size + len(posts[i]) > max_chars:
+            continue
+        picked.append(posts[i])
+        size += len(posts[i])
+    return picked or list(posts[:1])
+
+
+# --- Local ("fast") profile ---
+def describe_emoji_usage(emoji):
+    rate = emoji["per_100_words"]
+    if not rate:
+        return "none"
+    frequency = "rare" if rate < 0.5 else "occasional" if rate < 2 else "frequent"
+    return f"{frequency} ({' '.join(emoji['top'])})" if emoji["top"] else frequency
+
+
+def describe_sentence_structure(sentences):
+    median = sentences["median_words"]
+    if median <= 10 and sentences["long_share"] < 0.1:
+        shape = "short and punchy"
+    elif median >= 20:
+        shape = "complex sentences"
+    else:
+        shape = "mix of short and long"
+    return f"{shape} (median {median} words per sentence)"
+
+
+def describe_tone(features):
+    """Rough tone from punctuation and emoji habits; only Claude can really judge tone."""
+    if features["exclamations_per_post"] >= 1:
+        return "Enthusiastic"
+    if features["question_endings"] >= 0.3:
+        return "Conversational"
+    if features["emoji"]["per_100_words"] >= 2:
+        return "Informal"
+    return "Professional"
+
+
+def common_cta(features):
+    """The most used CTA if enough posts use it, else None."""
+    top = next(iter(features["cta"].items()), None) # Ordered most used first
+    return top[0] if top and top[1] >= CTA_MIN_SHARE else None
+
+
+def measured_profile(features):
+    """The MEASURED_FIELDS of a style analysis, described from the features."""
+    return {
+        "common_keywords": features["keywords"],
+        "sentence_structure": describe_sentence_structure(features["sentences"]),
+        "emoji_usage": describe_emoji_usage(features["emoji"]),
+        "common_cta": common_cta(features),
+        "perspective": features["perspective"]["label"],
+    }
+
+
+def local_profile(features):
+    """A style analysis with the same keys as Claude's, derived from the features alone."""
+    themes = [tag.lstrip("#") for tag in features["hashtags"]] or features["keywords"][:5]
+    tone = describe_tone(features)
+    measured = measured_profile(features)
+    structure = measured["sentence_structure"]
+    shape = "Punchy" if structure.startswith("short") else "Long-form" if structure.startswith("complex") else "Balanced"
+    return {
+        "overall_tone": tone,
+        "key_themes": [theme.upper() if len(theme) <= 2 else theme[:1].upper() + theme[1:] for theme in themes[:5]],
+        **measured,
+        "style_name": f"{tone} {shape} {measured['perspective'].split(' ')[0]} Voice",
+    }
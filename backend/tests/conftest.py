@@ -7,22 +7,37 @@ backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 
-# Now import the app
-from app import app as flask_app # Import your Flask app instance
+# Now import the app (cheap: no clients are created and no settings are required at import)
+from app import create_app
+from app import analysis_cache, search_cache, style_cache, anthropic_governor
 
 @pytest.fixture(scope='module')
 def app():
     """Instance of Flask app"""
-    # Configure app for testing if necessary (e.g., different DB)
-    # flask_app.config.update({
-    #     "TESTING": True,
-    #     "MONGO_URI": "mongodb://localhost:27017/linkedin_style_sync_test" # Example: Use a test DB
-    # })
-
-    # TODO: Potentially mock external API calls (Anthropic, Brave) here
-    # using pytest-mock or unittest.mock if you don't want tests hitting live APIs.
-
+    # Settings default to harmless placeholders so the suite does not need a .env; clients are
+    # created lazily and every test mocks the calls they make
+    flask_app = create_app({
+        "TESTING": True,
+        "MONGO_URI": os.getenv("MONGO_URI") or "mongodb://localhost:27017/linkedin_style_sync_test",
+        "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY") or "sk-test",
+        # No rate limiting by default: mocked calls would otherwise drain the buckets across tests
+        "ANTHROPIC_REQUESTS_PER_MINUTE": 0,
+        "ANTHROPIC_INPUT_TOKENS_PER_MINUTE": 0,
+        "ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE": 0,
+    })
     yield flask_app
 
 # Removed the client fixture as pytest-flask provides it automatically when app is defined.
 # pytest-flask automatically provides a `client` fixture based on the `app` fixture.
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """In-process caches live at module level; reset them so tests stay independent."""
+    for cache in (analysis_cache, search_cache, style_cache):
+        cache.clear()
+        cache.reset_stats()
+    anthropic_governor.reset() # Rebuilt on first use with the current settings
+    yield
+    for cache in (analysis_cache, search_cache, style_cache):
+        cache.clear()
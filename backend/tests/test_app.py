@@ -1,9 +1,20 @@
 import pytest
 from flask import url_for
 import json
+import time
 from unittest.mock import MagicMock # For creating mock objects
 from bson.objectid import ObjectId # Import ObjectId for mocking DB find_one
-from datetime import datetime # Import datetime for mocking DB find_one
+from datetime import datetime, timedelta # Import datetime for mocking DB find_one
+
+def _mock_message(text, **usage):
+    """Builds a stand-in for an Anthropic Messages API response (token counts via `usage`)."""
+    mock_message = MagicMock()
+    mock_message.content = [MagicMock(text=text)]
+    mock_message.usage = MagicMock(**{
+        field: usage.get(field, 0)
+        for field in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+    })
+    return mock_message
 
 # Basic test to check if the app loads and the root route works
 def test_home_route(client):
@@ -17,8 +28,7 @@ def test_analyze_style_success(client, mocker):
     """Test successful style analysis and auto-save."""
     # 1. Mock external dependencies
     # Mock Anthropic API response
-    mock_completion = MagicMock()
-    mock_completion.completion = json.dumps({
+    mock_message = _mock_message(json.dumps({
         "overall_tone": "Mock Tone",
         "key_themes": ["Mocking", "Testing"],
         "common_keywords": ["mock", "test", "assert"],
@@ -27,8 +37,8 @@ def test_analyze_style_success(client, mocker):
         "common_cta": None,
         "perspective": "third-person",
         "style_name": "Mocked Test Style"
-    })
-    mocker.patch('app.anthropic_client.completions.create', return_value=mock_completion)
+    }))
+    mocker.patch('app.anthropic_client.messages.create', return_value=mock_message)
 
     # --- Revised DB Mocking ---
     # Mock MongoDB insert_one result object
@@ -43,6 +53,8 @@ def test_analyze_style_success(client, mocker):
     mock_db = MagicMock()
     # Set the 'styles' attribute on the mock db to be our mock collection
     mock_db.styles = mock_styles_collection
+    # Nothing in the shared analysis cache yet
+    mock_db.analysis_cache.find_one.return_value = None
 
     # Patch the 'db' attribute of the mongo object in the app module
     mocker.patch('app.mongo.db', mock_db)
@@ -67,6 +79,7 @@ def test_analyze_style_success(client, mocker):
     assert "analysis" in response_data
     assert response_data['analysis']['overall_tone'] == "Mock Tone"
     assert response_data['analysis']['style_name'] == "Mocked Test Style"
+    assert response_data['cached'] is False
 
     # Check if the insert_one method on our mock collection was called
     mock_styles_collection.insert_one.assert_called_once()
@@ -76,6 +89,122 @@ def test_analyze_style_success(client, mocker):
     assert inserted_doc['analysis']['overall_tone'] == 'Mock Tone'
 
 
+def test_analyze_style_cache_hit_skips_llm(client, mocker):
+    """Re-submitting the same corpus (modulo whitespace) reuses the cached analysis."""
+    analysis = {"overall_tone": "Cached Tone", "style_name": "Cached Style"}
+    mock_create = mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message(json.dumps(analysis)))
+    mock_db = MagicMock()
+    mock_db.analysis_cache.find_one.return_value = None
+    mock_db.styles.insert_one.return_value = MagicMock(inserted_id="style_1")
+    mocker.patch('app.mongo.db', mock_db)
+
+    posts = "Cache me if you can. " * 10
+    first = client.post(url_for('analyze_and_save_style'), json={"posts_text": posts})
+    second = client.post(url_for('analyze_and_save_style'), json={"posts_text": "  " + posts.replace(" ", "  ") + "\n\n"})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.get_json()['cached'] is False
+    assert second.get_json()['cached'] is True
+    assert second.get_json()['analysis'] == analysis
+    assert mock_create.call_count == 1
+    # The analysis was written through to the shared Mongo tier, and a style is still saved each time
+    mock_db.analysis_cache.replace_one.assert_called_once()
+    assert mock_db.styles.insert_one.call_count == 2
+
+    stats = client.get(url_for('cache_stats')).get_json()['analysis']
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_analyze_style_uses_shared_cache_tier(client, mocker):
+    """A hit in the Mongo tier skips the LLM even when the in-process tier is cold."""
+    analysis = {"overall_tone": "Shared", "style_name": "Shared Style"}
+    mock_create = mocker.patch('app.anthropic_client.messages.create')
+    mock_db = MagicMock()
+    mock_db.analysis_cache.find_one.return_value = {
+        "value": analysis, "expires_at": datetime.utcnow() + timedelta(hours=1)
+    }
+    mock_db.styles.insert_one.return_value = MagicMock(inserted_id="style_2")
+    mocker.patch('app.mongo.db', mock_db)
+
+    res = client.post(url_for('analyze_and_save_style'), json={"posts_text": "Shared corpus text. " * 10})
+
+    assert res.status_code == 200
+    assert res.get_json()['cached'] is True
+    assert res.get_json()['analysis'] == analysis
+    mock_create.assert_not_called()
+
+
+def test_analyze_style_sends_stylometry_hints_and_a_sample_of_posts(client, mocker):
+    analysis = {"overall_tone": "Hinted", "style_name": "Hinted Style"}
+    mock_create = mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message(json.dumps(analysis)))
+    mock_db = MagicMock()
+    mock_db.analysis_cache.find_one.return_value = None
+    mock_db.styles.insert_one.return_value = MagicMock(inserted_id="style_3")
+    mocker.patch('app.mongo.db', mock_db)
+    mocker.patch.dict(client.application.config, {"ANALYSIS_SAMPLE_CHARS": 1000})
+    posts = "\n---\n".join(f"Post {i}: I ship small things every week 🚀 What do you think?" * 3 for i in range(40))
+
+    res = client.post(url_for('analyze_and_save_style'), json={"posts_text": posts})
+
+    assert res.status_code == 200
+    prompt = mock_create.call_args.kwargs['messages'][0]['content']
+    assert '"posts": 40' in prompt and "<stylometry>" in prompt
+    assert "Post 0:" in prompt and "Post 39:" not in prompt # Only a sample of the posts is sent
+    assert len(prompt) < len(posts)
+    inserted_doc = mock_db.styles.insert_one.call_args[0][0]
+    assert inserted_doc['stylometry']['posts'] == 40
+    assert inserted_doc['analysis_mode'] == "full"
+
+
+def test_analyze_style_sends_unseparated_corpus_whole(client, mocker):
+    """Without '---' separators post boundaries are unknown: nothing is sampled away."""
+    from app import analysis_cache_key
+    mock_create = mocker.patch('app.anthropic_client.messages.create',
+                               return_value=_mock_message(json.dumps({"style_name": "Whole"})))
+    mock_db = MagicMock()
+    mock_db.analysis_cache.find_one.return_value = None
+    mock_db.styles.insert_one.return_value = MagicMock(inserted_id="style_5")
+    mocker.patch('app.mongo.db', mock_db)
+    mocker.patch.dict(client.application.config, {"ANALYSIS_SAMPLE_CHARS": 1000})
+    posts = "\n\n".join(f"Post {i}: I ship small things every week and write about it." for i in range(60))
+
+    res = client.post(url_for('analyze_and_save_style'), json={"posts_text": posts})
+
+    assert res.status_code == 200
+    prompt = mock_create.call_args.kwargs['messages'][0]['content']
+    assert "Post 0:" in prompt and "Post 59:" in prompt
+    assert "excerpt" not in prompt and "all 60 paragraphs" in prompt
+
+    # Prompt-shaping settings are part of the cache key
+    key = analysis_cache_key(posts)
+    mocker.patch.dict(client.application.config, {"ANALYSIS_SAMPLE_CHARS": 2000})
+    assert analysis_cache_key(posts) != key
+
+
+def test_analyze_style_fast_mode_skips_llm(client, mocker):
+    mock_create = mocker.patch('app.anthropic_client.messages.create')
+    mock_db = MagicMock()
+    mock_db.styles.insert_one.return_value = MagicMock(inserted_id="style_4")
+    mocker.patch('app.mongo.db', mock_db)
+    posts = "I learned a lot about hiring this year! 🚀 Link in comments.\n---\nI hired three engineers. Hiring is hard! 💡"
+
+    res = client.post(url_for('analyze_and_save_style'), json={"posts_text": posts * 2, "mode": "fast"})
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body['mode'] == "fast" and body['cached'] is False
+    assert body['analysis']['perspective'] == "First-person (I)"
+    assert "hiring" in body['analysis']['common_keywords']
+    assert body['analysis']['common_cta'] == "Link in comments"
+    assert set(body['analysis']) >= {"overall_tone", "key_themes", "sentence_structure", "emoji_usage", "style_name"}
+    mock_create.assert_not_called()
+    assert mock_db.styles.insert_one.call_args[0][0]['analysis_mode'] == "fast"
+
+    res = client.post(url_for('analyze_and_save_style'), json={"posts_text": posts, "mode": "turbo"})
+    assert res.status_code == 400
+
+
 def test_analyze_style_insufficient_text(client):
     """Test analyze style with insufficient text."""
     request_data = {"posts_text": "Too short"}
@@ -133,12 +262,13 @@ def test_generate_post_success(client, mocker):
             return []
     mock_brave_search = mocker.patch('app.perform_brave_search', side_effect=brave_side_effect)
 
-    # Mock Anthropic create (to return different posts for different calls)
-    mock_completion1 = MagicMock()
-    mock_completion1.completion = "Generated Post Draft 1 for Angle 1."
-    mock_completion2 = MagicMock()
-    mock_completion2.completion = "Generated Post Draft 2 for Angle 2."
-    mock_anthropic_create = mocker.patch('app.anthropic_client.completions.create', side_effect=[mock_completion1, mock_completion2])
+    # Mock Anthropic messages.create (angles run concurrently, so key the reply on the prompt)
+    def anthropic_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        if "Angle 1: Integration" in prompt:
+            return _mock_message("Generated Post Draft 1 for Angle 1.")
+        return _mock_message("Generated Post Draft 2 for Angle 2.")
+    mock_anthropic_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
 
     # 2. Prepare request data
     request_data = {
@@ -162,7 +292,9 @@ def test_generate_post_success(client, mocker):
     assert response_data["generated_posts"][1] == "Generated Post Draft 2 for Angle 2."
 
     # Assert mocks were called correctly
-    mock_styles_collection_gen.find_one.assert_called_once_with({"_id": ObjectId(mock_style_id)})
+    mock_styles_collection_gen.find_one.assert_called_once_with(
+        {"_id": ObjectId(mock_style_id)}, {"_id": 1, "name": 1, "analysis": 1}
+    )
     assert mock_brave_search.call_count == 2
     # Check arguments passed to brave search using positional arg for query
     mock_brave_search.assert_any_call("Main Topic: Testing LLMs Angle 1: Integration", count=3)
@@ -170,13 +302,11 @@ def test_generate_post_success(client, mocker):
 
     assert mock_anthropic_create.call_count == 2
     # Check that prompts contained search results (simplified check)
-    first_anthropic_call_args = mock_anthropic_create.call_args_list[0]
-    second_anthropic_call_args = mock_anthropic_create.call_args_list[1]
-    assert "Snippet A for angle 1" in first_anthropic_call_args.kwargs['prompt']
-    assert "Snippet B for angle 2" in second_anthropic_call_args.kwargs['prompt']
-    assert "Angle 1: Integration" in first_anthropic_call_args.kwargs['prompt']
-    assert "Angle 2: Quality Challenges" in second_anthropic_call_args.kwargs['prompt']
-
+    prompts = [c.kwargs['messages'][0]['content'] for c in mock_anthropic_create.call_args_list]
+    angle1_prompt = next(p for p in prompts if "Angle 1: Integration" in p)
+    angle2_prompt = next(p for p in prompts if "Angle 2: Quality Challenges" in p)
+    assert "Snippet A for angle 1" in angle1_prompt
+    assert "Snippet B for angle 2" in angle2_prompt
 
 def test_generate_post_no_angles(client, mocker):
     """Test successful post generation with no specific angles (uses topic for search/angle)."""
@@ -192,9 +322,7 @@ def test_generate_post_no_angles(client, mocker):
     mock_search_results = [{"title": "Brave Result Topic", "description": "Snippet for main topic"}]
     mock_brave_search = mocker.patch('app.perform_brave_search', return_value=mock_search_results)
 
-    mock_completion = MagicMock()
-    mock_completion.completion = "Generated Post Draft for Main Topic."
-    mock_anthropic_create = mocker.patch('app.anthropic_client.completions.create', return_value=mock_completion)
+    mock_anthropic_create = mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message("Generated Post Draft for Main Topic."))
 
     request_data = {
         "style_id": mock_style_id,
@@ -215,14 +343,1088 @@ def test_generate_post_no_angles(client, mocker):
     mock_anthropic_create.assert_called_once()
     # Check prompt contained topic search result and topic as angle
     anthropic_call_args = mock_anthropic_create.call_args_list[0]
-    prompt_text = anthropic_call_args.kwargs['prompt']
+    prompt_text = anthropic_call_args.kwargs['messages'][0]['content']
     assert "Snippet for main topic" in prompt_text
     # Corrected assertion to match actual prompt format
     assert f"- **Specific Angle/Focus for this draft:** {request_data['topic']}" in prompt_text
-    assert f"Ensure the post focuses on the angle: '{request_data['topic']}'" in prompt_text
+    assert f"Focus the content on the angle: '{request_data['topic']}'" in prompt_text
+
+def test_generate_post_caches_style_prefix_and_reports_usage(client, mocker):
+    """A large enough style prefix is cached: the first angle writes the entry alone, the others
+    start once its response has begun and read it; token usage is summed per request."""
+    mock_style_id = "67f3917fd2cccab06147033c"
+    analysis = {"overall_tone": "Dry", "key_themes": [f"Theme number {i} of a long analysis" for i in range(150)]}
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": analysis}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    timeline = []
+
+    def text_stream():
+        timeline.append("One started")
+        yield "Draft "
+        time.sleep(0.05)
+        yield "One"
+
+    def stream_side_effect(*args, **kwargs):
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = text_stream()
+        stream.__enter__.return_value.get_final_message.return_value = _mock_message(
+            "Draft One", input_tokens=40, cache_creation_input_tokens=1200, output_tokens=300)
+        return stream
+
+    def create_side_effect(*args, **kwargs):
+        timeline.append("Two called")
+        return _mock_message("Draft Two", input_tokens=42, cache_read_input_tokens=1200, output_tokens=310)
+    mock_stream = mocker.patch('app.anthropic_client.messages.stream', side_effect=stream_side_effect)
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=create_side_effect)
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id,
+        "topic": "Caching",
+        "key_points": "- Reuse the prefix",
+        "subjects_or_angles": ["One", "Two"],
+    })
+
+    assert res.status_code == 200
+    assert res.get_json()["generated_posts"] == ["Draft One", "Draft Two"]
+    assert res.get_json()["usage"] == {
+        "input_tokens": 82, "cache_creation_input_tokens": 1200, "cache_read_input_tokens": 1200,
+        "output_tokens": 610, "requests": 2,
+    }
+    assert timeline == ["One started", "Two called"] # Two only starts once One's cache entry is readable
+    systems = [mock_stream.call_args.kwargs['system'], mock_create.call_args.kwargs['system']]
+    assert systems[0] == systems[1] # Byte-identical prefix across angles, or the cache never hits
+    assert [block.get("cache_control") for block in systems[0]] == [{"type": "ephemeral"}, None] # One breakpoint
+    assert '"overall_tone": "Dry"' in systems[0][0]["text"]
+    assert "- Reuse the prefix" in systems[0][1]["text"]
+    assert "Reuse the prefix" not in systems[0][0]["text"] # Cached prefix is shared by every request with this style
+    assert "overall_tone" not in mock_create.call_args.kwargs['messages'][0]['content']
+
+
+def test_generate_post_skips_cache_breakpoint_below_minimum_prefix(client, mocker):
+    """A short style prefix cannot be cached: no breakpoint, and all angles start at once."""
+    mock_style_id = "67f3917fd2cccab06147033c"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {"overall_tone": "Dry"}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    mock_create = mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message("Draft"))
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id, "topic": "Caching", "key_points": "- Point", "subjects_or_angles": ["One"],
+    })
+
+    assert res.status_code == 200
+    assert all("cache_control" not in block for block in mock_create.call_args.kwargs['system'])
+
+
+def test_generate_post_reuses_cached_style_until_deleted(client, mocker):
+    """Repeat generations skip the styles lookup; deleting the style invalidates the cached profile."""
+    import mongomock
+    db = mongomock.MongoClient().db
+    style_id = db.styles.insert_one({"name": "Cached", "analysis": {"overall_tone": "Warm"}}).inserted_id
+    mocker.patch('app.mongo.db', db)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message("Draft"))
+    find_one = mocker.spy(db.styles, 'find_one')
+    request_data = {"style_id": str(style_id), "topic": "Cache", "key_points": "- Point"}
+
+    assert client.post(url_for('generate_post'), json=request_data).status_code == 200
+    assert client.post(url_for('generate_post'), json=request_data).status_code == 200
+    assert find_one.call_count == 1
+
+    assert client.delete(f"/api/styles/{style_id}").status_code == 200
+    res = client.post(url_for('generate_post'), json=request_data)
+    assert res.status_code == 404
+    assert find_one.call_count == 2
+
+
+def test_style_change_stream_invalidates_cached_style(app, mocker):
+    """Updates seen on the styles change stream evict the cached profile."""
+    import threading
+    from app import style_cache, watch_style_changes
+    style_id = ObjectId("67f3917fd2cccab06147033d")
+    style_cache.set(str(style_id), {"_id": style_id, "analysis": {}})
+
+    stop = threading.Event()
+    stream = MagicMock(alive=True)
+    changes = iter([{"operationType": "update", "documentKey": {"_id": style_id}}])
+    def try_next():
+        change = next(changes, None)
+        if change is None:
+            stop.set()
+        return change
+    stream.try_next.side_effect = try_next
+    mock_db = MagicMock()
+    mock_db.styles.watch.return_value.__enter__.return_value = stream
+    mocker.patch('app.mongo.db', mock_db)
+
+    watch_style_changes(stop)
+
+    assert len(style_cache.memory) == 0
+
+
+def test_metrics_endpoint_exports_stage_timings_and_tokens(client, mocker):
+    """/metrics exposes per-stage latency histograms and Anthropic token counters."""
+    mock_style_id = "67f3917fd2cccab06147033e"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.fetch_brave_results', return_value=[])
+    mocker.patch('app.anthropic_client.messages.create',
+                 return_value=_mock_message("Draft", input_tokens=25, cache_read_input_tokens=900, output_tokens=120))
+
+    res = client.post(url_for('generate_post'), json={"style_id": mock_style_id, "topic": "Metrics", "key_points": "- Point"})
+    assert res.status_code == 200
+
+    res = client.get('/metrics')
+    assert res.status_code == 200
+    assert res.content_type.startswith("text/plain")
+    body = res.get_data(as_text=True)
+    assert 'linkedin_generator_stage_duration_seconds_count{stage="mongo_style_lookup"}' in body
+    assert 'linkedin_generator_stage_duration_seconds_count{stage="anthropic_generation"}' in body
+    assert 'linkedin_generator_anthropic_tokens_total{kind="cache_read",operation="generation"}' in body
+    assert 'linkedin_generator_http_request_duration_seconds_count{endpoint="/api/generate-post",method="POST",status="200"}' in body
+
+
+def test_health_and_readiness(client, mocker):
+    """/healthz never checks dependencies; /readyz reports Mongo, the Anthropic client and draining."""
+    mock_db = MagicMock()
+    mocker.patch('app.mongo.db', mock_db)
+
+    assert client.get('/healthz').get_json() == {"status": "ok"}
+    res = client.get('/readyz')
+    assert res.status_code == 200
+    assert res.get_json()["checks"] == {"mongo": "ok", "anthropic": "ok"}
+
+    mock_db.command.side_effect = Exception("no servers")
+    res = client.get('/readyz')
+    assert res.status_code == 503
+    assert res.get_json()["checks"]["mongo"] == "error: no servers"
+    assert client.get('/healthz').status_code == 200
+
+    mock_db.command.side_effect = None
+    mocker.patch('app.draining').is_set.return_value = True
+    res = client.get('/readyz')
+    assert res.status_code == 503
+    assert res.get_json()["checks"]["draining"] == "shutting down"
 
 
 # TODO: Add tests for:
 # - Analyze style errors (Anthropic/DB)
 # - /api/styles (GET)
 # - Generate post errors (Style not found, Brave error, Anthropic error)
+
+
+def test_generate_post_keeps_angle_order_when_first_angle_is_slowest(client, mocker):
+    """Drafts come back in angle order even if later angles finish first."""
+    mock_style_id = "67f3917fd2cccab061470339"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {"overall_tone": "Calm"}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+
+    def anthropic_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        if "angle: 'First'" in prompt:
+            time.sleep(0.2)
+            return _mock_message("Draft First")
+        if "angle: 'Second'" in prompt:
+            return _mock_message("Draft Second")
+        return _mock_message("Draft Third")
+    mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id,
+        "topic": "Ordering",
+        "key_points": "- Point",
+        "subjects_or_angles": ["First", "Second", "Third"],
+    })
+
+    assert res.status_code == 200
+    assert res.get_json()["generated_posts"] == ["Draft First", "Draft Second", "Draft Third"]
+
+
+def test_generate_post_falls_back_to_next_angle_on_failure(client, mocker):
+    """A failed angle is replaced by the next unused angle, up to the 3 draft limit."""
+    mock_style_id = "67f3917fd2cccab06147033a"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+
+    def anthropic_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        for name in ["A", "B", "C", "D", "E"]:
+            if f"angle: '{name}'" in prompt:
+                if name == "B":
+                    raise Exception("boom")
+                return _mock_message(f"Draft {name}")
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id,
+        "topic": "Fallback",
+        "key_points": "- Point",
+        "subjects_or_angles": ["A", "B", "C", "D", "E"],
+    })
+
+    assert res.status_code == 200
+    assert res.get_json()["generated_posts"] == ["Draft A", "Draft C", "Draft D"]
+    assert mock_create.call_count == 4 # E is never needed
+
+
+def test_generate_post_retries_rate_limited_angle(client, mocker):
+    """A 429 from Anthropic is waited out and retried instead of dropping the angle."""
+    import anthropic
+    import httpx
+
+    mock_style_id = "67f3917fd2cccab06147033a"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    rate_limited = anthropic.RateLimitError("rate limited", body=None, response=httpx.Response(
+        429, headers={"retry-after": "0"}, request=httpx.Request("POST", "https://api.anthropic.com/v1/messages")))
+    mock_create = mocker.patch('app.anthropic_client.messages.create',
+                               side_effect=[rate_limited, _mock_message("Draft A", output_tokens=5)])
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id,
+        "topic": "Limits",
+        "key_points": "- Point",
+        "subjects_or_angles": ["A"],
+    })
+
+    assert res.status_code == 200
+    assert res.get_json()["generated_posts"] == ["Draft A"]
+    assert mock_create.call_count == 2
+
+
+def _parse_sse(body):
+    """Parses a Server-Sent Events body into a list of (event, data) tuples."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_generate_post_stream_emits_deltas_and_drafts(client, mocker):
+    """The streaming endpoint emits per-angle deltas, per-draft events, then a final done event."""
+    mock_style_id = "67f3917fd2cccab06147033b"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+
+    def stream_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        name = "One" if "angle: 'One'" in prompt else "Two"
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = [f"Draft ", name]
+        return stream
+    mocker.patch('app.anthropic_client.messages.stream', side_effect=stream_side_effect)
+
+    res = client.post(url_for('generate_post_stream'), json={
+        "style_id": mock_style_id,
+        "topic": "Streaming",
+        "key_points": "- Point",
+        "subjects_or_angles": ["One", "Two"],
+    })
+
+    assert res.status_code == 200
+    assert res.mimetype == "text/event-stream"
+    events = _parse_sse(res.get_data(as_text=True))
+
+    deltas = [data for event, data in events if event == "delta"]
+    assert "".join(d["text"] for d in deltas if d["angle_index"] == 0) == "Draft One"
+    assert "".join(d["text"] for d in deltas if d["angle_index"] == 1) == "Draft Two"
+    drafts = sorted((data["angle_index"], data["draft"]) for event, data in events if event == "draft")
+    assert drafts == [(0, "Draft One"), (1, "Draft Two")]
+    assert events[-1][0] == "done"
+    assert events[-1][1]["generated_posts"] == ["Draft One", "Draft Two"]
+
+
+def test_generate_post_stream_missing_fields(client):
+    """Validation errors are returned as JSON before any stream starts."""
+    res = client.post(url_for('generate_post_stream'), json={"topic": "No style"})
+    assert res.status_code == 400
+    assert "Missing required fields" in res.get_json()["error"]
+
+
+def test_brave_search_results_are_cached_by_normalized_query(app, mocker):
+    """Queries differing only in case/whitespace share one Brave API call."""
+    mocker.patch.dict(app.config, {"BRAVE_SEARCH_API_KEY": "test-key"})
+    mock_search = mocker.patch('app.brave_client.search', return_value=[{"title": "T", "description": "D"}])
+    from app import perform_brave_search
+
+    assert perform_brave_search("AI  Trends", count=3) == [{"title": "T", "description": "D"}]
+    assert perform_brave_search("ai trends ", count=3) == [{"title": "T", "description": "D"}]
+    assert mock_search.call_count == 1
+
+    # A different count is a different query
+    perform_brave_search("ai trends", count=5)
+    assert mock_search.call_count == 2
+
+
+def test_brave_search_caches_empty_results_but_not_errors(app, mocker):
+    """Empty results are negatively cached; search errors are retried on the next call."""
+    from search_client import SearchError
+    mocker.patch.dict(app.config, {"BRAVE_SEARCH_API_KEY": "test-key"})
+    from app import perform_brave_search
+
+    mock_search = mocker.patch('app.brave_client.search', return_value=[])
+    assert perform_brave_search("nothing here") is None
+    assert perform_brave_search("nothing here") is None
+    assert mock_search.call_count == 1
+
+    mock_search = mocker.patch('app.brave_client.search', side_effect=SearchError("slow"))
+    assert perform_brave_search("flaky query") is None
+    assert perform_brave_search("flaky query") is None
+    assert mock_search.call_count == 2
+
+
+def test_analyze_style_batch_interactive(client, mocker):
+    """Valid corpora are analyzed and saved together; invalid ones are reported per item."""
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+
+    def anthropic_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        name = "Alpha" if "Alpha voice" in prompt else "Beta"
+        return _mock_message(json.dumps({"overall_tone": name, "style_name": f"{name} Style"}))
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    res = client.post(url_for('analyze_style_batch'), json={"corpora": [
+        {"posts_text": "Alpha voice post. " * 10},
+        "too short",
+        "Beta voice post. " * 10,
+    ]})
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["saved"] == 2 and body["failed"] == 1
+    statuses = [(r["index"], r["status"], r.get("style_name")) for r in body["results"]]
+    assert statuses == [(0, "saved", "Alpha Style"), (1, "invalid", None), (2, "saved", "Beta Style")]
+    assert mock_create.call_count == 2
+    assert sorted(d["name"] for d in db.styles.find()) == ["Alpha Style", "Beta Style"]
+
+
+def test_analyze_style_batch_rejects_empty_body(client):
+    res = client.post(url_for('analyze_style_batch'), json={"corpora": []})
+    assert res.status_code == 400
+
+
+def test_analyze_style_batch_offline_mode(client, mocker):
+    """Offline mode submits a Message Batch, then saves the styles once the batch has ended."""
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mock_batch_create = mocker.patch('app.anthropic_client.messages.batches.create', return_value=MagicMock(id="msgbatch_1"))
+    mocker.patch('app.anthropic_client.messages.batches.retrieve', return_value=MagicMock(processing_status="ended"))
+    succeeded = MagicMock(custom_id="item-0")
+    succeeded.result.type = "succeeded"
+    succeeded.result.message = _mock_message(json.dumps({"overall_tone": "Batch", "style_name": "Batch Style"}))
+    errored = MagicMock(custom_id="item-1")
+    errored.result.type = "errored"
+    mock_results = mocker.patch('app.anthropic_client.messages.batches.results', return_value=[succeeded, errored])
+
+    res = client.post(url_for('analyze_style_batch'), json={"mode": "offline", "corpora": [
+        "First offline corpus. " * 10,
+        "Second offline corpus. " * 10,
+    ]})
+    assert res.status_code == 202
+    batch_id = res.get_json()["batch_id"]
+    requests_sent = mock_batch_create.call_args.kwargs["requests"]
+    assert [r["custom_id"] for r in requests_sent] == ["item-0", "item-1"]
+
+    first = client.get(url_for('get_analysis_batch', batch_id=batch_id)).get_json()
+    second = client.get(url_for('get_analysis_batch', batch_id=batch_id)).get_json()
+
+    assert first["status"] == "completed"
+    assert [r["status"] for r in first["results"]] == ["saved", "failed"]
+    assert second == first
+    mock_results.assert_called_once()
+    assert db.styles.count_documents({}) == 1
+
+
+def test_offline_batch_collection_is_retried_after_a_failure(client, mocker):
+    """A collection that fails hands the batch back: the next poll completes it, without duplicate styles."""
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mocker.patch('app.anthropic_client.messages.batches.create', return_value=MagicMock(id="msgbatch_2"))
+    mocker.patch('app.anthropic_client.messages.batches.retrieve', return_value=MagicMock(processing_status="ended"))
+    succeeded = MagicMock(custom_id="item-0")
+    succeeded.result.type = "succeeded"
+    succeeded.result.message = _mock_message(json.dumps({"overall_tone": "Batch", "style_name": "Retried Style"}))
+    mocker.patch('app.anthropic_client.messages.batches.results',
+                 side_effect=[ConnectionError("network down"), [succeeded], [succeeded]])
+    batch_id = client.post(url_for('analyze_style_batch'), json={"mode": "offline", "corpora": [
+        "First offline corpus. " * 10,
+    ]}).get_json()["batch_id"]
+
+    assert client.get(url_for('get_analysis_batch', batch_id=batch_id)).status_code == 500
+    assert db.analysis_batches.find_one({"_id": ObjectId(batch_id)})["status"] == "processing"
+    retried = client.get(url_for('get_analysis_batch', batch_id=batch_id)).get_json()
+
+    assert retried["status"] == "completed"
+    assert [r["status"] for r in retried["results"]] == ["saved"]
+    assert db.styles.count_documents({}) == 1
+
+    # A collection interrupted after saving: saving again reports the style saved, not a duplicate
+    from app import save_analyzed_styles
+    results = [{"index": 0}]
+    with client.application.app_context():
+        save_analyzed_styles(results, {0: {"style_name": "Retried Style"}}, id_seed=ObjectId(batch_id))
+    assert results[0]["status"] == "saved" and results[0]["style_id"] == retried["results"][0]["style_id"]
+    assert db.styles.count_documents({}) == 1
+
+
+def test_get_drafts_keyset_pagination(client, mocker):
+    """Pages follow (created_at, _id) order without gaps or repeats, even with equal timestamps."""
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    base = datetime(2025, 4, 1, 12, 0, 0)
+    # Two drafts share a timestamp to exercise the _id tie-breaker
+    timestamps = [base, base + timedelta(minutes=1), base + timedelta(minutes=1), base + timedelta(minutes=2), base + timedelta(minutes=3)]
+    for i, ts in enumerate(timestamps):
+        db.drafts.insert_one({"draft_text": f"Draft {i}", "topic": "T", "created_at": ts})
+    expected = [d["draft_text"] for d in db.drafts.find().sort([("created_at", -1), ("_id", -1)])]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2, "view": "full"}
+        if cursor:
+            params["after"] = cursor
+        res = client.get(url_for('get_drafts', **params))
+        assert res.status_code == 200
+        body = res.get_json()
+        seen.extend(d["draft_text"] for d in body["drafts"])
+        pages += 1
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == expected
+    assert pages == 3
+
+
+def test_get_drafts_summary_view_truncates_in_mongo(client, mocker):
+    """The default summary view projects a truncated preview inside MongoDB."""
+    mock_db = MagicMock()
+    mock_db.drafts.aggregate.return_value = [{
+        "_id": ObjectId("67f3917fd2cccab061470340"), "topic": "T", "created_at": datetime(2025, 4, 1),
+        "draft_preview": "Short", "is_truncated": False,
+    }]
+    mocker.patch('app.mongo.db', mock_db)
+
+    res = client.get(url_for('get_drafts'))
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["next_cursor"] is None
+    assert body["drafts"][0]["draft_preview"] == "Short"
+    assert body["drafts"][0]["created_at"] == "2025-04-01T00:00:00Z"
+    pipeline = mock_db.drafts.aggregate.call_args.args[0]
+    assert "$substrCP" in json.dumps(pipeline)
+    assert "draft_text" not in pipeline[-1]["$project"]
+
+
+def test_get_drafts_rejects_bad_cursor(client):
+    res = client.get(url_for('get_drafts', after="not-a-cursor"))
+    assert res.status_code == 400
+
+
+def test_get_single_draft(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    draft_id = db.drafts.insert_one({"draft_text": "Full text", "created_at": datetime(2025, 4, 1)}).inserted_id
+
+    res = client.get(url_for('get_draft', draft_id=str(draft_id)))
+    assert res.status_code == 200
+    assert res.get_json()["draft_text"] == "Full text"
+    assert client.get(url_for('get_draft', draft_id="67f3917fd2cccab061470341")).status_code == 404
+    assert client.get(url_for('get_draft', draft_id="bad-id")).status_code == 400
+
+
+def test_save_drafts_bulk_reports_per_item_results(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    insert_many = mocker.spy(db.drafts, 'insert_many')
+
+    res = client.post(url_for('save_drafts_bulk'), json={"drafts": [
+        {"draft_text": "First", "topic": "T", "style_id": "s1"},
+        {"topic": "No text"},
+        {"draft_text": "Third"},
+    ]})
+
+    assert res.status_code == 201
+    body = res.get_json()
+    assert (body["saved"], body["failed"]) == (2, 1)
+    assert [r["status"] for r in body["results"]] == ["saved", "invalid", "saved"]
+    assert insert_many.call_count == 1 and insert_many.call_args.kwargs["ordered"] is False
+    assert db.drafts.find_one({"_id": ObjectId(body["results"][0]["draft_id"])})["topic"] == "T"
+    assert client.post(url_for('save_drafts_bulk'), json={"drafts": []}).status_code == 400
+
+
+def test_save_drafts_bulk_status_tells_invalid_input_from_database_failures(client, mocker):
+    """Nothing saved: 400 when every draft was invalid, 500 when the database rejected the valid ones."""
+    import mongomock
+    from pymongo.errors import BulkWriteError
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+
+    assert client.post(url_for('save_drafts_bulk'), json={"drafts": [{"topic": "No text"}]}).status_code == 400
+
+    mocker.patch.object(db.drafts, 'insert_many', side_effect=BulkWriteError({
+        "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000"}, {"index": 1, "code": 11000, "errmsg": "E11000"}],
+    }))
+    res = client.post(url_for('save_drafts_bulk'), json={"drafts": [
+        {"draft_text": "First"}, {"topic": "No text"}, {"draft_text": "Third"},
+    ]})
+
+    assert res.status_code == 500
+    assert [r["status"] for r in res.get_json()["results"]] == ["failed", "invalid", "failed"]
+
+
+def test_delete_drafts_bulk_reports_per_item_results(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    keep_id, gone_id = db.drafts.insert_many([{"draft_text": "Keep"}, {"draft_text": "Gone"}]).inserted_ids
+    missing_id = "67f3917fd2cccab061470341"
+
+    res = client.delete(url_for('delete_drafts_bulk'), json={"ids": [str(gone_id), missing_id, "bad-id"]})
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["deleted"] == 1
+    assert [r["status"] for r in body["results"]] == ["deleted", "not_found", "invalid"]
+    assert db.drafts.count_documents({}) == 1 and db.drafts.find_one({"_id": keep_id})
+    assert client.delete(url_for('delete_drafts_bulk'), json={}).status_code == 400
+
+
+def test_delete_drafts_bulk_does_not_claim_drafts_deleted_concurrently(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    first_id, second_id = db.drafts.insert_many([{"draft_text": "One"}, {"draft_text": "Two"}]).inserted_ids
+    find = db.drafts.find
+
+    def find_then_race(*args, **kwargs):
+        found = list(find(*args, **kwargs))
+        db.drafts.find = find # mongomock's delete_one uses find itself
+        db.drafts.delete_one({"_id": second_id}) # Another request deletes it before our delete_many
+        return found
+    db.drafts.find = find_then_race
+
+    res = client.delete(url_for('delete_drafts_bulk'), json={"ids": [str(first_id), str(second_id)]})
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["deleted"] == 1
+    assert [r["status"] for r in body["results"]] == ["unconfirmed", "unconfirmed"]
+    assert db.drafts.count_documents({}) == 0
+
+
+def test_generate_post_replaces_near_duplicate_drafts(client, mocker):
+    """A draft nearly identical to an earlier one is dropped and the next angle fills its slot."""
+    mock_style_id = "67f3917fd2cccab06147033a"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    base = "Hiring well is the highest leverage work a founder does and most of us learn it too late."
+    drafts = {
+        "A": base,
+        "B": base.replace("most of us", "many of us"), # Near-duplicate of A
+        "C": "Shipping weekly beats shipping perfectly because feedback compounds faster than polish.",
+        "D": "Write the memo before the meeting so the meeting can be about decisions.",
+    }
+
+    def anthropic_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        return next(_mock_message(text) for name, text in drafts.items() if f"angle: '{name}'" in prompt)
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id,
+        "topic": "Dedup",
+        "key_points": "- Point",
+        "subjects_or_angles": ["A", "a ", "B", "C", "D"], # "a " repeats A and is never generated
+    })
+
+    assert res.status_code == 200
+    assert res.get_json()["generated_posts"] == [drafts["A"], drafts["C"], drafts["D"]]
+    assert mock_create.call_count == 4
+
+
+def test_generate_post_caps_duplicate_regenerations(app, client, mocker):
+    """Once DRAFT_DUPLICATE_MAX_REGENERATIONS is spent, duplicates are kept instead of costing more calls."""
+    mock_style_id = "67f3917fd2cccab06147033a"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    mocker.patch.dict(app.config, {"DRAFT_DUPLICATE_MAX_REGENERATIONS": 1})
+    text = "Hiring well is the highest leverage work a founder does and most of us learn it too late."
+    mock_create = mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message(text))
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": mock_style_id,
+        "topic": "Dedup",
+        "key_points": "- Point",
+        "subjects_or_angles": ["A", "B", "C", "D", "E", "F"], # Every angle yields the same draft
+    })
+
+    assert res.status_code == 200
+    assert res.get_json()["generated_posts"] == [text] * 3
+    assert mock_create.call_count == 4 # 3 drafts + 1 regeneration, not all 6 angles
+
+
+def test_generate_post_stream_keeps_duplicates_no_angle_can_replace(client, mocker):
+    """With as many angles as drafts, a near-duplicate is kept (and flagged), not thrown away after being paid for."""
+    mock_style_id = "67f3917fd2cccab06147033a"
+    mock_db_gen = MagicMock()
+    mock_db_gen.styles.find_one.return_value = {"_id": ObjectId(mock_style_id), "analysis": {}}
+    mocker.patch('app.mongo.db', mock_db_gen)
+    mocker.patch('app.perform_brave_search', return_value=None)
+    same = "Hiring well is the highest leverage work a founder does and most of us learn it too late."
+    drafts = {"A": same, "B": same, "C": "Write the memo before the meeting so the meeting can be about decisions."}
+
+    def stream_side_effect(*args, **kwargs):
+        name = kwargs['messages'][0]['content'].split("angle: '")[1].split("'")[0]
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = [drafts[name]]
+        return stream
+    mock_stream = mocker.patch('app.anthropic_client.messages.stream', side_effect=stream_side_effect)
+
+    res = client.post(url_for('generate_post_stream'), json={
+        "style_id": mock_style_id, "topic": "Dedup", "key_points": "- Point", "subjects_or_angles": ["A", "B", "C"],
+    })
+
+    events = _parse_sse(res.get_data(as_text=True))
+    assert [data for event, data in events if event == "draft_duplicate"] == [
+        {"angle_index": 1, "angle": "B", "duplicate_of": 0, "replaced": False}]
+    assert events[-1][1]["generated_posts"] == [same, same, drafts["C"]]
+    assert mock_stream.call_count == 3
+
+
+def test_near_duplicate_candidates_rank_by_band_hits(app, client, mocker):
+    """The candidate limit keeps the saved drafts sharing the most LSH bands, not whichever match first."""
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mocker.patch.dict(app.config, {"DRAFT_DUPLICATE_MAX_CANDIDATES": 1})
+    text = "Hiring well is the highest leverage work a founder does and most of us learn it too late."
+    original = client.post(url_for('save_draft'), json={"draft_text": text}).get_json()
+    one_band = db.drafts.find_one({"_id": ObjectId(original["draft_id"])})["lsh_bands"][:1]
+    db.drafts.insert_many([{"draft_text": f"Noise {i}", "lsh_bands": one_band, "minhash": [0]} for i in range(5)])
+
+    again = client.post(url_for('save_draft'), json={"draft_text": text}).get_json()
+
+    assert [d["draft_id"] for d in again["near_duplicates"]] == [original["draft_id"]]
+
+
+def test_save_draft_flags_near_duplicates(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    text = "Hiring well is the highest leverage work a founder does and most of us learn it too late."
+
+    first = client.post(url_for('save_draft'), json={"draft_text": text}).get_json()
+    second = client.post(url_for('save_draft'), json={"draft_text": text.replace("most", "many")}).get_json()
+    other = client.post(url_for('save_draft'), json={"draft_text": "Something else entirely, about pricing."}).get_json()
+
+    assert first["near_duplicates"] == []
+    assert [d["draft_id"] for d in second["near_duplicates"]] == [first["draft_id"]]
+    assert other["near_duplicates"] == []
+    assert db.drafts.find_one({"_id": ObjectId(second["draft_id"])})["near_duplicate_of"] == first["draft_id"]
+    assert "minhash" not in client.get(url_for('get_draft', draft_id=second["draft_id"])).get_json()
+
+    bulk = client.post(url_for('save_drafts_bulk'), json={"drafts": [{"draft_text": text}, {"draft_text": text}]}).get_json()
+    assert len(bulk["results"][0]["near_duplicates"]) == 2 # Both saved copies
+    assert {"draft_id": bulk["results"][0]["draft_id"], "similarity": 1.0} in bulk["results"][1]["near_duplicates"]
+
+
+def test_search_drafts_filters_by_style_and_date_with_facets(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    db.drafts.insert_many([
+        {"draft_text": f"Draft {day}", "style_id": "s1" if day % 2 else "s2", "created_at": datetime(2025, 4, day)}
+        for day in range(1, 11)
+    ])
+
+    res = client.get(url_for('search_drafts', style_id="s1", **{"from": "2025-04-02", "to": "2025-04-09T00:00:00Z"},
+                             view="full", limit=2, facets="true"))
+    assert res.status_code == 200
+    body = res.get_json()
+    assert [d["draft_text"] for d in body["drafts"]] == ["Draft 7", "Draft 5"]
+    assert body["facets"] == {"style_id": [{"value": "s1", "count": 3}]}
+
+    page_2 = client.get(url_for('search_drafts', style_id="s1", **{"from": "2025-04-02", "to": "2025-04-09T00:00:00Z"},
+                                view="full", limit=2, after=body["next_cursor"], facets="true")).get_json()
+    assert [d["draft_text"] for d in page_2["drafts"]] == ["Draft 3"]
+    assert page_2["next_cursor"] is None and "facets" not in page_2
+
+    assert client.get(url_for('search_drafts', **{"from": "April"})).status_code == 400
+
+
+def test_search_drafts_ranks_text_matches_by_relevance(client, mocker):
+    mock_db = MagicMock()
+    mocker.patch('app.mongo.db', mock_db)
+    cursor = mock_db.drafts.find.return_value
+    cursor.sort.return_value.skip.return_value.limit.return_value = [
+        {"_id": ObjectId(), "draft_text": f"Hiring {i}", "created_at": datetime(2025, 4, 1), "score": 2.0 - i / 10}
+        for i in range(3)
+    ]
+
+    res = client.get(url_for('search_drafts', q="hiring", style_id="s1", view="full", limit=2))
+
+    assert res.status_code == 200
+    query, projection = mock_db.drafts.find.call_args.args
+    assert query == {"$text": {"$search": "hiring"}, "style_id": "s1"}
+    assert projection["score"] == {"$meta": "textScore"}
+    assert cursor.sort.call_args.args[0][0] == ("score", {"$meta": "textScore"})
+    body = res.get_json()
+    assert [d["score"] for d in body["drafts"]] == [2.0, 1.9]
+
+    client.get(url_for('search_drafts', q="hiring", view="full", limit=2, after=body["next_cursor"]))
+    cursor.sort.return_value.skip.assert_called_with(2)
+
+
+def test_identical_concurrent_analyses_share_one_llm_call(app, mocker):
+    import app as backend
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow_create(**kwargs):
+        time.sleep(0.2)
+        return _mock_message(json.dumps({"style_name": "Burst"}))
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=slow_create)
+    mock_db = MagicMock()
+    mock_db.analysis_cache.find_one.return_value = None
+    mocker.patch('app.mongo.db', mock_db)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        outcomes = list(executor.map(lambda _: backend.analyze_posts("Same corpus. " * 10), range(3)))
+
+    assert mock_create.call_count == 1
+    assert [analysis["style_name"] for analysis, _ in outcomes] == ["Burst"] * 3
+    assert sorted(cached for _, cached in outcomes) == [False, True, True]
+
+
+def test_identical_concurrent_generations_share_llm_calls(app, mocker):
+    import app as backend
+    from concurrent.futures import ThreadPoolExecutor
+    mocker.patch('app.perform_brave_search', return_value=None)
+
+    def slow_create(**kwargs):
+        time.sleep(0.2)
+        return _mock_message("Shared draft", output_tokens=7)
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=slow_create)
+
+    def generate(_):
+        return backend.generate_drafts({}, "Topic", "- Point", None, ["Angle"])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        outcomes = list(executor.map(generate, range(2)))
+
+    assert mock_create.call_count == 1
+    assert [drafts for drafts, _ in outcomes] == [["Shared draft"], ["Shared draft"]]
+    assert sorted(usage.get("output_tokens", 0) for _, usage in outcomes) == [0, 7] # Only the caller that paid reports usage
+
+
+def test_generate_post_multi_fans_out_styles_with_shared_searches(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    style_ids = [str(i) for i in db.styles.insert_many([
+        {"name": "Founder", "analysis": {"overall_tone": "Bold"}},
+        {"name": "Analyst", "analysis": {"overall_tone": "Measured"}},
+    ]).inserted_ids]
+    find = mocker.spy(db.styles, 'find')
+    search = mocker.patch('app.perform_brave_search', return_value=[{"title": "T", "description": "D"}])
+
+    def anthropic_side_effect(*args, **kwargs):
+        tone = "Bold" if "Bold" in kwargs['system'][0]['text'] else "Measured"
+        angle = "Hiring" if "angle: 'Hiring'" in kwargs['messages'][0]['content'] else "Pricing"
+        return _mock_message(f"{tone} take on {angle.lower()} for early stage teams", output_tokens=3)
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    res = client.post(url_for('generate_post_multi'), json={
+        "style_ids": style_ids + [style_ids[0]], # Repeated ids are generated once
+        "topic": "Startups",
+        "key_points": "- Point",
+        "subjects_or_angles": ["Hiring", "Pricing"],
+    })
+
+    assert res.status_code == 200
+    events = _parse_sse(res.get_data(as_text=True))
+    assert sorted((e["style_id"], e["angle"]) for name, e in events if name == "draft") == sorted(
+        (style_id, angle) for style_id in style_ids for angle in ("Hiring", "Pricing"))
+    assert [e["style_id"] for name, e in events if name == "style_done"].count(style_ids[0]) == 1
+    name, done = events[-1]
+    assert name == "done"
+    assert [r["style_name"] for r in done["results"]] == ["Founder", "Analyst"]
+    assert done["results"][1]["generated_posts"] == ["Measured take on hiring for early stage teams",
+                                                     "Measured take on pricing for early stage teams"]
+    assert done["usage"]["output_tokens"] == 12
+    assert mock_create.call_count == 4
+    assert search.call_count == 2 # One per distinct query, shared by both styles
+    assert find.call_count == 1 # One $in query for all styles
+
+
+def test_generate_post_multi_validates_styles(client, mocker):
+    import mongomock
+    mocker.patch('app.mongo.db', mongomock.MongoClient().db)
+    body = {"topic": "T", "key_points": "- P"}
+    assert client.post(url_for('generate_post_multi'), json=body).status_code == 400
+    assert client.post(url_for('generate_post_multi'), json={**body, "style_ids": ["bad-id"]}).status_code == 400
+    res = client.post(url_for('generate_post_multi'), json={**body, "style_ids": ["67f3917fd2cccab061470341"]})
+    assert res.status_code == 404
+    assert res.get_json()["missing_style_ids"] == ["67f3917fd2cccab061470341"]
+
+
+def test_add_style_posts_analyzes_only_new_posts_and_versions_the_style(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    old_posts = "\n---\n".join(f"Old post {i}: I think remote teams need rituals. #Remote" for i in range(5))
+    created = client.post(url_for('analyze_and_save_style'), json={"posts_text": old_posts, "mode": "fast"}).get_json()
+    style_id = created["style_id"]
+
+    delta = {"overall_tone": "Analytical", "style_name": "Delta"}
+    merged = {"overall_tone": "Analytical", "key_themes": ["Remote", "Hiring"], "style_name": "Merged"}
+    mock_create = mocker.patch('app.anthropic_client.messages.create',
+                               side_effect=[_mock_message(json.dumps(delta)), _mock_message(json.dumps(merged))])
+    new_posts = ["New post: we hired ten engineers this year! 🚀", "Old post 1: I think remote teams need rituals. #Remote"]
+
+    res = client.patch(url_for('add_style_posts', style_id=style_id), json={"posts": new_posts, "version": 1})
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["added"] == 1 and body["duplicates"] == 1 # The old post is recognized
+    assert body["version"] == 2 and body["post_count"] == 6
+    assert body["analysis"] == merged
+    analysis_prompt = mock_create.call_args_list[0].kwargs["messages"][0]["content"]
+    assert "New post" in analysis_prompt and "Old post" not in analysis_prompt # Only the delta is analyzed
+    merge_prompt = mock_create.call_args_list[1].kwargs["messages"][0]["content"]
+    assert 'posts="5"' in merge_prompt and 'posts="1"' in merge_prompt and '"posts": 6' in merge_prompt
+
+    style = db.styles.find_one({"_id": ObjectId(style_id)})
+    assert style["version"] == 2 and len(style["post_features"]) == 6
+    assert style["analysis_history"][0]["version"] == 1
+    assert style["analysis_history"][0]["analysis"] == created["analysis"]
+
+    # Nothing new: no Claude call, no new version; a stale version is rejected
+    again = client.patch(url_for('add_style_posts', style_id=style_id), json={"posts": new_posts})
+    assert again.get_json()["added"] == 0 and again.get_json()["version"] == 2
+    stale = client.patch(url_for('add_style_posts', style_id=style_id), json={"posts": ["Brand new post"], "version": 1})
+    assert stale.status_code == 409
+    assert mock_create.call_count == 2
+
+
+def test_add_style_posts_fast_mode_and_validation(client, mocker):
+    import mongomock
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mock_create = mocker.patch('app.anthropic_client.messages.create')
+    posts = "\n---\n".join(f"Post {i}: Quarterly results were strong across every region this year." for i in range(3))
+    style_id = client.post(url_for('analyze_and_save_style'), json={"posts_text": posts, "mode": "fast"}).get_json()["style_id"]
+
+    res = client.patch(url_for('add_style_posts', style_id=style_id),
+                       json={"posts_text": "I love this! 🚀🚀 DM me.\n---\nI shipped it! 🚀 DM me for details.", "mode": "fast"})
+
+    assert res.status_code == 200
+    assert res.get_json()["analysis"]["common_cta"] == "DM me"
+    assert db.styles.find_one({"_id": ObjectId(style_id)})["stylometry"]["posts"] == 5
+    mock_create.assert_not_called()
+
+    legacy_id = db.styles.insert_one({"name": "Legacy", "analysis": {"overall_tone": "Formal"}}).inserted_id
+    assert client.patch(url_for('add_style_posts', style_id=str(legacy_id)),
+                        json={"posts": ["A new post."], "mode": "fast"}).status_code == 400
+    assert client.patch(url_for('add_style_posts', style_id=style_id), json={}).status_code == 400
+    assert client.patch(url_for('add_style_posts', style_id=str(ObjectId())), json={"posts": ["x"]}).status_code == 404
+    assert client.patch(url_for('add_style_posts', style_id="bad-id"), json={"posts": ["x"]}).status_code == 400
+
+
+def test_style_post_features_are_deduplicated_and_bounded(app, client, mocker):
+    import mongomock
+    import app as app_module
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mocker.patch.dict(app.config, {"STYLE_MAX_STORED_POSTS": 4})
+    posts = [f"Post {i}: Quarterly results were strong across every region this year." for i in range(3)]
+    corpus = "\n---\n".join(posts + posts[:1]) # The first post pasted twice
+    created = client.post(url_for('analyze_and_save_style'), json={"posts_text": corpus, "mode": "fast"}).get_json()
+    style_id = created["style_id"]
+    style = db.styles.find_one({"_id": ObjectId(style_id)})
+    assert style["post_count"] == 3 and len(style["post_features"]) == 3
+
+    new_posts = [f"New post {i}: we shipped the release today." for i in range(3)]
+    res = client.patch(url_for('add_style_posts', style_id=style_id), json={"posts": new_posts, "mode": "fast"})
+
+    assert res.status_code == 200 and res.get_json()["post_count"] == 6
+    style = db.styles.find_one({"_id": ObjectId(style_id)})
+    assert len(style["post_features"]) == 4 # The newest posts only
+    assert [f["digest"] for f in style["post_features"]] == [app_module.post_digest(p) for p in posts[2:] + new_posts]
+    assert style["stylometry"]["posts"] == 4
+
+
+def _mock_style_db(mocker, style_id="67f3917fd2cccab061470338"):
+    mock_db = MagicMock()
+    mock_db.styles.find_one.return_value = {"_id": ObjectId(style_id), "name": "Pipeline", "analysis": {"overall_tone": "Calm"}}
+    mocker.patch('app.mongo.db', mock_db)
+    return style_id
+
+
+def test_generate_post_starts_fallback_searches_up_front(client, mocker):
+    style_id = _mock_style_db(mocker)
+    searched = []
+    mocker.patch('app.perform_brave_search', side_effect=lambda query, count=3: searched.append(query) or None)
+    searched_during_first_wave = []
+
+    def anthropic_side_effect(*args, **kwargs):
+        if "angle: 'A'" in kwargs['messages'][0]['content']:
+            time.sleep(0.1)
+            searched_during_first_wave.extend(searched)
+            raise RuntimeError("boom")
+        angle = kwargs['messages'][0]['content'].split("angle: '")[1].split("'")[0]
+        return _mock_message(f"Draft {angle}: " + " ".join(f"{angle}{i}" for i in range(10)))
+    mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": style_id, "topic": "T", "key_points": "- P", "subjects_or_angles": ["A", "B", "C", "D"]})
+
+    assert res.status_code == 200
+    assert len(res.get_json()["generated_posts"]) == 3 # D replaced A
+    assert "T D" in searched_during_first_wave # The fallback angle's search did not wait for the first wave
+
+
+def test_generate_post_bounds_speculative_searches(client, mocker):
+    style_id = _mock_style_db(mocker)
+    searched = []
+    mocker.patch('app.perform_brave_search', side_effect=lambda query, count=3: searched.append(query) or None)
+
+    def anthropic_side_effect(*args, **kwargs):
+        angle = kwargs['messages'][0]['content'].split("angle: '")[1].split("'")[0]
+        return _mock_message(f"Draft {angle}: " + " ".join(f"{angle}{i}" for i in range(10)))
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+    angles = [f"Angle{i}" for i in range(50)]
+
+    res = client.post(url_for('generate_post'), json={
+        "style_id": style_id, "topic": "T", "key_points": "- P", "subjects_or_angles": angles})
+    assert len(res.get_json()["generated_posts"]) == 3
+    assert sorted(searched) == ["T Angle0", "T Angle1", "T Angle2", "T Angle3"] # 3 drafts + 1 fallback
+
+    # Even if every angle fails, only GENERATION_MAX_ANGLES of them are tried
+    searched.clear()
+    mock_create.side_effect = RuntimeError("boom")
+    client.post(url_for('generate_post'), json={
+        "style_id": style_id, "topic": "T", "key_points": "- P", "subjects_or_angles": angles})
+    assert len(searched) == client.application.config["GENERATION_MAX_ANGLES"]
+
+
+def test_generate_post_proceeds_without_snippets_after_search_deadline(client, mocker):
+    style_id = _mock_style_db(mocker)
+    mocker.patch.dict(client.application.config, {"SEARCH_DEADLINE_SECONDS": 0.1})
+
+    def search(query, count=3):
+        if "Slow" in query:
+            time.sleep(0.5)
+        return [{"title": "Result", "description": f"Snippet for {query}"}]
+    mocker.patch('app.perform_brave_search', side_effect=search)
+    mock_create = mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message("A draft"))
+
+    start = time.monotonic()
+    res = client.post(url_for('generate_post'), json={
+        "style_id": style_id, "topic": "T", "key_points": "- P", "subjects_or_angles": ["Fast", "Slow"]})
+
+    assert res.status_code == 200
+    assert time.monotonic() - start < 0.45
+    prompts = {call.kwargs['messages'][0]['content'] for call in mock_create.call_args_list}
+    assert any("Snippet for T Fast" in prompt for prompt in prompts)
+    assert not any("Snippet for T Slow" in prompt for prompt in prompts)
+
+
+def test_streaming_leader_finishes_for_coalesced_followers_after_disconnect(client, mocker):
+    """A streamed angle whose client went away keeps generating while an identical request waits
+    on the same call, and aborts when nobody does."""
+    import threading
+    import app as app_module
+    mocker.patch('app.perform_brave_search', return_value=None)
+    first_delta, release = threading.Event(), threading.Event()
+
+    def text_stream():
+        yield "Draft "
+        first_delta.set()
+        release.wait(5)
+        yield "A"
+
+    def stream_side_effect(*args, **kwargs):
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = text_stream()
+        return stream
+    mock_stream = mocker.patch('app.anthropic_client.messages.stream', side_effect=stream_side_effect)
+    args = ({"overall_tone": "Dry"}, "Disconnect", "- Point", None, ["A"])
+
+    for follower_attached in (True, False):
+        first_delta.clear()
+        release.clear()
+        cancelled = threading.Event()
+        outcomes = {}
+        leader = threading.Thread(target=lambda: outcomes.update(leader=app_module.generate_drafts(
+            *args, on_delta=lambda i, text: None, cancel_event=cancelled)))
+        leader.start()
+        assert first_delta.wait(5)
+        cancelled.set() # The leader's client disconnects mid-stream
+        follower = None
+        if follower_attached:
+            coalesced = app_module.single_flight.stats()["coalesced"]
+            follower = threading.Thread(target=lambda: outcomes.update(follower=app_module.generate_drafts(*args)))
+            follower.start()
+            while app_module.single_flight.stats()["coalesced"] == coalesced:
+                time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        if follower:
+            follower.join(5)
+            assert outcomes["follower"][0] == ["Draft A"]
+        else:
+            assert outcomes["leader"][0] == []
+    assert mock_stream.call_count == 2 # One call per round: the follower never paid for its own
+
+
+def test_search_prefetch_warms_cache_and_coalesces_in_flight_searches(client, mocker):
+    from app import perform_brave_search, search_cache_key, search_cache, MISSING
+    mocker.patch.dict(client.application.config, {"BRAVE_SEARCH_API_KEY": "brave-test"})
+
+    def fetch(query, count=3):
+        time.sleep(0.2)
+        return [{"title": "Result", "description": query}]
+    mock_fetch = mocker.patch('app.fetch_brave_results', side_effect=fetch)
+
+    res = client.post(url_for('prefetch_searches'), json={"topic": "AI hiring", "subjects_or_angles": ["Bias", "Bias", "Cost"]})
+    assert res.status_code == 202
+    assert res.get_json()["queries"] == ["AI hiring Bias", "AI hiring Cost"]
+
+    # A generation arriving while the prefetch is in flight shares it instead of searching again
+    assert perform_brave_search("AI hiring Bias", count=3) == [{"title": "Result", "description": "AI hiring Bias"}]
+    for _ in range(50):
+        if search_cache.memory.get(search_cache_key("AI hiring Cost", 3)) is not MISSING:
+            break
+        time.sleep(0.02)
+    assert perform_brave_search("AI hiring Cost", count=3)
+    assert mock_fetch.call_count == 2
+
+    assert client.post(url_for('prefetch_searches'), json={"topic": "AI"}).status_code == 400
+    mocker.patch.dict(client.application.config, {"BRAVE_SEARCH_API_KEY": None})
+    assert client.post(url_for('prefetch_searches'), json={"topic": "AI hiring"}).get_json()["queries"] == []
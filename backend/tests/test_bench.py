@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+import httpx
+
+from bench.fake_servers import FakeAnthropic, FakeBrave
+from bench.run import percentile
+
+
+def test_percentile_interpolates():
+    values = [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert percentile(values, 50) == 0.3
+    assert abs(percentile(values, 95) - 0.48) < 1e-9
+    assert percentile([], 99) == 0.0
+
+
+def test_fake_anthropic_speaks_messages_api_and_reports_cache_reads():
+    with FakeAnthropic(latency=0, tokens_per_second=1e9, output_tokens=40) as fake:
+        client = anthropic.Anthropic(api_key="sk-test", base_url=fake.url, max_retries=0)
+        system = [{"type": "text", "text": "Style prefix " * 400, "cache_control": {"type": "ephemeral"}}]
+        short_system = [{"type": "text", "text": "Style prefix " * 50, "cache_control": {"type": "ephemeral"}}]
+
+        first = client.messages.create(model="m", max_tokens=100, system=system,
+                                       messages=[{"role": "user", "content": "Angle one"}])
+        second = client.messages.create(model="m", max_tokens=100, system=system,
+                                        messages=[{"role": "user", "content": "Angle two"}])
+        analysis = client.messages.create(model="m", max_tokens=100,
+                                          messages=[{"role": "user", "content": "Analyze these posts"}])
+        short = [client.messages.create(model="m", max_tokens=100, system=short_system,
+                                        messages=[{"role": "user", "content": "Angle"}]) for _ in range(2)]
+
+    assert first.usage.cache_creation_input_tokens > 0 and first.usage.cache_read_input_tokens == 0
+    assert second.usage.cache_read_input_tokens == first.usage.cache_creation_input_tokens
+    assert first.usage.output_tokens == 40
+    assert analysis.content[0].text.startswith("{")
+    assert fake.requests == 5
+    # Below the minimum cacheable length the prefix is billed as plain input, every time
+    assert [s.usage.cache_creation_input_tokens + s.usage.cache_read_input_tokens for s in short] == [0, 0]
+    assert short[1].usage.input_tokens > 150
+
+
+def test_fake_anthropic_caches_prefix_only_after_a_response_starts():
+    system = [{"type": "text", "text": "Style prefix " * 400, "cache_control": {"type": "ephemeral"}}]
+    with FakeAnthropic(latency=0.2, tokens_per_second=1e9, output_tokens=40) as fake:
+        client = anthropic.Anthropic(api_key="sk-test", base_url=fake.url, max_retries=0)
+
+        def generate(angle):
+            return client.messages.create(model="m", max_tokens=100, system=system,
+                                          messages=[{"role": "user", "content": angle}])
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            concurrent = list(pool.map(generate, ["Angle one", "Angle two"]))
+        with client.messages.stream(model="m", max_tokens=100, system=system,
+                                    messages=[{"role": "user", "content": "Angle three"}]) as stream:
+            streamed_text = "".join(stream.text_stream)
+            later = stream.get_final_message()
+
+    # Both arrived before either produced a token, so both pay for the cache write
+    assert [r.usage.cache_read_input_tokens for r in concurrent] == [0, 0]
+    assert all(r.usage.cache_creation_input_tokens > 0 for r in concurrent)
+    assert later.usage.cache_read_input_tokens == concurrent[0].usage.cache_creation_input_tokens
+    assert streamed_text == later.content[0].text == concurrent[0].content[0].text
+    assert fake.usage["cache_read_input_tokens"] == later.usage.cache_read_input_tokens
+
+
+def test_fake_brave_returns_requested_count():
+    with FakeBrave(latency=0) as fake:
+        data = httpx.get(fake.search_url, params={"q": "release cadence", "count": 2}).json()
+    assert [r["title"] for r in data["web"]["results"]] == ["Result 1 for release cadence", "Result 2 for release cadence"]
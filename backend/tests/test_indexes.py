@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock
+
+import mongomock
+
+import indexes
+
+
+def test_ensure_indexes_is_idempotent():
+    db = mongomock.MongoClient().db
+
+    first = indexes.ensure_indexes(db)
+    second = indexes.ensure_indexes(db)
+
+    assert {e["status"] for e in first} == {"created"}
+    assert {e["status"] for e in second} == {"exists"}
+    assert "created_at_id" in db.drafts.index_information()
+    assert db.analysis_cache.index_information()["expires_at_1"]["expireAfterSeconds"] == 0
+
+
+def test_ensure_indexes_reports_conflicting_definition():
+    db = mongomock.MongoClient().db
+    db.styles.create_index([("name", 1)], name="created_at") # Same name, different key
+
+    report = indexes.ensure_indexes(db)
+
+    conflict = next(e for e in report if e["collection"] == "styles" and e["index"] == "created_at")
+    assert conflict["status"] == "conflict"
+
+
+def _db_with_plan(winning_plan):
+    db = MagicMock()
+    cursor = db.__getitem__.return_value.find.return_value
+    cursor.sort.return_value = cursor
+    cursor.explain.return_value = {"queryPlanner": {"winningPlan": winning_plan}}
+    return db
+
+
+def test_check_query_plans_flags_scans_and_memory_sorts():
+    db = _db_with_plan({"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}})
+    warnings = indexes.check_query_plans(db, checks=[("drafts", {}, [("created_at", -1)])])
+    assert len(warnings) == 2
+    assert "collection scan" in warnings[0]
+    assert "in-memory sort" in warnings[1]
+
+
+def test_check_query_plans_accepts_index_scans():
+    db = _db_with_plan({"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}})
+    assert indexes.check_query_plans(db, checks=[("drafts", {}, [("created_at", -1)])]) == []
+
+
+def test_text_index_as_reported_by_the_server_matches_its_spec():
+    spec = next(m.document for m in indexes.INDEX_SPECS["drafts"] if m.document["name"] == "draft_text_topic_text")
+    server_form = {"key": {"_fts": "text", "_ftsx": 1}, "weights": {"draft_text": 1, "topic": 3},
+                   "default_language": "english", "textIndexVersion": 3}
+    assert indexes._index_options(spec) == indexes._index_options(server_form)
@@ -0,0 +1,100 @@
+import io
+import json
+from unittest.mock import MagicMock
+
+import mongomock
+import pytest
+from flask import url_for
+
+from ingest import (IngestError, iter_ndjson_posts, iter_post_chunks, iter_stream_lines,
+                    iter_text_posts)
+
+
+def test_iter_stream_lines_reads_incrementally():
+    stream = io.BytesIO(b"first\nsecond\nlast")
+    assert list(iter_stream_lines(stream)) == ["first\n", "second\n", "last"]
+
+
+def test_iter_stream_lines_rejects_huge_lines():
+    with pytest.raises(IngestError):
+        list(iter_stream_lines(io.BytesIO(b"x" * 100), max_line_bytes=10))
+
+
+def test_iter_ndjson_posts_accepts_strings_and_objects():
+    lines = ['"plain post"\n', '{"post": "object post"}\n', '\n', '{"text": "text field"}\n']
+    assert list(iter_ndjson_posts(lines)) == ["plain post", "object post", "text field"]
+
+
+def test_iter_ndjson_posts_reports_bad_lines():
+    with pytest.raises(IngestError, match="line 2"):
+        list(iter_ndjson_posts(['"ok"\n', '{broken\n']))
+
+
+def test_iter_text_posts_splits_on_separators_and_keeps_paragraphs():
+    lines = ["Post one\n", "\n", "still post one\n", "---\n", "Post two\n"]
+    assert list(iter_text_posts(lines, max_post_chars=1000)) == ["Post one\n\nstill post one", "Post two"]
+
+
+def test_iter_text_posts_bounds_posts_without_separators():
+    lines = [f"Paragraph {i} text.\n\n" for i in range(50)]
+    posts = list(iter_text_posts(lines, max_post_chars=100))
+    assert len(posts) > 1
+    assert all(len(post) <= 100 for post in posts)
+
+
+def test_iter_post_chunks_respects_chunk_size():
+    posts = [f"post {i} " * 5 for i in range(20)]
+    chunks = list(iter_post_chunks(iter(posts), max_chunk_chars=120))
+    assert sum(count for _, count in chunks) == 20
+    assert all(len(text) <= 120 for text, _ in chunks)
+
+
+def _mock_message(text):
+    mock_message = MagicMock()
+    mock_message.content = [MagicMock(text=text)]
+    return mock_message
+
+
+def test_ingest_endpoint_maps_chunks_and_merges(app, client, mocker):
+    """Each chunk gets a partial analysis, then one merge call produces the saved profile."""
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mocker.patch.dict(app.config, {"INGEST_CHUNK_CHARS": 300})
+
+    def anthropic_side_effect(*args, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        if "partial analyses" in prompt:
+            return _mock_message(json.dumps({"overall_tone": "Merged", "style_name": "Merged Style"}))
+        return _mock_message(json.dumps({"overall_tone": "Partial", "style_name": "Partial"}))
+    mock_create = mocker.patch('app.anthropic_client.messages.create', side_effect=anthropic_side_effect)
+
+    body = "".join(json.dumps({"post": f"Post number {i}. " * 8}) + "\n" for i in range(10))
+    res = client.post(url_for('ingest_and_analyze_style'), data=body, content_type='application/x-ndjson')
+
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data["posts_analyzed"] == 10
+    assert data["chunks"] > 1
+    assert data["style_name"] == "Merged Style"
+    assert mock_create.call_count == data["chunks"] + 1 # map calls + one merge
+    saved = db.styles.find_one()
+    assert saved["source"] == {"posts": 10, "chunks": data["chunks"]}
+
+
+def test_ingest_endpoint_rejects_tiny_upload(client):
+    res = client.post(url_for('ingest_and_analyze_style'), data="too short", content_type='text/plain')
+    assert res.status_code == 400
+
+
+def test_ingest_endpoint_rejects_oversized_corpus_before_any_llm_call(app, client, mocker):
+    mock_create = mocker.patch('app.anthropic_client.messages.create')
+    mocker.patch.dict(app.config, {"INGEST_CHUNK_CHARS": 300, "INGEST_MAX_CHUNKS": 2})
+    body = "".join(json.dumps({"post": f"Post number {i}. " * 8}) + "\n" for i in range(10))
+
+    res = client.post(url_for('ingest_and_analyze_style'), data=body, content_type='application/x-ndjson')
+    assert res.status_code == 413
+    mock_create.assert_not_called()
+
+    mocker.patch.dict(app.config, {"INGEST_MAX_BYTES": 100})
+    res = client.post(url_for('ingest_and_analyze_style'), data=body, content_type='application/x-ndjson')
+    assert res.status_code == 413 and "bytes" in res.get_json()["error"]
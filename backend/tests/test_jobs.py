@@ -0,0 +1,132 @@
+import json
+import time
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import mongomock
+import pytest
+from flask import url_for
+
+from jobs import JobQueue, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED
+
+
+@pytest.fixture
+def jobs_collection():
+    return mongomock.MongoClient().db.jobs
+
+
+@pytest.fixture
+def queue(jobs_collection):
+    job_queue = JobQueue(lambda: jobs_collection, max_workers=2, lease_seconds=60, recovery_interval=0)
+    yield job_queue
+    job_queue.shutdown(wait=True)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("Timed out waiting for condition")
+
+
+def test_submitted_job_runs_and_stores_result(queue, jobs_collection):
+    queue.register("echo", lambda payload: ({"echo": payload["value"]}, 200))
+    job_id = queue.submit("echo", {"value": 42})
+
+    job = _wait_for(lambda: (j := queue.get(job_id)) and j["status"] == JOB_SUCCEEDED and j)
+    assert job["result"] == {"echo": 42}
+    assert job["http_status"] == 200
+    assert job["attempts"] == 1
+
+
+def test_error_status_marks_job_failed(queue):
+    queue.register("bad", lambda payload: ({"error": "Nope"}, 400))
+    job_id = queue.submit("bad", {})
+
+    job = _wait_for(lambda: (j := queue.get(job_id)) and j["status"] == JOB_FAILED and j)
+    assert job["error"] == "Nope"
+    assert job["http_status"] == 400
+
+
+def test_unknown_job_type_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.submit("nope", {})
+
+
+def test_recover_reruns_queued_and_expired_jobs(queue, jobs_collection):
+    """Jobs left behind by a dead process are picked up again on start."""
+    queue.register("echo", lambda payload: ({"echo": payload["value"]}, 200))
+    now = datetime.utcnow()
+    queued_id = jobs_collection.insert_one(
+        {"type": "echo", "payload": {"value": 1}, "status": JOB_QUEUED, "attempts": 0, "created_at": now}
+    ).inserted_id
+    stale_id = jobs_collection.insert_one(
+        {"type": "echo", "payload": {"value": 2}, "status": JOB_RUNNING, "attempts": 1, "created_at": now,
+         "lease_expires_at": now - timedelta(seconds=1)}
+    ).inserted_id
+    live_id = jobs_collection.insert_one(
+        {"type": "echo", "payload": {"value": 3}, "status": JOB_RUNNING, "attempts": 1, "created_at": now,
+         "lease_expires_at": now + timedelta(minutes=5)}
+    ).inserted_id
+    exhausted_id = jobs_collection.insert_one(
+        {"type": "echo", "payload": {"value": 4}, "status": JOB_RUNNING, "attempts": 3, "created_at": now,
+         "lease_expires_at": now - timedelta(seconds=1)}
+    ).inserted_id
+
+    queue.start()
+
+    for job_id in (queued_id, stale_id):
+        _wait_for(lambda: queue.get(str(job_id))["status"] == JOB_SUCCEEDED)
+    assert queue.get(str(live_id))["status"] == JOB_RUNNING # Still leased by another worker
+    assert queue.get(str(exhausted_id))["status"] == JOB_FAILED
+
+
+def test_get_with_malformed_id_returns_none(queue):
+    assert queue.get("not-an-object-id") is None
+
+
+def _mock_message(text):
+    mock_message = MagicMock()
+    mock_message.content = [MagicMock(text=text)]
+    return mock_message
+
+
+def test_analyze_style_respond_async_returns_job(client, mocker):
+    """With 'Prefer: respond-async' the endpoint returns 202 + job id and the job carries the result."""
+    db = mongomock.MongoClient().db
+    mocker.patch('app.mongo.db', db)
+    mocker.patch('app.anthropic_client.messages.create', return_value=_mock_message(json.dumps(
+        {"overall_tone": "Async", "style_name": "Async Style"}
+    )))
+
+    res = client.post(url_for('analyze_and_save_style'), json={"posts_text": "Queued post text. " * 10},
+                      headers={"Prefer": "respond-async"})
+    assert res.status_code == 202
+    job_id = res.get_json()["job_id"]
+    assert res.get_json()["status_url"] == url_for('get_job', job_id=job_id)
+
+    job = _wait_for(lambda: (j := client.get(url_for('get_job', job_id=job_id)).get_json())["status"] == JOB_SUCCEEDED and j)
+    assert job["result"]["style_name"] == "Async Style"
+    assert job["http_status"] == 200
+    assert db.styles.count_documents({}) == 1
+
+    events = client.get(url_for('job_events', job_id=job_id)).get_data(as_text=True)
+    assert "event: done" in events
+
+
+def test_create_job_validates_payload(client, mocker):
+    mocker.patch('app.mongo.db', mongomock.MongoClient().db)
+    res = client.post(url_for('create_job'), json={"type": "generate-post", "payload": {"topic": "x"}})
+    assert res.status_code == 400
+    res = client.post(url_for('create_job'), json={"type": "unknown"})
+    assert res.status_code == 400
+
+
+def test_get_unknown_job_returns_404(client, mocker):
+    mocker.patch('app.mongo.db', mongomock.MongoClient().db)
+    start = mocker.patch('app.job_queue.start')
+    assert client.get(url_for('get_job', job_id="67f3917fd2cccab061470337")).status_code == 404
+    start.assert_not_called() # Polling is read-only
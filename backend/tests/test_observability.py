@@ -0,0 +1,34 @@
+import json
+import logging
+
+import pytest
+
+from observability import JsonFormatter, REGISTRY, timed
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_timed_records_duration_and_errors():
+    labels = {"stage": "test_stage"}
+    before_count = _sample("linkedin_generator_stage_duration_seconds_count", labels)
+    before_errors = _sample("linkedin_generator_stage_errors_total", labels)
+
+    with timed("test_stage"):
+        pass
+    with pytest.raises(RuntimeError):
+        with timed("test_stage"):
+            raise RuntimeError("boom")
+
+    assert _sample("linkedin_generator_stage_duration_seconds_count", labels) == before_count + 2
+    assert _sample("linkedin_generator_stage_errors_total", labels) == before_errors + 1
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord({"name": "app", "levelname": "INFO", "msg": "GET %s", "args": ("/x",),
+                                    "status": 200})
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "GET /x"
+    assert entry["level"] == "INFO"
+    assert entry["status"] == 200
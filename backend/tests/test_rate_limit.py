@@ -0,0 +1,146 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rate_limit import (AnthropicGovernor, GovernorTimeout, TokenBucket, PRIORITY_BATCH, PRIORITY_INTERACTIVE,
+                        estimate_input_tokens)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after})
+
+
+class Overloaded(Exception):
+    status_code = 503
+
+
+def _usage(input_tokens, output_tokens):
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens, cache_creation_input_tokens=0)
+
+
+def test_token_bucket_refills_per_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.take(60, clock.now)
+    assert bucket.wait_time(1, clock.now) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.wait_time(30, clock.now) == 0
+    assert bucket.wait_time(31, clock.now) == pytest.approx(1.0)
+    assert TokenBucket(0, clock).wait_time(10 ** 9, clock.now) == 0 # 0 = unlimited
+
+
+def test_headers_adapt_limits_and_remaining_capacity():
+    clock = FakeClock()
+    governor = AnthropicGovernor(requests_per_minute=50, output_tokens_per_minute=8000, clock=clock)
+    governor.observe_headers({
+        "anthropic-ratelimit-requests-limit": "1000",
+        "anthropic-ratelimit-requests-remaining": "999",
+        "anthropic-ratelimit-output-tokens-limit": "80000",
+        "anthropic-ratelimit-output-tokens-remaining": "0",
+    })
+    buckets = governor.stats()["buckets"]
+    assert buckets["requests"]["limit"] == 1000
+    assert buckets["output_tokens"] == {"limit": 80000, "available": 0}
+    with pytest.raises(GovernorTimeout):
+        governor.acquire(10, 100, timeout=0) # Out of output tokens until they refill
+
+
+def test_settle_refunds_unused_output_tokens():
+    clock = FakeClock()
+    governor = AnthropicGovernor(output_tokens_per_minute=2000, clock=clock)
+    reservation = governor.acquire(10, 1500)
+    assert governor.stats()["buckets"]["output_tokens"]["available"] == 500
+    governor.settle(reservation, _usage(10, 300))
+    assert governor.stats()["buckets"]["output_tokens"]["available"] == 1700
+
+
+def test_interactive_calls_are_admitted_before_waiting_batch_calls():
+    governor = AnthropicGovernor()
+    governor.pause(0.2)
+    admitted = []
+
+    def call(name, priority):
+        governor.acquire(10, 10, priority)
+        admitted.append(name)
+
+    batch = threading.Thread(target=call, args=("batch", PRIORITY_BATCH))
+    batch.start()
+    time.sleep(0.05) # The batch call is queued first
+    interactive = threading.Thread(target=call, args=("interactive", PRIORITY_INTERACTIVE))
+    interactive.start()
+    batch.join(2)
+    interactive.join(2)
+    assert admitted == ["interactive", "batch"]
+
+
+def test_call_waits_out_retry_after_instead_of_failing():
+    governor = AnthropicGovernor(max_retries=2)
+    responses = [RateLimited("0.05"), SimpleNamespace(usage=_usage(10, 20))]
+
+    def send(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    start = time.monotonic()
+    message = governor.call(send, {"max_tokens": 100, "messages": [{"role": "user", "content": "Hi"}]})
+    assert message.usage.output_tokens == 20
+    assert time.monotonic() - start >= 0.05
+
+
+def test_call_gives_up_after_max_retries():
+    governor = AnthropicGovernor(max_retries=1)
+
+    def send(**kwargs):
+        raise RateLimited("0")
+
+    with pytest.raises(RateLimited):
+        governor.call(send, {"max_tokens": 100, "messages": []})
+
+
+def test_estimate_input_tokens_counts_system_blocks_and_messages():
+    request_kwargs = {
+        "system": [{"type": "text", "text": "x" * 400}],
+        "messages": [{"role": "user", "content": "y" * 400}],
+    }
+    assert estimate_input_tokens(request_kwargs) == 200
+
+
+def test_call_retries_transient_errors_without_pausing_other_calls():
+    governor = AnthropicGovernor(max_retries=2, backoff_base=0.01)
+    responses = [Overloaded(), Overloaded(), SimpleNamespace(usage=_usage(10, 20))]
+
+    def send(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    message = governor.call(send, {"max_tokens": 100, "messages": [{"role": "user", "content": "Hi"}]})
+    assert message.usage.output_tokens == 20
+    assert governor.stats()["paused_seconds"] == 0
+
+    calls = []
+
+    def bad_request(**kwargs):
+        calls.append(kwargs)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        governor.call(bad_request, {"max_tokens": 1, "messages": []})
+    assert len(calls) == 1 # Not transient: raised at once
@@ -0,0 +1,93 @@
+import httpx
+import pytest
+
+from search_client import BraveSearchClient, CircuitBreaker, CircuitOpenError, SearchError, SearchRequestError
+
+
+def _client(handler, **kwargs):
+    """BraveSearchClient wired to an in-memory transport, with no real backoff sleeps."""
+    kwargs.setdefault("backoff_base", 0)
+    return BraveSearchClient(api_key="test-key", transport=httpx.MockTransport(handler), **kwargs)
+
+
+def _ok(results):
+    return httpx.Response(200, json={"web": {"results": results}})
+
+
+def test_search_returns_simplified_results():
+    """Results are reduced to title/description and the subscription token is sent."""
+    seen = {}
+
+    def handler(request):
+        seen["token"] = request.headers["X-Subscription-Token"]
+        seen["params"] = dict(request.url.params)
+        return _ok([
+            {"title": "A", "description": "Desc A", "url": "https://a"},
+            {"title": "No description"},
+        ])
+
+    client = _client(handler)
+    assert client.search("ai news", count=2) == [{"title": "A", "description": "Desc A"}]
+    assert seen == {"token": "test-key", "params": {"q": "ai news", "count": "2"}}
+
+
+def test_search_retries_429_and_5xx():
+    """Transient statuses are retried until a success, within max_retries."""
+    responses = iter([httpx.Response(429, headers={"retry-after": "0"}), httpx.Response(503), _ok([])])
+    client = _client(lambda request: next(responses), max_retries=2)
+    assert client.search("retry me") == []
+
+
+def test_search_gives_up_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    client = _client(handler, max_retries=2)
+    with pytest.raises(SearchError):
+        client.search("always failing")
+    assert len(calls) == 3 # First attempt + 2 retries
+
+
+def test_search_does_not_retry_client_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(401)
+
+    client = _client(handler, max_retries=2)
+    with pytest.raises(SearchRequestError):
+        client.search("bad key")
+    assert len(calls) == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_opens_after_repeated_failures_and_fails_fast():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("down")
+
+    client = _client(handler, max_retries=0, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(SearchError):
+            client.search("degraded")
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        client.search("degraded")
+    assert len(calls) == 2 # The third search never reached Brave
+
+
+def test_circuit_half_open_trial_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request() is True
+    assert breaker.allow_request() is False # Only one trial call at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
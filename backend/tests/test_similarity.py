@@ -0,0 +1,36 @@
+import similarity
+
+POST = ("AI is changing how we hire engineers. Here are three lessons from scaling our team to fifty "
+        "people in a year. First, write down the bar. Second, move fast on offers. Third, onboarding is "
+        "part of hiring.")
+
+
+def test_signature_is_stable_across_processes():
+    """Signatures are stored in MongoDB; a hashing change would silently break duplicate lookups."""
+    sig = similarity.signature("hello world")
+    assert sig[:2] == [1588692378940045353, 765619688508881164]
+    assert similarity.band_keys(sig)[0] == 41580228414090981
+    assert all(0 <= key < 2 ** 63 for key in similarity.band_keys(similarity.signature(POST))) # Fits a BSON int64
+
+
+def test_near_identical_drafts_are_similar_and_share_bands():
+    edited = POST.replace("fifty", "sixty").replace("Third", "Finally")
+    unrelated = "Remote work is here to stay and managers need new rituals to keep distributed teams connected."
+
+    sig, edited_sig, unrelated_sig = (similarity.signature(t) for t in (POST, edited, unrelated))
+
+    assert similarity.similarity(sig, similarity.signature(POST.upper() + "!!")) == 1.0 # Case and punctuation ignored
+    assert similarity.similarity(sig, edited_sig) >= 0.5
+    assert similarity.similarity(sig, unrelated_sig) < 0.2
+    assert set(similarity.band_keys(sig)) & set(similarity.band_keys(edited_sig))
+
+
+def test_near_duplicates_filters_and_orders_by_similarity():
+    sig = similarity.signature(POST)
+    candidates = [
+        ("unrelated", similarity.signature("Quarterly results were strong across every region this year.")),
+        ("edited", similarity.signature(POST.replace("fifty", "sixty"))),
+        ("same", similarity.signature(POST)),
+    ]
+    assert [match_id for match_id, _ in similarity.near_duplicates(sig, candidates, 0.5)] == ["same", "edited"]
+    assert similarity.signature("") == [0] * similarity.NUM_PERM
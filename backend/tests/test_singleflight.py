@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from singleflight import LEASE_RUNNING, MongoLease, SingleFlight
+
+
+def _slow_counter(result="result", delay=0.2):
+    calls = []
+
+    def fn():
+        calls.append(threading.current_thread().name)
+        time.sleep(delay)
+        return result
+    return fn, calls
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    fn, calls = _slow_counter()
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        outcomes = list(executor.map(lambda _: flight.do("key", fn), range(5)))
+
+    assert len(calls) == 1
+    assert [result for result, _ in outcomes] == ["result"] * 5
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True, True]
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+    flight.do("key", fn) # Finished calls are not reused
+    assert len(calls) == 2
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", failing)
+        started.wait(1)
+        follower = executor.submit(flight.do, "key", failing)
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+
+def test_mongo_lease_coalesces_across_processes():
+    collection = mongomock.MongoClient().db.single_flight
+    # Two SingleFlight instances stand in for two worker processes
+    first, second = (SingleFlight(MongoLease(lambda: collection, poll_interval=0.01)) for _ in range(2))
+    fn, calls = _slow_counter({"style_name": "Shared"})
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(first.do, "key", fn)
+        time.sleep(0.05)
+        follower = executor.submit(second.do, "key", fn)
+        assert leader.result() == ({"style_name": "Shared"}, False)
+        assert follower.result() == ({"style_name": "Shared"}, True)
+    assert len(calls) == 1
+
+    assert second.do("key", fn) == ({"style_name": "Shared"}, False) # A finished lease is taken over, not reused
+    assert len(calls) == 2
+
+
+def test_mongo_lease_takes_over_from_a_dead_owner():
+    collection = mongomock.MongoClient().db.single_flight
+    collection.insert_one({"_id": "key", "status": LEASE_RUNNING, "owner": "dead",
+                           "expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    lease = MongoLease(lambda: collection, poll_interval=0.01)
+
+    assert lease.run("key", lambda: 42) == (42, False)
+    assert collection.find_one({"_id": "key"})["result"] == 42
+
+
+def test_waiting_counts_callers_attached_to_an_in_flight_call():
+    flight = SingleFlight()
+    fn, calls = _slow_counter(delay=0.3)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(flight.do, "key", fn)]
+        time.sleep(0.05)
+        assert flight.waiting("key") == 0
+        futures += [executor.submit(flight.do, "key", fn) for _ in range(2)]
+        time.sleep(0.05)
+        assert flight.waiting("key") == 2
+        [future.result() for future in futures]
+
+    assert flight.waiting("key") == 0 and len(calls) == 1
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy modules that must only be imported when a request first needs them
+LAZY_MODULES = ("anthropic", "httpx")
+
+
+def _run(code, **env_overrides):
+    env = {k: v for k, v in os.environ.items() if k not in ("MONGO_URI", "ANTHROPIC_API_KEY")}
+    env.update(env_overrides)
+    return subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+
+
+def test_import_is_cheap_and_needs_no_settings():
+    """Importing the app must not require settings, create clients or import the heavy SDKs."""
+    result = _run(
+        "import sys, app\n"
+        f"print(sorted(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+        "print(app.anthropic_holder.created, app.brave_holder.created, app.mongo.created)"
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["[]", "False False False"]
+
+
+def test_create_app_checks_required_settings():
+    result = _run("import app; app.create_app()")
+    assert result.returncode != 0
+    assert "No MONGO_URI, ANTHROPIC_API_KEY set" in result.stderr
+
+    result = _run("import app; app.create_app({'MONGO_URI': 'mongodb://localhost:27017/x', 'ANTHROPIC_API_KEY': 'sk-test'})")
+    assert result.returncode == 0, result.stderr
+
+
+def test_dev_factory_starts_services_only_in_the_serving_process():
+    """flask --app 'app:create_app(start_services=True)' run starts the background services, except
+    in the debug reloader's parent process, which never serves requests."""
+    code = (
+        "import app\n"
+        "app.start_background_services = lambda: print('started')\n"
+        "app.app.debug = {debug}\n"
+        "app.create_app({{'MONGO_URI': 'mongodb://localhost:27017/x', 'ANTHROPIC_API_KEY': 'sk-test'}}, start_services=True)"
+    )
+    assert _run(code.format(debug=False)).stdout.strip() == "started"
+    assert _run(code.format(debug=True)).stdout.strip() == ""
+    assert _run(code.format(debug=True), WERKZEUG_RUN_MAIN="true").stdout.strip() == "started"
+
+
+def test_create_app_settings_reach_objects_built_at_import():
+    """Cache sizes, single-flight leases and job workers passed to create_app are applied."""
+    result = _run(
+        "import app\n"
+        "app.create_app({'MONGO_URI': 'mongodb://localhost:27017/x', 'ANTHROPIC_API_KEY': 'sk-test',\n"
+        "                'ANALYSIS_CACHE_MAX_ENTRIES': 7, 'SEARCH_CACHE_MONGO': False, 'STYLE_CACHE_TTL_SECONDS': 9,\n"
+        "                'SINGLE_FLIGHT_MONGO': True, 'JOB_WORKERS': 2})\n"
+        "print(app.analysis_cache.memory.max_entries, app.search_cache.mongo, app.style_cache.memory.ttl,\n"
+        "      type(app.single_flight.lease).__name__, app.job_queue.max_workers)",
+        SEARCH_CACHE_MONGO="true", SINGLE_FLIGHT_MONGO="false",
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["7", "None", "9", "MongoLease", "2"]
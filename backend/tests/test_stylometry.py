@@ -0,0 +1,67 @@
+import stylometry
+
+CORPUS = """I shipped our new AI feature today! 🚀 Here is what I learned.
+
+Small teams move fast. Write it down. Ship it.
+
+What do you think? Link in comments 👇 #AI #Startups
+---
+I hired five engineers this quarter. Hiring is a product, and the best candidates notice every detail of the process you put them through. 💡
+Link in the comments. #Hiring #AI
+"""
+
+
+def test_corpus_features_measure_emoji_sentences_keywords_cta_and_perspective():
+    features = stylometry.corpus_features(CORPUS)
+
+    assert features["posts"] == 2
+    assert set(features["emoji"]["top"]) == {"🚀", "👇", "💡"}
+    assert features["emoji"]["posts_with_emoji"] == 1.0
+    assert features["sentences"]["median_words"] <= 8
+    assert features["sentences"]["count"] == 11
+    assert features["hashtags"][0] == "#ai" # Used in both posts
+    assert "hiring" in features["keywords"] and "the" not in features["keywords"]
+    assert features["cta"]["Link in comments"] == 1.0
+    assert features["perspective"]["label"] == "First-person (I)"
+
+
+def test_summarize_merges_per_post_features():
+    posts = stylometry.split_posts(CORPUS)
+    per_post = [stylometry.post_features(post) for post in posts]
+
+    assert stylometry.summarize(per_post) == stylometry.corpus_features(CORPUS)
+    assert stylometry.summarize(per_post[:1])["posts"] == 1
+
+
+def test_perspective_label():
+    assert stylometry.corpus_features("She built the company. Her team loved it. They grew fast.")["perspective"]["label"] == "Third-person"
+    assert stylometry.corpus_features("Quarterly results were strong.")["perspective"]["label"] == "Impersonal"
+
+
+def test_local_profile_has_the_analysis_keys():
+    profile = stylometry.local_profile(stylometry.corpus_features(CORPUS))
+
+    assert set(profile) == {"overall_tone", "key_themes", "common_keywords", "sentence_structure", "emoji_usage",
+                            "common_cta", "perspective", "style_name"}
+    assert profile["key_themes"][0] == "AI"
+    assert profile["common_cta"] == "Link in comments"
+    assert profile["emoji_usage"].startswith("frequent")
+    assert profile["sentence_structure"].startswith("short and punchy")
+
+
+def test_sample_posts_spreads_over_the_corpus_within_budget():
+    posts = [f"post {i:02d} " + "x" * 90 for i in range(20)] # 100 chars each
+
+    sample = stylometry.sample_posts(posts, 500)
+    assert len(sample) == 5 and sum(map(len, sample)) <= 500
+    assert sample[0] == posts[0] and sample[-1].startswith("post 16")
+    assert stylometry.sample_posts(posts, 0) == posts
+    assert stylometry.sample_posts(["a" * 600], 400) == ["a" * 600] # A single post is never cut
+    assert stylometry.sample_posts(["a" * 600, "b" * 600], 400) == ["a" * 600]
+
+
+def test_unseparated_corpus_is_split_into_paragraphs():
+    corpus = "First post, short.\n\nSecond post! 🚀\n\n\nThird post? #AI"
+    assert not stylometry.has_post_separators(corpus)
+    assert stylometry.split_posts(corpus) == ["First post, short.", "Second post! 🚀", "Third post? #AI"]
+    assert stylometry.has_post_separators("One\n---\nTwo")
@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py starts and stops the per-process background services (job workers, style
+cache change stream). Other WSGI servers should call app.start_background_services() once per
+process after it has started, and app.stop_background_services() on shutdown.
+"""
+from app import create_app
+
+app = create_app()
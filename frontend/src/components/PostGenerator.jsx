@@ -10,6 +10,8 @@ function PostGenerator() {
     const [cta, setCta] = useState('');
     const [subjects, setSubjects] = useState(''); // New state for subjects/angles input
     const [generatedPosts, setGeneratedPosts] = useState([]);
+    const [streamingDrafts, setStreamingDrafts] = useState({}); // In-progress drafts keyed by angle index
+    const [duplicates, setDuplicates] = useState([]); // {angle, replaced} for drafts found to be near-duplicates
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState('');
     const [isFetchingStyles, setIsFetchingStyles] = useState(false);
@@ -49,10 +51,29 @@ function PostGenerator() {
         fetchStyles();
     }, [fetchStyles]); // Use the memoized fetchStyles
 
+    // Prefetch web searches once the user pauses typing, so generation finds the snippets ready
+    useEffect(() => {
+        if (topic.trim().length < 3) return;
+        const timer = setTimeout(() => {
+            const payload = { topic: topic };
+            if (subjects.trim()) {
+                payload.subjects_or_angles = subjects.split('\n').map(s => s.trim()).filter(s => s);
+            }
+            fetch(`${API_BASE_URL}/api/search/prefetch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload),
+            }).catch(() => {}); // Best effort: generation searches again if this fails
+        }, 800);
+        return () => clearTimeout(timer);
+    }, [topic, subjects]);
+
     const handleGenerateClick = async () => {
         setIsLoading(true);
         setError('');
         setGeneratedPosts([]);
+        setStreamingDrafts({});
+        setDuplicates([]);
         setCopiedIndex(null);
         setSavingDraftIndex(null); // Reset saving state
         setSaveDraftStatus({}); // Reset draft statuses
@@ -80,23 +101,73 @@ function PostGenerator() {
                 payload.subjects_or_angles = subjects.split('\n').map(s => s.trim()).filter(s => s);
             }
 
-            const response = await fetch(`${API_BASE_URL}/api/generate-post`, {
+            // Use the streaming endpoint so drafts render as they are written
+            const response = await fetch(`${API_BASE_URL}/api/generate-post/stream`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
                 },
                 body: JSON.stringify(payload),
             });
 
-            const data = await response.json();
-
             if (!response.ok) {
+                // Validation errors are returned as plain JSON before the stream starts
+                const data = await response.json();
                 throw new Error(data.error || `HTTP error! status: ${response.status}`);
             }
 
-            // Set the received posts (expected to be an array)
-            setGeneratedPosts(data.generated_posts || []);
-            if (!data.generated_posts || data.generated_posts.length === 0) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finalPosts = null;
+
+            // Handle one parsed Server-Sent Event from the backend
+            const handleEvent = (event, data) => {
+                if (event === 'delta') {
+                    setStreamingDrafts(prev => ({ ...prev, [data.angle_index]: (prev[data.angle_index] || '') + data.text }));
+                } else if (event === 'draft') {
+                    setStreamingDrafts(prev => ({ ...prev, [data.angle_index]: data.draft }));
+                } else if (event === 'draft_duplicate' && !data.replaced) {
+                    // Kept: no other angle was left to replace it
+                    setDuplicates(prev => [...prev, { angle: data.angle, replaced: false }]);
+                } else if (event === 'angle_failed' || event === 'draft_duplicate') {
+                    if (event === 'draft_duplicate') setDuplicates(prev => [...prev, { angle: data.angle, replaced: true }]);
+                    setStreamingDrafts(prev => {
+                        const next = { ...prev };
+                        delete next[data.angle_index];
+                        return next;
+                    });
+                } else if (event === 'done') {
+                    finalPosts = data.generated_posts || [];
+                } else if (event === 'error') {
+                    throw new Error(data.error || 'Failed to generate post.');
+                }
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                // Events are separated by a blank line
+                let separatorIndex;
+                while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, separatorIndex);
+                    buffer = buffer.slice(separatorIndex + 2);
+                    let event = 'message';
+                    let dataLine = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) dataLine += line.slice(6);
+                    });
+                    if (dataLine) handleEvent(event, JSON.parse(dataLine));
+                }
+            }
+
+            // Set the final posts (expected to be an array, in angle order)
+            setStreamingDrafts({});
+            setGeneratedPosts(finalPosts || []);
+            if (!finalPosts || finalPosts.length === 0) {
                 setError("The AI didn't generate any post drafts. Try adjusting your inputs.");
             }
 
@@ -104,6 +175,7 @@ function PostGenerator() {
             console.error("Generate Post Error:", err);
             setError(err.message || 'Failed to generate post. Please check the backend connection and try again.');
         } finally {
+            setStreamingDrafts({});
             setIsLoading(false);
         }
     };
@@ -244,6 +316,31 @@ function PostGenerator() {
 
             {error && <p className="error">{error}</p>}
 
+            {/* Drafts the backend found too close to another draft (replaced, or kept when no angle was left) */}
+            {[true, false].map(replaced => {
+                const angles = duplicates.filter(d => d.replaced === replaced).map(d => `"${d.angle}"`);
+                if (angles.length === 0) return null;
+                const drafts = angles.length === 1 ? 'a draft' : `${angles.length} drafts`;
+                return (
+                    <p key={String(replaced)} className="notice">
+                        {replaced ? `Replaced ${drafts} too similar to another one` : `Kept ${drafts} very similar to another one (no other angle left)`}
+                        {' '}({angles.join(', ')}).
+                    </p>
+                );
+            })}
+
+            {/* Drafts still being written (streamed from the backend) */}
+            {generatedPosts.length === 0 && Object.keys(streamingDrafts).length > 0 && (
+                <div className="generated-posts">
+                    <h3>Generating Drafts...</h3>
+                    {Object.keys(streamingDrafts).sort((a, b) => a - b).map((angleIndex) => (
+                        <div key={angleIndex} className="post-draft">
+                            <pre>{streamingDrafts[angleIndex]}</pre>
+                        </div>
+                    ))}
+                </div>
+            )}
+
             {generatedPosts.length > 0 && (
                 <div className="generated-posts">
                     <h3>Generated Drafts:</h3>
@@ -7,32 +7,69 @@ function SavedDrafts() {
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState('');
     const [deletingId, setDeletingId] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null); // Cursor for the next page, null when done
+    const [fullTexts, setFullTexts] = useState({}); // Full draft text keyed by id, loaded on demand
+    const [expandingId, setExpandingId] = useState(null);
+    const [searchInput, setSearchInput] = useState('');
+    const [searchQuery, setSearchQuery] = useState(''); // Submitted search, '' lists all drafts
 
-    // Fetch drafts function
-    const fetchDrafts = useCallback(async () => {
+    // Fetch drafts function (first page, or the next page when a cursor is given).
+    // Searches run on the server (ranked by relevance), so only matching pages are downloaded.
+    const fetchDrafts = useCallback(async (cursor = null) => {
         setIsLoading(true);
         setError('');
         try {
-            const response = await fetch(`${API_BASE_URL}/api/drafts`);
+            const params = new URLSearchParams();
+            if (searchQuery) params.set('q', searchQuery);
+            if (cursor) params.set('after', cursor);
+            const path = searchQuery ? '/api/drafts/search' : '/api/drafts';
+            const query = params.toString();
+            const url = `${API_BASE_URL}${path}${query ? `?${query}` : ''}`;
+            const response = await fetch(url);
             if (!response.ok) {
                 const errorData = await response.json();
                 throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
             }
             const data = await response.json();
-            setDrafts(data);
+            setDrafts(prevDrafts => cursor ? [...prevDrafts, ...data.drafts] : data.drafts);
+            setNextCursor(data.next_cursor);
         } catch (err) {
             console.error("Fetch Drafts Error:", err);
             setError(err.message || 'Failed to fetch saved drafts.');
         } finally {
             setIsLoading(false);
         }
-    }, []);
+    }, [searchQuery]);
 
-    // Fetch on mount
+    // Fetch on mount and whenever the search changes
     useEffect(() => {
         fetchDrafts();
     }, [fetchDrafts]);
 
+    const handleSearch = (event) => {
+        event.preventDefault();
+        setSearchQuery(searchInput.trim());
+    };
+
+    // Load the full text of a truncated draft
+    const handleShowFull = async (draftId) => {
+        setExpandingId(draftId);
+        setError('');
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/drafts/${draftId}`);
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || `HTTP error! status: ${response.status}`);
+            }
+            setFullTexts(prev => ({ ...prev, [draftId]: data.draft_text }));
+        } catch (err) {
+            console.error("Fetch Draft Error:", err);
+            setError(err.message || 'Failed to load the full draft.');
+        } finally {
+            setExpandingId(null);
+        }
+    };
+
     // Handle delete click
     const handleDelete = async (draftId) => {
         if (!window.confirm(`Are you sure you want to delete this draft?`)) {
@@ -72,11 +109,23 @@ function SavedDrafts() {
             <h2>Saved Drafts</h2>
             <p>Manage your saved post drafts here.</p>
 
-            {isLoading && <p>Loading drafts...</p>}
+            <form onSubmit={handleSearch} className="drafts-search">
+                <input
+                    type="search"
+                    value={searchInput}
+                    onChange={(e) => setSearchInput(e.target.value)}
+                    placeholder="Search drafts by text or topic"
+                />
+                <button type="submit" className="button-secondary">Search</button>
+            </form>
+
+            {isLoading && drafts.length === 0 && <p>Loading drafts...</p>}
             {error && <p className="error">{error}</p>}
 
             {!isLoading && drafts.length === 0 && (
-                <p><i>No drafts saved yet. Generate some posts and click 'Save Draft'!</i></p>
+                <p><i>{searchQuery
+                    ? 'No drafts match your search.'
+                    : "No drafts saved yet. Generate some posts and click 'Save Draft'!"}</i></p>
             )}
 
             {drafts.length > 0 && (
@@ -85,7 +134,9 @@ function SavedDrafts() {
                         <li key={draft._id}>
                             <div className="draft-content">
                                 <p className="draft-topic">Topic: {draft.topic || 'N/A'}</p>
-                                <pre className="draft-text-preview">{draft.draft_text}</pre>
+                                <pre className="draft-text-preview">
+                                    {fullTexts[draft._id] || (draft.is_truncated ? `${draft.draft_preview}…` : draft.draft_preview)}
+                                </pre>
                                 <p className="draft-date">Saved: {formatDate(draft.created_at)}</p>
                             </div>
                             <div className="draft-actions-list">
@@ -96,12 +147,27 @@ function SavedDrafts() {
                                 >
                                     {deletingId === draft._id ? 'Deleting...' : 'Delete'}
                                 </button>
+                                {draft.is_truncated && !fullTexts[draft._id] && (
+                                    <button
+                                        onClick={() => handleShowFull(draft._id)}
+                                        disabled={expandingId === draft._id}
+                                        className="button-secondary"
+                                    >
+                                        {expandingId === draft._id ? 'Loading...' : 'Show Full'}
+                                    </button>
+                                )}
                                 {/* TODO: Add Edit/Copy functionality here? */}
                             </div>
                         </li>
                     ))}
                 </ul>
             )}
+
+            {nextCursor && (
+                <button onClick={() => fetchDrafts(nextCursor)} disabled={isLoading} className="button-secondary">
+                    {isLoading ? 'Loading...' : 'Load More'}
+                </button>
+            )}
         </div>
     );
 }
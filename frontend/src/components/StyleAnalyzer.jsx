@@ -66,12 +66,12 @@ function StyleAnalyzer() {
     return (
         <div className="style-analyzer card">
             <h2>1. Analyze & Save Your Writing Style</h2>
-            <p>Paste 3-10 of your recent LinkedIn posts below. The AI will analyze them and automatically save the style profile with a suggested name.</p>
+            <p>Paste 3-10 of your recent LinkedIn posts below, with a line containing only <code>---</code> between posts. The AI will analyze them and automatically save the style profile with a suggested name.</p>
             <textarea
                 rows="10" // Reduced rows slightly
                 value={postsText}
                 onChange={(e) => setPostsText(e.target.value)}
-                placeholder="Paste your LinkedIn post content here..."
+                placeholder={"First post...\n---\nSecond post...\n---\nThird post..."}
                 aria-label="Paste LinkedIn posts here"
             />
             <br />
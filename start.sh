@@ -2,6 +2,7 @@
 
 # Simple script to start both backend and frontend development servers.
 # Run this script from the root of the linkedin_project directory.
+# Pass --prod to serve the backend with gunicorn (backend/gunicorn.conf.py) instead of the Flask dev server.
 
 # --- Prerequisites ---
 # Make sure you have:
@@ -31,10 +32,17 @@ if [ ! -f backend/.env ]; then
 fi
 
 
-echo "Starting backend server (Flask on port 5001)..."
 cd backend
-# Explicitly use the Python interpreter from the virtual environment (relative to current dir)
-./venv/bin/python -m flask --app app run --port 5001 &
+if [ "$1" = "--prod" ]; then
+    echo "Starting backend server (gunicorn on port 5001)..."
+    # SIGTERM (sent by the trap below) drains in-flight requests and background jobs before exiting
+    PORT=5001 ./venv/bin/gunicorn -c gunicorn.conf.py wsgi:app &
+else
+    echo "Starting backend server (Flask on port 5001)..."
+    # Explicitly use the Python interpreter from the virtual environment (relative to current dir).
+    # The factory creates indexes and starts the job workers (resuming interrupted jobs), as gunicorn does.
+    ./venv/bin/python -m flask --app 'app:create_app(start_services=True)' run --port 5001 &
+fi
 BACKEND_PID=$!
 cd ..
 